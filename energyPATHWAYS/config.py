@@ -29,10 +29,18 @@ weibul_coeff_of_var = None
 con = None
 cur = None
 
+# schema catalog of the public tables, loaded once per database by init_schema
+schema_database = None
+table_columns = None
+table_datatypes = None
+table_primary_keys = None
+table_foreign_keys = None
+
 # pickle names
 full_model_append_name = '_full_model.p'
 demand_model_append_name = '_demand_model.p'
 model_error_append_name = '_model_error.p'
+supply_checkpoint_append_name = '_supply_checkpoint.p'
 
 # common data inputs
 index_levels = None
@@ -90,6 +98,7 @@ output_combined_levels = None
 outputs_id_map = defaultdict(dict)
 dispatch_write_years = None
 timestamp = None
+output_writer = None
 
 # parallel processing
 available_cpus = None
@@ -178,6 +187,12 @@ def init_cfgfile(cfgfile_path):
     cfgfile.set('case', 'years', years)
     cfgfile.set('case', 'supply_years', supply_years)
 
+def get_optional(section, option, default=None):
+    """returns the value of a config file option, or default if the option is missing or blank (older config files)"""
+    if cfgfile.has_option(section, option) and cfgfile.get(section, option) != '':
+        return cfgfile.get(section, option)
+    return default
+
 def init_db():
     global con, cur, dnmtr_col_names, drivr_col_names
     pg_host = cfgfile.get('database', 'pg_host')
@@ -195,6 +210,37 @@ def init_db():
     con = psycopg2.connect(conn_str)
     cur = con.cursor()
     logging.debug("Connection successful...")
+    if schema_database != pg_database:
+        init_schema(pg_database)
+
+def init_schema(database):
+    """reads column names, datatypes and primary and foreign keys of every public table from INFORMATION_SCHEMA"""
+    global schema_database, table_columns, table_datatypes, table_primary_keys, table_foreign_keys
+    table_columns, table_datatypes = defaultdict(list), defaultdict(dict)
+    table_primary_keys, table_foreign_keys = defaultdict(list), defaultdict(dict)
+    cur.execute("""
+        SELECT table_name, column_name, data_type FROM information_schema.columns
+        WHERE table_schema = 'public' ORDER BY table_name, ordinal_position
+    """)
+    for table_name, column_name, data_type in cur.fetchall():
+        table_columns[table_name].append(column_name)
+        table_datatypes[table_name][column_name] = data_type
+    cur.execute("""
+        SELECT tc.table_name, kcu.column_name, tc.constraint_type, ccu.table_name, ccu.column_name
+        FROM information_schema.table_constraints tc
+        JOIN information_schema.key_column_usage kcu
+            ON tc.constraint_name = kcu.constraint_name AND tc.table_schema = kcu.table_schema
+        JOIN information_schema.constraint_column_usage ccu
+            ON tc.constraint_name = ccu.constraint_name AND tc.table_schema = ccu.table_schema
+        WHERE tc.table_schema = 'public' AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+        ORDER BY tc.table_name, kcu.ordinal_position
+    """)
+    for table_name, column_name, constraint_type, ref_table, ref_column in cur.fetchall():
+        if constraint_type == 'PRIMARY KEY':
+            table_primary_keys[table_name].append(column_name)
+        else:
+            table_foreign_keys[table_name][column_name] = (ref_table, ref_column)
+    schema_database = database
     
 
 def init_units():
@@ -211,6 +257,10 @@ def init_units():
             logging.debug('pint already has unit {}, unit is not being redefined'.format(unit_name))
             continue
         ureg.define(unit_def)
+    
+    util.clear_unit_conversion_memo()
+    if get_optional('opt', 'precompute_unit_conversions', 'false').lower() == 'true':
+        util.precompute_unit_conversion_factors(util.sql_read_database_units() | set([calculation_energy_unit]))
         
 def init_geo():
     #Geography conversions
@@ -337,11 +387,13 @@ def init_outputs_id_map():
         outputs_id_map[name] = util.upper_dict(util.sql_read_table('OtherIndexesData', ['id', 'name'], other_index_id=id, return_unique=True))
 
 def init_output_parameters():
-    global currency_name, output_currency, output_tco, output_payback, evolved_run, evolved_blend_nodes, evolved_years
+    global currency_name, output_currency, output_tco, output_payback, evolved_run, evolved_blend_nodes, evolved_years, output_writer
     currency_name = cfgfile.get('case', 'currency_name')
     output_currency = cfgfile.get('case', 'currency_year_id') + ' ' + currency_name
     output_tco = cfgfile.get('output_detail', 'output_tco').lower()
     output_payback = cfgfile.get('output_detail', 'output_payback').lower()
+    # 'append' writes every result to one csv per output, 'partitioned' writes a chunk per scenario and process
+    output_writer = get_optional('output_detail', 'output_writer', 'append').lower()
     evolved_run = cfgfile.get('evolved','evolved_run').lower()
     evolved_years = [int(x) for x in util.ensure_iterable_and_not_string(cfgfile.get('evolved','evolved_years'))]
     evolved_blend_nodes =  [int(g) for g in cfgfile.get('evolved','evolved_blend_nodes').split(',') if len(g)]
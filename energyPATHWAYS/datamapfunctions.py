@@ -18,6 +18,10 @@ import re
 
 
 class DataMapFunctions:
+    # data tables are read once in full and served from memory (see util.sql_read_grouped_table). Subclasses with
+    # very large data tables, which are only read for a few parents, turn this off
+    prefetch_data = True
+
     @staticmethod
     def _other_indexes_dict():
         this_method = DataMapFunctions._other_indexes_dict
@@ -61,7 +65,7 @@ class DataMapFunctions:
                 filters['sensitivity'] = self.scenario.get_sensitivity(self.sql_data_table, self.id)
 
         # read each line of the data_table matching an id and assign the value to self.raw_values
-        read_data = util.sql_read_table(self.sql_data_table, return_iterable=True, **filters)
+        read_data = self._read_data_rows(headers, filters)
         self.inspect_index_levels(headers, read_data)
         self._validate_other_indexes(headers, read_data)
 
@@ -107,6 +111,20 @@ class DataMapFunctions:
                         # Any other missing data is likely to be a real problem so we complain
                         logging.critical(msg)
 
+    def _read_data_rows(self, headers, filters):
+        """returns the rows of the data table matching filters as tuples in the order of headers"""
+        if not self.prefetch_data or self.data_id_key not in headers:
+            return util.sql_read_table(self.sql_data_table, return_iterable=True, **filters)
+        group = util.sql_read_grouped_table(self.sql_data_table, self.data_id_key)[1].get(filters[self.data_id_key])
+        if group is None:
+            return []
+        # same filtering as the sql query, where a filter of None selects NULL values
+        mask = np.ones(len(group), dtype=bool)
+        for col, value in filters.items():
+            if col != self.data_id_key:
+                mask &= group[col].isnull().values if value is None else (group[col].values == value)
+        return [tuple(row) for row in group.values[mask]]
+
     def _validate_other_indexes(self, headers, read_data):
         """
         This method checks the following for both other_index_1 and other_index_2:
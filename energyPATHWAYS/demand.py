@@ -6,16 +6,17 @@ import util
 from datamapfunctions import DataMapFunctions
 import numpy as np
 import pandas as pd
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import copy
 from datetime import datetime
 from demand_subsector_classes import DemandStock, SubDemand, ServiceEfficiency, ServiceLink
 from shared_classes import AggregateStock
 from demand_measures import ServiceDemandMeasure, EnergyEfficiencyMeasure, FuelSwitchingMeasure, FlexibleLoadMeasure, FlexibleLoadMeasure2
 from demand_technologies import DemandTechnology, SalesShare
-from rollover import Rollover
+from rollover import Rollover, run_rollovers
 from util import DfOper
 from outputs import Output
+from geomapper import GeoMapper
 import dispatch_classes
 import energyPATHWAYS.helper_multiprocess as helper_multiprocess
 import pdb
@@ -134,8 +135,13 @@ class Demand(object):
             return df
         geography_map_key = cfg.cfgfile.get('case', 'default_geography_map_key')
         # create dataframe with map from one geography to another
-        map_df = cfg.geo.map_df(cfg.primary_geography,cfg.dispatch_geography, normalize_as='total', map_key=geography_map_key)
         levels = ['timeshift_type', cfg.dispatch_geography, 'dispatch_feeder', 'weather_datetime']
+        map_matrix = cfg.geo.map_matrix(cfg.primary_geography, cfg.dispatch_geography, normalize_as='total', map_key=geography_map_key)
+        if map_matrix is not None and len(df.columns)==1:
+            # hourly shapes are large, so they are remapped with the sparse map rather than a DfOper merge
+            mapped = GeoMapper.map_with_matrix(df, map_matrix, cfg.primary_geography, cfg.dispatch_geography)
+            return mapped.groupby(level=levels).sum()
+        map_df = cfg.geo.map_df(cfg.primary_geography,cfg.dispatch_geography, normalize_as='total', map_key=geography_map_key)
         return util.DfOper.mult([df, map_df]).groupby(level=levels).sum()
 
     def aggregate_electricity_shapes(self, year, geomap_to_dispatch_geography=True, reconciliation_step=False):
@@ -2869,6 +2875,8 @@ class Subsector(DataMapFunctions):
         rollover_groups = self.stock.total.groupby(level=self.stock.rollover_group_names).groups
         if self.stock.is_service_demand_dependent and self.stock.demand_stock_unit_type == 'equipment':
             self.tech_sd_modifier_calc()
+        lifetimes = np.array([self.technologies[tech_id].book_life for tech_id in self.tech_ids])
+        rollovers = OrderedDict()
         for elements in rollover_groups.keys():
             elements = util.ensure_tuple(elements)
             #returns sales share and a flag as to whether the sales share can be used to parameterize initial stock. 
@@ -2891,18 +2899,20 @@ class Subsector(DataMapFunctions):
             if cfg.evolved_run=='true':
                 sales_share[len(self.years) -len(cfg.supply_years):] = 1/float(len(self.tech_ids))
             annual_stock_change = util.df_slice(self.stock.annual_stock_changes, elements, self.stock.rollover_group_names)
-            self.rollover = Rollover(vintaged_markov_matrix=self.stock.vintaged_markov_matrix,
+            rollovers[elements] = Rollover(vintaged_markov_matrix=self.stock.vintaged_markov_matrix,
                                          initial_markov_matrix=self.stock.initial_markov_matrix,
                                          num_years=len(self.years), num_vintages=len(self.vintages),
                                          num_techs=len(self.tech_ids), initial_stock=initial_stock,
                                          sales_share=sales_share, stock_changes=annual_stock_change.values,
                                          specified_stock=demand_technology_stock.values, specified_retirements=None,
-                                         steps_per_year=self.stock.spy,lifetimes=np.array([self.technologies[tech_id].book_life for tech_id in self.tech_ids]))
+                                         steps_per_year=self.stock.spy,lifetimes=lifetimes)
 
-            try:               
-                self.rollover.run()
-            except:
-                pdb.set_trace()
+        # rollover groups without specified stocks are run together
+        try:
+            run_rollovers(rollovers.values())
+        except:
+            pdb.set_trace()
+        for elements, self.rollover in rollovers.items():
             stock, stock_new, stock_replacement, retirements, retirements_natural, retirements_early, sales_record, sales_new, sales_replacement = self.rollover.return_formatted_outputs()
             self.stock.values.loc[elements], self.stock.values_new.loc[elements], self.stock.values_replacement.loc[elements] = stock, stock_new, stock_replacement
             self.stock.retirements.loc[elements, 'value'], self.stock.retirements_natural.loc[elements, 'value'], \
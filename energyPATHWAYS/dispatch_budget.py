@@ -1,7 +1,6 @@
 
 import util
 import numpy as np 
-from scipy import optimize
 import logging
 import pdb 
 
@@ -30,14 +29,84 @@ def dispatch_shape(load, load_cutoff, dct, pmin=0, pmax=None):
     return dispatch * -dct  # always positive
 
 
+def sum_above(values, groups, queries, query_groups, num_groups):
+    """
+    For each query, the sum of (value - query) over the values in the query's group that are greater than the query.
+    Groups are integers from zero, and all groups are handled together with one sort of the values and queries.
+    """
+    is_value = np.concatenate((np.ones(len(values), dtype=bool), np.zeros(len(queries), dtype=bool)))
+    keys = np.concatenate((values, queries))
+    key_groups = np.concatenate((groups, query_groups))
+    # values equal to a query sort before it, so they don't count as greater
+    order = np.lexsort((~is_value, keys, key_groups))
+    count_through = np.cumsum(is_value[order])
+    sum_through = np.cumsum(np.where(is_value[order], keys[order], 0))
+    group_counts = np.cumsum(np.bincount(groups, minlength=num_groups))
+    group_sums = np.cumsum(np.bincount(groups, weights=values, minlength=num_groups))
+    query_positions = np.empty(len(keys), dtype=int)
+    query_positions[order] = np.arange(len(keys))
+    query_positions = query_positions[len(values):]
+    count_above = group_counts[query_groups] - count_through[query_positions]
+    sum_above = group_sums[query_groups] - sum_through[query_positions]
+    with np.errstate(invalid='ignore'):
+        return np.where(count_above > 0, sum_above - queries * count_above, 0)
+
+
+def solve_for_load_cutoffs(load, groups, energy_budgets, pmins, pmaxs):
+    """
+    Solves residual_energy(load_cutoff) = 0 for every dispatch group at once, without iterating.
+
+    With y = dct * load and c = dct * load_cutoff + pmin, the energy dispatched in a group is
+    sum(clip(y - c, 0, pmax - pmin)) + len(load) * pmin, which is piecewise linear and decreasing in c with
+    breakpoints at y and y - (pmax - pmin). It is evaluated at every breakpoint and c is interpolated on the
+    segment where it crosses the energy budget.
+
+    Args:
+        load: load for every hour (ndarray)
+        groups: dispatch group of every hour, numbered from zero (ndarray)
+        energy_budgets, pmins, pmaxs: one for each group (ndarray), pmaxs can be inf
+
+    Returns:
+        load_cutoffs: (ndarray) one for each group
+    """
+    num_groups = len(energy_budgets)
+    dct = np.where(energy_budgets > 0, 1., -1.)
+    widths = pmaxs - pmins
+    lengths = np.bincount(groups, minlength=num_groups)
+    targets = dct * energy_budgets - lengths * pmins
+    y = dct[groups] * load
+    # below the lowest y, the dispatched energy rises by len(load) for each unit that c falls
+    lowest = np.empty(num_groups)
+    lowest.fill(np.inf)
+    np.minimum.at(lowest, groups, y)
+    lowest -= targets / lengths + 1
+    breakpoints = np.concatenate((y, np.where(np.isfinite(widths[groups]), y - widths[groups], y), lowest))
+    breakpoint_groups = np.concatenate((groups, groups, np.arange(num_groups)))
+    # energy(c) is the energy above c less the energy above c + pmax - pmin
+    queries = np.concatenate((breakpoints, breakpoints + widths[breakpoint_groups]))
+    query_groups = np.concatenate((breakpoint_groups, breakpoint_groups))
+    above = sum_above(y, groups, queries, query_groups, num_groups)
+    energy = above[:len(breakpoints)] - above[len(breakpoints):]
+    # energy falls as c rises, so the crossing is after the breakpoints with more energy than the target
+    order = np.lexsort((breakpoints, breakpoint_groups))
+    breakpoints, breakpoint_groups, energy = breakpoints[order], breakpoint_groups[order], energy[order]
+    counts = np.bincount(breakpoint_groups, minlength=num_groups)
+    starts = np.cumsum(counts) - counts
+    over = np.bincount(breakpoint_groups, weights=energy > targets[breakpoint_groups], minlength=num_groups).astype(int)
+    after = starts + over
+    before = np.maximum(after - 1, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = np.where(energy[before] > energy[after],
+                     breakpoints[before] + (energy[before] - targets) * (breakpoints[after] - breakpoints[before]) / (energy[before] - energy[after]),
+                     breakpoints[after])
+    return dct * (c - pmins)
+
+
 def solve_for_load_cutoff(load, energy_budget, pmin=0, pmax=None):
-    lowest = min(load) - pmax - 1
-    highest = max(load) + pmax + 1
-    if lowest == highest:
-        return lowest
-    else:
-        load_cutoff = optimize.bisect(residual_energy, lowest, highest, args=(load, energy_budget, pmin, pmax))
-        return load_cutoff
+    load = np.asarray(load, dtype=float)
+    pmax = np.inf if pmax is None else pmax
+    return solve_for_load_cutoffs(load, np.zeros(len(load), dtype=int), np.array([energy_budget], dtype=float),
+                                  np.array([pmin], dtype=float), np.array([pmax], dtype=float))[0]
 
 
 def solve_for_dispatch_shape(load, energy_budget, pmin=0, pmax=None):
@@ -103,6 +172,30 @@ def dispatch_to_energy_budget(load, energy_budgets, dispatch_periods=None, pmins
         else:
             raise ValueError('Number of pmax values must match the number of dispatch periods')
 
-    # call solve for dispatch on each group and concatenate
-    return np.concatenate([solve_for_dispatch_shape(load_group, energy_budget, pmin, pmax)
-                           for load_group, energy_budget, pmin, pmax in zip(load_groups, energy_budgets, pmins, pmaxs)])
\ No newline at end of file
+    lengths = np.array([len(load_group) for load_group in load_groups])
+    groups = np.repeat(np.arange(len(load_groups)), lengths)
+    load = np.asarray(load, dtype=float)
+    energy_budgets = np.array(energy_budgets, dtype=float)
+    pmins = np.array(pmins, dtype=float)
+    pmaxs = np.array([np.inf if pmax is None else pmax for pmax in pmaxs], dtype=float)
+
+    # groups where the budget can't be met within pmin and pmax are dispatched flat, as in solve_for_dispatch_shape
+    pmin_too_large = np.abs(energy_budgets) < pmins * lengths
+    pmax_too_small = ~pmin_too_large & (np.abs(energy_budgets) > pmaxs * lengths)
+    if pmin_too_large.any():
+        logging.debug('During dispatch to energy budget, the pmin is too large for the given energy budget')
+    if pmax_too_small.any():
+        logging.debug('During dispatch to energy budget, the pmax is too small for the given energy budget')
+    dispatch = np.where(pmin_too_large, energy_budgets / lengths, pmaxs)[groups]
+
+    # the cutoffs for all other groups are solved together
+    solved = ~(pmin_too_large | pmax_too_small)
+    if solved.any():
+        hours = solved[groups]
+        solved_groups = (np.cumsum(solved) - 1)[groups[hours]]
+        load_cutoffs = solve_for_load_cutoffs(load[hours], solved_groups, energy_budgets[solved], pmins[solved], pmaxs[solved])
+        # dispatch_shape for every group
+        dct = np.where(energy_budgets[solved] > 0, 1., -1.)
+        c = (dct * load_cutoffs + pmins[solved])[solved_groups]
+        dispatch[hours] = pmins[solved][solved_groups] + np.clip(dct[solved_groups] * load[hours] - c, 0, (pmaxs[solved] - pmins[solved])[solved_groups])
+    return dispatch
\ No newline at end of file
@@ -12,6 +12,9 @@ import pandas as pd
 import math
 import config as cfg
 import os
+import shutil
+import tempfile
+import itertools
 from pyomo.opt import SolverFactory, SolverStatus
 import csv
 import logging
@@ -47,23 +50,36 @@ class DispatchNodeConfig(DataMapFunctions):
         for col, att in util.object_att_from_table(self.sql_id_table, id, primary_key='supply_node_id'):
             setattr(self, col, att)
 
-def all_results_to_list(instance):
-    return {'Charge':storage_result_to_list(instance.Charge),
-            'Transmission_Flows':storage_result_to_list(instance.Transmit_Power),
-            'Storage_Provide_Power': storage_result_to_list(instance.Storage_Provide_Power),
-            'Generator_Provide_Power': storage_result_to_list(instance.Generation_Provide_Power),
-            'LD_Provide_Power':storage_result_to_list(instance.LD_Provide_Power),
-            'Flexible_Load':flexible_load_result_to_list(instance.Flexible_Load)}
+# persistent dispatch model instances, keyed by dispatch geography and period length (see Dispatch.dispatch_model)
+_dispatch_models = {}
 
-def storage_result_to_list(charge_or_discharge):
+def clear_dispatch_models():
+    _dispatch_models.clear()
+
+# the dispatch most recently loaded by this process from shared inputs (see Dispatch.load_shared_inputs)
+_shared_dispatch = {}
+
+def warm_start_kwargs(solver):
+    """solvers that support it start from the values left in the instance by the previous solve"""
+    return {'warmstart': True} if solver.warm_start_capable() else {}
+
+def all_results_to_list(instance, hour_offset=0):
+    return {'Charge':storage_result_to_list(instance.Charge, hour_offset),
+            'Transmission_Flows':storage_result_to_list(instance.Transmit_Power, hour_offset),
+            'Storage_Provide_Power': storage_result_to_list(instance.Storage_Provide_Power, hour_offset),
+            'Generator_Provide_Power': storage_result_to_list(instance.Generation_Provide_Power, hour_offset),
+            'LD_Provide_Power':storage_result_to_list(instance.LD_Provide_Power, hour_offset),
+            'Flexible_Load':flexible_load_result_to_list(instance.Flexible_Load, hour_offset)}
+
+def storage_result_to_list(charge_or_discharge, hour_offset=0):
     items = charge_or_discharge.iteritems()
-    lists = [[int(i) for i in key[0].replace(')','').replace('(','').split(', ')] + [key[1]] + [value.value] for key, value in items]
+    lists = [[int(i) for i in key[0].replace(')','').replace('(','').split(', ')] + [key[1] + hour_offset] + [value.value] for key, value in items]
     return lists
 
 
-def flexible_load_result_to_list(flexible_load):
+def flexible_load_result_to_list(flexible_load, hour_offset=0):
     items = flexible_load.iteritems()
-    lists = [key + (value.value,) for key, value in items]
+    lists = [(key[0], key[1] + hour_offset) + key[2:] + (value.value,) for key, value in items]
     return lists
     
 
@@ -73,6 +89,46 @@ def ld_result_to_list(provide_power):
     return ld_list
 
 
+class PeriodHourlyValues(object):
+    """
+    Memory-mapped stand-in for an hourly dispatch input indexed [period][(geography, hour)] or, with feeders,
+    [period][(geography, hour, feeder)], so that processes solving periods in parallel share one copy of the data.
+    """
+    def __init__(self, path, dispatch_geographies, period_timepoints, feeders=None):
+        self.path = path
+        self.dispatch_geographies = dispatch_geographies
+        self.period_timepoints = period_timepoints
+        self.feeders = feeders
+
+    @classmethod
+    def save(cls, path, dictionary, dispatch_geographies, period_timepoints, feeders=None):
+        """writes the values of a period dictionary to an array by geography, hour and feeder; missing keys are NaN"""
+        num_hours = max(timepoints[-1] for timepoints in period_timepoints.values()) + 1
+        shape = (len(dispatch_geographies), num_hours) + ((len(feeders),) if feeders is not None else ())
+        values = np.empty(shape)
+        values.fill(np.nan)
+        geography_positions = dict((geography, i) for i, geography in enumerate(dispatch_geographies))
+        feeder_positions = dict((feeder, i) for i, feeder in enumerate(feeders or []))
+        for period_values in dictionary.values():
+            keys = period_values.keys()
+            positions = ([geography_positions[key[0]] for key in keys], [key[1] for key in keys])
+            if feeders is not None:
+                positions += ([feeder_positions[key[2]] for key in keys],)
+            values[positions] = period_values.values()
+        np.save(path, values)
+        return cls(path, dispatch_geographies, period_timepoints, feeders)
+
+    def __getitem__(self, period):
+        # the map is only held while the period is read, so that nothing keeps the file open after the dispatch
+        # (open files can't be removed on Windows)
+        hours = self.period_timepoints[period]
+        mapped = np.load(self.path, mmap_mode='r')
+        values = np.array(mapped[:, hours[0]:hours[-1] + 1]).ravel()
+        del mapped
+        levels = (self.dispatch_geographies, hours) if self.feeders is None else (self.dispatch_geographies, hours, self.feeders)
+        return dict((key, value) for key, value, present in zip(itertools.product(*levels), values.tolist(), ~np.isnan(values)) if present)
+
+
 class DispatchSuper(object):
     def __init__(self, dispatch_feeders, dispatch_geography, dispatch_geographies):
         pass
@@ -104,6 +160,10 @@ class SeriesHourlyDispatch(DispatchSuper):
         pass
 
 class Dispatch(object):
+    # hourly inputs to the period optimization, indexed [period][(geography, hour, feeder)] and [period][(geography, hour)]
+    feeder_hourly_inputs = ('distribution_load', 'distribution_gen', 'cumulative_distribution_load', 'min_cumulative_flex_load', 'max_cumulative_flex_load')
+    bulk_hourly_inputs = ('bulk_load', 'dispatched_bulk_load', 'bulk_gen')
+
     def __init__(self, dispatch_feeders, dispatch_geography, dispatch_geographies, scenario):
         #TODO replace 1 with a config parameter
         for col, att in util.object_att_from_table('DispatchConfig', 1):
@@ -379,7 +439,8 @@ class Dispatch(object):
         FORs = np.array(util.df_slice(thermal_dispatch_df,['forced_outage_rate',geography],['IO',self.dispatch_geography]).values).T[0]
         must_run = np.array(util.df_slice(thermal_dispatch_df,['must_run',geography],['IO',self.dispatch_geography]).values).T[0]
         clustered_dict = dispatch_generators.cluster_generators(n_clusters = int(cfg.cfgfile.get('opt','generator_steps')), pmax=pmax, marginal_cost=marginal_cost, FORs=FORs,
-                                                                MORs=MORs, must_run=must_run, pad_stack=False, zero_mc_4_must_run=True)
+                                                                MORs=MORs, must_run=must_run, pad_stack=False, zero_mc_4_must_run=True, fleet=geography,
+                                                                incremental=cfg.get_optional('opt', 'incremental_generator_clustering', 'false').lower() == 'true')
         generator_numbers = range(len(clustered_dict['derated_pmax']))
         for number in generator_numbers:
             generator = str(((max(generator_numbers)+1)* (self.dispatch_geographies.index(geography))) + (number)+1)
@@ -422,6 +483,36 @@ class Dispatch(object):
         with open(os.path.join(cfg.workingdir, 'dispatch_class.p'), 'wb') as outfile:
             pickle.dump(self, outfile, pickle.HIGHEST_PROTOCOL)
 
+    def write_shared_inputs(self, path):
+        """
+        Writes the hourly inputs to memory-mapped arrays and everything else the period optimization needs to one pickle,
+        which each parallel worker loads once rather than being sent the dispatch with every period.
+        """
+        shared = copy.copy(self)
+        saved = {}
+        for name in self.feeder_hourly_inputs + self.bulk_hourly_inputs:
+            dictionary = getattr(self, name)
+            # the cumulative flex load bounds are often the same dictionary as the cumulative load
+            if id(dictionary) not in saved:
+                feeders = self.feeders if name in self.feeder_hourly_inputs else None
+                saved[id(dictionary)] = PeriodHourlyValues.save(os.path.join(path, name + '.npy'), dictionary,
+                                                                self.dispatch_geographies, self.period_timepoints, feeders)
+            setattr(shared, name, saved[id(dictionary)])
+        # inputs to the long duration and allocation optimizations, which have already been solved
+        for name in ('ld_bulk_net_load', 'ld_bulk_net_load_df', 'ld_bulk_net_load_df_updated'):
+            shared.__dict__.pop(name, None)
+        with open(os.path.join(path, 'dispatch.p'), 'wb') as outfile:
+            pickle.dump(shared, outfile, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load_shared_inputs(path):
+        """loads a dispatch written by write_shared_inputs, once per process"""
+        if path not in _shared_dispatch:
+            _shared_dispatch.clear()
+            with open(os.path.join(path, 'dispatch.p'), 'rb') as infile:
+                _shared_dispatch[path] = pickle.load(infile)
+        return _shared_dispatch[path]
+
     @staticmethod
     def load_from_pickle():
         with open(os.path.join(cfg.workingdir, 'dispatch_class.p'), 'rb') as infile:
@@ -527,13 +618,45 @@ class Dispatch(object):
         return storage_df, flex_load_df, ld_df, transmission_flow_df, generator_df
 
 
+    def dispatch_structure(self, period):
+        """everything besides param values that shapes the dispatch model, which can be reused while this doesn't change"""
+        return (tuple(self.dispatch_geographies), tuple(self.feeders), tuple(self.storage_technologies),
+                tuple(self.generation_technologies), tuple(self.ld_technologies), tuple(self.transmission.list_transmission_lines),
+                tuple(sorted(self.large_storage.items())), tuple(sorted(self.geography[period].items())),
+                tuple(sorted(self.feeder[period].items())), self.has_flexible_load)
+
+    def dispatch_model(self, period):
+        """
+        Returns the persistent model instance for periods of this period's length, updated with the period's data.
+        The model is only rebuilt when its structure changes.
+        """
+        offset = self.period_timepoints[period][0]
+        key = (self.dispatch_geography, self.period_lengths[period])
+        structure = self.dispatch_structure(period)
+        if key in _dispatch_models and _dispatch_models[key][0] == structure:
+            instance = _dispatch_models[key][1]
+            dispatch_formulation.update_dispatch_model(instance, self, period, offset)
+        else:
+            instance = dispatch_formulation.create_dispatch_model(self, period, model_type='concrete', mutable=True, offset=offset)
+            _dispatch_models[key] = (structure, instance)
+        return instance
+
     def solve_optimization_period(self, period, return_model_instance=False):
-        model = dispatch_formulation.create_dispatch_model(self, period)
-        instance = model.create_instance(report_timing=False) # report_timing=True used to try to make this step faster
+        if return_model_instance:
+            # a standalone instance with the period's own hours, which later periods won't overwrite
+            model = dispatch_formulation.create_dispatch_model(self, period)
+            instance = model.create_instance(report_timing=False) # report_timing=True used to try to make this step faster
+            solver = SolverFactory(cfg.solver_name)
+            solution = solver.solve(instance)
+            instance.solutions.load_from(solution)
+            return instance
+        # nearly every constraint depends on the period's params, so a persistent solver interface would have to
+        # reload the whole model each period anyway; only the pyomo model is reused
+        instance = self.dispatch_model(period)
         solver = SolverFactory(cfg.solver_name)
-        solution = solver.solve(instance)
+        solution = solver.solve(instance, **warm_start_kwargs(solver))
         instance.solutions.load_from(solution)
-        return instance if return_model_instance else all_results_to_list(instance)
+        return all_results_to_list(instance, self.period_timepoints[period][0])
 
     def test_instance_constraints(model):
         instance = model.create_instance(report_timing=False)        
@@ -595,8 +718,14 @@ class Dispatch(object):
                     if self.ld_energy_budgets[period][technology]<= self.min_capacity[period][technology] * self.period_lengths[period]:
                         self.ld_energy_budgets[period][technology]= self.min_capacity[period][technology] * self.period_lengths[period]+1
             if cfg.cfgfile.get('case','parallel_process').lower() == 'true':
-                params = [(dispatch_formulation.create_dispatch_model(self, period), cfg.solver_name) for period in self.periods]
-                results = helper_multiprocess.safe_pool(helper_multiprocess.run_optimization, params)
+                # workers get the hourly inputs from memory-mapped arrays and are only sent a period
+                path = tempfile.mkdtemp(prefix='dispatch_')
+                try:
+                    self.write_shared_inputs(path)
+                    results = helper_multiprocess.safe_pool(helper_multiprocess.run_dispatch_period, [(path, period) for period in self.periods])
+                finally:
+                    # best effort, failing to remove the temporary inputs shouldn't fail the dispatch
+                    shutil.rmtree(path, ignore_errors=True)
             else:
                 results = [self.solve_optimization_period(period) for period in self.periods]
             self.storage_df, self.flex_load_df, self.ld_df, self.transmission_flow_df, self.generator_df  = self.parse_optimization_results(results)
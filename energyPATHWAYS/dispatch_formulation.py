@@ -251,20 +251,76 @@ def max_timepoints(model):
     return total_cost
 
 
-def create_dispatch_model(dispatch, period, model_type='abstract'):
+def shift_hours(dictionary, offset):
+    """shifts the hour, the second element of each key, of an hourly param dictionary back by offset"""
+    if not offset:
+        return dictionary
+    return dict(((key[0], key[1] - offset) + key[2:], value) for key, value in dictionary.iteritems())
+
+def dispatch_param_values(dispatch, period, offset=0):
+    """
+    Values of the dispatch model params that don't change its structure, with hours shifted back by offset.
+    These are the params that are mutable in a persistent dispatch model and are updated for each period.
+    """
+    return {'start_state_of_charge': dispatch.start_soc_large_storage[period] if len(dispatch.start_soc_large_storage) else dispatch.start_soc_large_storage,
+            'end_state_of_charge': dispatch.end_soc_large_storage[period] if len(dispatch.end_soc_large_storage) else dispatch.end_soc_large_storage,
+            'charging_efficiency': dispatch.charging_efficiency,
+            'discharging_efficiency': dispatch.discharging_efficiency,
+            'variable_cost': dispatch.variable_costs,
+            'min_capacity': dispatch.min_capacity[period],
+            'capacity': dispatch.capacity[period],
+            'duration': dispatch.duration[period],
+            'ld_energy': dispatch.ld_energy_budgets[period] if len(dispatch.ld_energy_budgets) else dispatch.ld_energy_budgets,
+            'distribution_load': shift_hours(dispatch.distribution_load[period], offset),
+            'bulk_load': shift_hours(dispatch.bulk_load[period], offset),
+            'dispatched_bulk_load': shift_hours(dispatch.dispatched_bulk_load[period], offset),
+            'distribution_gen': shift_hours(dispatch.distribution_gen[period], offset),
+            'bulk_gen': shift_hours(dispatch.bulk_gen[period], offset),
+            'min_cumulative_flex_load': shift_hours(dispatch.min_cumulative_flex_load[period], offset),
+            'max_cumulative_flex_load': shift_hours(dispatch.max_cumulative_flex_load[period], offset),
+            'cumulative_distribution_load': shift_hours(dispatch.cumulative_distribution_load[period], offset),
+            'max_flex_load': dispatch.max_flex_load[period],
+            'min_flex_load': dispatch.min_flex_load[period],
+            'transmission_capacity': dispatch.transmission.constraints.get_values_as_dict(dispatch.year),
+            'transmission_hurdle': dispatch.transmission.hurdles.get_values_as_dict(dispatch.year),
+            'transmission_losses': dispatch.transmission.losses.get_values_as_dict(dispatch.year),
+            'dist_net_load_threshold': dispatch.dist_net_load_thresholds,
+            'bulk_net_load_threshold': dispatch.bulk_net_load_thresholds,
+            't_and_d_losses': dispatch.t_and_d_losses,
+            'curtailment_cost': dispatch.curtailment_cost,
+            'unserved_capacity_cost': dispatch.unserved_capacity_cost,
+            'unserved_energy_cost': max(dispatch.variable_costs.values())*1.05,
+            'dist_penalty': dispatch.dist_net_load_penalty,
+            'bulk_penalty': dispatch.bulk_net_load_penalty,
+            'flex_penalty': dispatch.flex_load_penalty}
+
+def update_dispatch_model(instance, dispatch, period, offset=0):
+    """loads a period's data into a persistent dispatch model instance built by create_dispatch_model with mutable=True"""
+    for name, values in dispatch_param_values(dispatch, period, offset).iteritems():
+        param = getattr(instance, name)
+        if param.is_indexed():
+            param.store_values(values)
+        else:
+            param.value = values
+
+
+def create_dispatch_model(dispatch, period, model_type='abstract', mutable=False, offset=0):
     """
     Formulation of dispatch problem.
     If _inputs contains data, the data are initialized with the formulation of the model (concrete model).
     Model is defined as "abstract," however, so data can also be loaded when create_instance() is called instead.
+    With mutable=True, the params in dispatch_param_values can be updated with update_dispatch_model, and hours are
+    shifted back by offset so that the model can be reused by any period of the same length.
     """
     model = AbstractModel() if model_type == 'abstract' else ConcreteModel()
+    values = dispatch_param_values(dispatch, period, offset)
 
     ###########################
     # ### Sets and params ### #
     ###########################
     # ### Temporal structure ### #
-    model.TIMEPOINTS = Set(within=NonNegativeIntegers, ordered=True, initialize=dispatch.period_timepoints[period])
-    model.previous = Param(model.TIMEPOINTS, within=NonNegativeIntegers, initialize=dispatch.period_previous_timepoints[period])
+    model.TIMEPOINTS = Set(within=NonNegativeIntegers, ordered=True, initialize=[t - offset for t in dispatch.period_timepoints[period]])
+    model.previous = Param(model.TIMEPOINTS, within=NonNegativeIntegers, initialize=dict((t - offset, p - offset) for t, p in dispatch.period_previous_timepoints[period].iteritems()))
     model.first_timepoint = Param(initialize=min_timepoints)
     model.last_timepoint = Param(initialize=max_timepoints)
 
@@ -279,52 +335,52 @@ def create_dispatch_model(dispatch, period, model_type='abstract'):
     model.TECHNOLOGIES = model.STORAGE_TECHNOLOGIES | model.GENERATION_TECHNOLOGIES | model.LD_TECHNOLOGIES
     model.large_storage = Param(model.STORAGE_TECHNOLOGIES, initialize=dispatch.large_storage, within=Binary)
     model.VERY_LARGE_STORAGE_TECHNOLOGIES = Set(within=model.STORAGE_TECHNOLOGIES, initialize=large_storage_tech_init)
-    model.start_state_of_charge = Param(model.VERY_LARGE_STORAGE_TECHNOLOGIES, initialize=(dispatch.start_soc_large_storage[period] if len(dispatch.start_soc_large_storage) else dispatch.start_soc_large_storage))
-    model.end_state_of_charge = Param(model.VERY_LARGE_STORAGE_TECHNOLOGIES, initialize=(dispatch.end_soc_large_storage[period] if len(dispatch.end_soc_large_storage) else dispatch.end_soc_large_storage))
-    model.charging_efficiency = Param(model.STORAGE_TECHNOLOGIES, initialize=dispatch.charging_efficiency)
-    model.discharging_efficiency = Param(model.STORAGE_TECHNOLOGIES, initialize=dispatch.discharging_efficiency)
+    model.start_state_of_charge = Param(model.VERY_LARGE_STORAGE_TECHNOLOGIES, initialize=values['start_state_of_charge'], mutable=mutable)
+    model.end_state_of_charge = Param(model.VERY_LARGE_STORAGE_TECHNOLOGIES, initialize=values['end_state_of_charge'], mutable=mutable)
+    model.charging_efficiency = Param(model.STORAGE_TECHNOLOGIES, initialize=values['charging_efficiency'], mutable=mutable)
+    model.discharging_efficiency = Param(model.STORAGE_TECHNOLOGIES, initialize=values['discharging_efficiency'], mutable=mutable)
 
     # Only "generation" technologys have variable costs; storage does not
-    model.variable_cost = Param(model.GENERATION_TECHNOLOGIES, initialize=dispatch.variable_costs)
+    model.variable_cost = Param(model.GENERATION_TECHNOLOGIES, initialize=values['variable_cost'], mutable=mutable)
     model.geography = Param(model.TECHNOLOGIES, within=model.GEOGRAPHIES, initialize=dispatch.geography[period])
     model.feeder = Param(model.TECHNOLOGIES, within=model.FEEDERS, initialize=dispatch.feeder[period])
-    model.min_capacity = Param(model.TECHNOLOGIES, initialize=dispatch.min_capacity[period])    
-    model.capacity = Param(model.TECHNOLOGIES, initialize=dispatch.capacity[period])
-    model.duration = Param(model.STORAGE_TECHNOLOGIES, initialize= dispatch.duration[period])
-    model.ld_energy = Param(model.LD_TECHNOLOGIES, initialize = (dispatch.ld_energy_budgets[period] if len(dispatch.ld_energy_budgets) else dispatch.ld_energy_budgets))
+    model.min_capacity = Param(model.TECHNOLOGIES, initialize=values['min_capacity'], mutable=mutable)
+    model.capacity = Param(model.TECHNOLOGIES, initialize=values['capacity'], mutable=mutable)
+    model.duration = Param(model.STORAGE_TECHNOLOGIES, initialize=values['duration'], mutable=mutable)
+    model.ld_energy = Param(model.LD_TECHNOLOGIES, initialize=values['ld_energy'], mutable=mutable)
     
     # ### System ### #
     # Load
-    model.distribution_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, initialize=dispatch.distribution_load[period], within=Reals)
-    model.bulk_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, within=Reals, initialize=dispatch.bulk_load[period]) 
-    model.dispatched_bulk_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, within=Reals, initialize=dispatch.dispatched_bulk_load[period])     
-    model.distribution_gen = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, initialize=dispatch.distribution_gen[period], within=Reals)
-    model.bulk_gen = Param(model.GEOGRAPHIES, model.TIMEPOINTS, within=NonNegativeReals, initialize=dispatch.bulk_gen[period])                                        
+    model.distribution_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, initialize=values['distribution_load'], within=Reals, mutable=mutable)
+    model.bulk_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, within=Reals, initialize=values['bulk_load'], mutable=mutable)
+    model.dispatched_bulk_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, within=Reals, initialize=values['dispatched_bulk_load'], mutable=mutable)
+    model.distribution_gen = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, initialize=values['distribution_gen'], within=Reals, mutable=mutable)
+    model.bulk_gen = Param(model.GEOGRAPHIES, model.TIMEPOINTS, within=NonNegativeReals, initialize=values['bulk_gen'], mutable=mutable)
                                            
     # Flex  loads
-    model.min_cumulative_flex_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, within=Reals, initialize=dispatch.min_cumulative_flex_load[period])
-    model.max_cumulative_flex_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, within=Reals, initialize=dispatch.max_cumulative_flex_load[period])
-    model.cumulative_distribution_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, within=Reals, initialize=dispatch.cumulative_distribution_load[period])
-    model.max_flex_load = Param(model.GEOGRAPHIES,model.FEEDERS, within=Reals, initialize=dispatch.max_flex_load[period])
-    model.min_flex_load = Param(model.GEOGRAPHIES,model.FEEDERS, within=Reals, initialize=dispatch.min_flex_load[period])
+    model.min_cumulative_flex_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, within=Reals, initialize=values['min_cumulative_flex_load'], mutable=mutable)
+    model.max_cumulative_flex_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, within=Reals, initialize=values['max_cumulative_flex_load'], mutable=mutable)
+    model.cumulative_distribution_load = Param(model.GEOGRAPHIES, model.TIMEPOINTS, model.FEEDERS, within=Reals, initialize=values['cumulative_distribution_load'], mutable=mutable)
+    model.max_flex_load = Param(model.GEOGRAPHIES,model.FEEDERS, within=Reals, initialize=values['max_flex_load'], mutable=mutable)
+    model.min_flex_load = Param(model.GEOGRAPHIES,model.FEEDERS, within=Reals, initialize=values['min_flex_load'], mutable=mutable)
     
     model.TRANSMISSION_LINES = Set(initialize=dispatch.transmission.list_transmission_lines)
-    model.transmission_capacity = Param(model.TRANSMISSION_LINES, initialize=dispatch.transmission.constraints.get_values_as_dict(dispatch.year))
-    model.transmission_hurdle = Param(model.TRANSMISSION_LINES, initialize=dispatch.transmission.hurdles.get_values_as_dict(dispatch.year))
-    model.transmission_losses = Param(model.TRANSMISSION_LINES, initialize=dispatch.transmission.losses.get_values_as_dict(dispatch.year))
+    model.transmission_capacity = Param(model.TRANSMISSION_LINES, initialize=values['transmission_capacity'], mutable=mutable)
+    model.transmission_hurdle = Param(model.TRANSMISSION_LINES, initialize=values['transmission_hurdle'], mutable=mutable)
+    model.transmission_losses = Param(model.TRANSMISSION_LINES, initialize=values['transmission_losses'], mutable=mutable)
 
-    model.dist_net_load_threshold = Param(model.GEOGRAPHIES, model.FEEDERS, within=NonNegativeReals, initialize=dispatch.dist_net_load_thresholds)
-    model.bulk_net_load_threshold = Param(model.GEOGRAPHIES, within=NonNegativeReals, initialize=dispatch.bulk_net_load_thresholds)
-    model.t_and_d_losses = Param(model.GEOGRAPHIES, model.FEEDERS,within=NonNegativeReals, initialize=dispatch.t_and_d_losses)
+    model.dist_net_load_threshold = Param(model.GEOGRAPHIES, model.FEEDERS, within=NonNegativeReals, initialize=values['dist_net_load_threshold'], mutable=mutable)
+    model.bulk_net_load_threshold = Param(model.GEOGRAPHIES, within=NonNegativeReals, initialize=values['bulk_net_load_threshold'], mutable=mutable)
+    model.t_and_d_losses = Param(model.GEOGRAPHIES, model.FEEDERS,within=NonNegativeReals, initialize=values['t_and_d_losses'], mutable=mutable)
 
     # Imbalance penalties
     # Not geographyalized, as we don't want arbitrage across geographies
-    model.curtailment_cost = Param(within=NonNegativeReals, initialize= dispatch.curtailment_cost)
-    model.unserved_capacity_cost = Param(within=NonNegativeReals, initialize= dispatch.unserved_capacity_cost)
-    model.unserved_energy_cost = Param(within=NonNegativeReals, initialize= max(dispatch.variable_costs.values())*1.05)
-    model.dist_penalty = Param(within=NonNegativeReals, initialize= dispatch.dist_net_load_penalty)
-    model.bulk_penalty = Param(within=NonNegativeReals, initialize= dispatch.bulk_net_load_penalty)
-    model.flex_penalty = Param(within=NonNegativeReals, initialize= dispatch.flex_load_penalty)
+    model.curtailment_cost = Param(within=NonNegativeReals, initialize=values['curtailment_cost'], mutable=mutable)
+    model.unserved_capacity_cost = Param(within=NonNegativeReals, initialize=values['unserved_capacity_cost'], mutable=mutable)
+    model.unserved_energy_cost = Param(within=NonNegativeReals, initialize=values['unserved_energy_cost'], mutable=mutable)
+    model.dist_penalty = Param(within=NonNegativeReals, initialize=values['dist_penalty'], mutable=mutable)
+    model.bulk_penalty = Param(within=NonNegativeReals, initialize=values['bulk_penalty'], mutable=mutable)
+    model.flex_penalty = Param(within=NonNegativeReals, initialize=values['flex_penalty'], mutable=mutable)
     #####################
     # ### Variables ### #
     #####################
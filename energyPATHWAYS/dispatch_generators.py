@@ -4,14 +4,56 @@ import numpy as np
 import copy
 import pandas as pd
 import logging
+import hashlib
+from collections import OrderedDict
 from sklearn.cluster import KMeans
 import pdb
 import dispatch_maintenance
 
-def cluster_generators(n_clusters, pmax, marginal_cost, FORs, MORs, must_run, pad_stack=False, zero_mc_4_must_run=False):
+# KMeans fits by a hash of the clustering inputs, and the last fit of each fleet for incremental clustering
+max_cached_clusterings = 256
+_clustering_cache = OrderedDict()
+_fleet_clusterings = {}
+
+def clear_clustering_cache():
+    _clustering_cache.clear()
+    _fleet_clusterings.clear()
+
+def _describe_clusters(fit, must_run, marginal_cost):
+    """centroids as must run share and marginal cost, and the largest marginal cost distance of a generator from its centroid"""
+    counts = np.bincount(fit).astype(float)
+    centroids = np.vstack((np.bincount(fit, weights=must_run) / counts, np.bincount(fit, weights=marginal_cost) / counts)).T
+    return centroids, np.max(np.abs(marginal_cost - centroids[fit, 1]))
+
+def _fit_clusters(n_clusters, must_run, marginal_cost, factor, fleet=None, incremental=False):
+    """
+    Returns the KMeans cluster of each generator, reusing an earlier fit of the same inputs.
+    With incremental, generators are assigned to the nearest centroid of the fleet's last fit instead, unless one is
+    further from every centroid than any generator was from its own in that fit.
+    """
+    points = np.vstack((must_run * factor, marginal_cost)).T
+    key = hashlib.sha1(np.ascontiguousarray(points, dtype=float).tostring()).hexdigest(), n_clusters
+    if key in _clustering_cache:
+        fit = _clustering_cache.pop(key)
+    else:
+        if incremental and fleet in _fleet_clusterings and _fleet_clusterings[fleet][0] == n_clusters:
+            centroids, radius = _fleet_clusterings[fleet][1:]
+            distances = np.sqrt(((points[:, None, :] - centroids[None, :, :] * [factor, 1]) ** 2).sum(axis=2))
+            if np.all(distances.min(axis=1) <= radius):
+                # clusters left without any generators are dropped
+                return np.unique(distances.argmin(axis=1), return_inverse=True)[1]
+        fit = KMeans(n_clusters=n_clusters, precompute_distances='auto', random_state=1).fit_predict(points)
+        if len(_clustering_cache) >= max_cached_clusterings:
+            _clustering_cache.popitem(last=False)
+    _clustering_cache[key] = fit
+    if fleet is not None:
+        _fleet_clusterings[fleet] = (n_clusters,) + _describe_clusters(fit, must_run, marginal_cost)
+    return fit
+
+def cluster_generators(n_clusters, pmax, marginal_cost, FORs, MORs, must_run, pad_stack=False, zero_mc_4_must_run=False, fleet=None, incremental=False):
     """ Cluster generators is a function that takes a generator stack and clusters them by marginal_cost and must run status.
 
-    clustering is done with sklearn KMeans
+    clustering is done with sklearn KMeans, and fits are cached by a hash of the clustering inputs
 
     Args:
         n_clusters (int): controls the number of output generators (must between 1 and the number of generators)
@@ -22,6 +64,8 @@ def cluster_generators(n_clusters, pmax, marginal_cost, FORs, MORs, must_run, pa
         must_run (bool 1d array): boolean array indicating whether each generator is must run
         pad_stack (bool): if true, the highest cost dispatchable generator has it's capacity increased
         zero_mc_4_must_run (bool): if true, must run generators are returned with zero marginal cost
+        fleet (hashable): identifies the generator stack across calls, e.g. its dispatch geography
+        incremental (bool): if true, generators are assigned to the clusters of the fleet's last fit when they are close enough
 
     Returns:
         clustered: a dictionary with generator clusters
@@ -40,9 +84,8 @@ def cluster_generators(n_clusters, pmax, marginal_cost, FORs, MORs, must_run, pa
     if zero_mc_4_must_run:
         new_mc[np.nonzero(must_run)] = 0
     # clustering is done here
-    cluster = KMeans(n_clusters=n_clusters, precompute_distances='auto', random_state=1)
     factor = (max(marginal_cost) - min(marginal_cost)) * 10
-    fit = cluster.fit_predict(np.vstack((must_run * factor, new_mc)).T)
+    fit = _fit_clusters(n_clusters, must_run, new_mc, factor, fleet, incremental)
     num_clusters_found = max(fit) + 1
     n_clusters = min(n_clusters, num_clusters_found)
 
@@ -107,18 +150,18 @@ def solve_gen_dispatch(load, pmax, marginal_cost, FORs, MORs, must_run, gen_cate
     must_run_sum = sum((pmax * (1 - combined_rate))[np.nonzero(must_run)])
     load_w_must_run = np.clip(load, a_min=must_run_sum, a_max=None)
 
-    dispatch = np.zeros((len(derated_capacity), len(load)))
-    market_prices = []
-    for h, look in enumerate(load_w_must_run):
-        height = np.where(cum_pmax < look)[0]
-        dispatch[height, h] = sorted_pmax[height]
-        if len(height) and len(height) != len(pmax):
-            marg = height[-1] + 1
-            dispatch[marg, h] = look - cum_pmax[height[-1]]
-            market_prices.append(sorted_marginal_cost[marg])
-        else:
-            dispatch[0, h] = look
-            market_prices.append(sorted_marginal_cost[0])
+    load_w_must_run = np.asarray(load_w_must_run, dtype=float)
+    # in each hour every generator whose cumulative capacity is below the load runs at full capacity
+    num_full = np.searchsorted(cum_pmax, load_w_must_run, side='left')
+    dispatch = np.where(np.arange(len(derated_capacity))[:, None] < num_full, sorted_pmax[:, None], 0.)
+    # the next generator in the stack is marginal and serves the rest of the load. When no generator or every
+    # generator is below the load, the first generator in the stack takes the load
+    has_marginal = (num_full > 0) & (num_full != len(pmax))
+    hours = np.arange(len(load_w_must_run))
+    marg = num_full[has_marginal]
+    dispatch[marg, hours[has_marginal]] = load_w_must_run[has_marginal] - cum_pmax[marg - 1]
+    dispatch[0, hours[~has_marginal]] = load_w_must_run[~has_marginal]
+    market_prices = list(sorted_marginal_cost[np.where(has_marginal, num_full, 0)])
     dispatch = dispatch[np.argsort(marginal_cost_order)]
 
     dispatch_by_generator = dispatch.sum(axis=1)
@@ -3,6 +3,7 @@ __author__ = 'ryan'
 import config as cfg
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import os
 import copy
 import util
@@ -18,6 +19,8 @@ class GeoMapper:
         self.geography_names = dict(util.sql_read_table('GeographiesData', ['id', 'name'], return_unique=True, return_iterable=True)) # this is used for outputs
         self.timezone_names = {}
         self.map_keys = []
+        # mapping tables built by map_df and map_matrix, cleared whenever self.values changes
+        self._map_cache = {}
         self.read_geography_indicies()
         self.gau_to_geography = dict(util.flatten_list([(v, k) for v in vs] for k, vs in self.geographies.iteritems()))
         self.id_to_geography = dict((k, v) for k, v in util.sql_read_table('Geographies'))
@@ -156,6 +159,7 @@ class GeoMapper:
         
         self.values[new_level_name] = base_gaus
         self.values = self.values.set_index(new_level_name, append=True)
+        self._map_cache = {}
         # add to self.geographies
         self.geographies[new_level_name] = list(set(self.values.index.get_level_values(new_level_name)))
         
@@ -188,18 +192,39 @@ class GeoMapper:
             "what fraction of each state is in each census division
         """
         assert normalize_as=='total' or normalize_as=='intensity'
-        geomap_data = self.values if geomap_data=='from self' else geomap_data
+        from_self = isinstance(geomap_data, basestring) and geomap_data=='from self'
+        geomap_data = self.values if from_self else geomap_data
         if primary_subset_id=='from config' and filter_geo:
             primary_subset_id = cfg.primary_subset_id
         elif (primary_subset_id is None) or (primary_subset_id is False) or (not filter_geo):
             primary_subset_id = []
         
-        subset_geographies = set(cfg.geo.gau_to_geography[id] for id in primary_subset_id)
         current_geography = util.ensure_iterable_and_not_string(current_geography)
         converted_geography = util.ensure_iterable_and_not_string(converted_geography)
+        map_key = cfg.cfgfile.get('case', 'default_geography_map_key') if map_key is None else map_key
+        # the same mapping is requested many times per run, so tables built from self.values are kept
+        cache_key = ('map_df', tuple(current_geography), tuple(converted_geography), normalize_as, map_key, tuple(sorted(primary_subset_id)))
+        if from_self and cache_key in self._map_cache:
+            table = self._map_cache[cache_key].copy()
+        else:
+            table = self._build_map_table(geomap_data, current_geography, converted_geography, normalize_as, map_key, primary_subset_id)
+            if from_self:
+                self._map_cache[cache_key] = table.copy()
+        
+        if reset_index:
+            table = table.reset_index()
+
+        if not eliminate_zeros:
+            index = pd.MultiIndex.from_product(table.index.levels, names=table.index.names)
+            table = table.reorder_levels(index.names)
+            table = table.reindex(index, fill_value=0.0)
+            
+        return table
+        
+    def _build_map_table(self, geomap_data, current_geography, converted_geography, normalize_as, map_key, primary_subset_id):
+        subset_geographies = set(cfg.geo.gau_to_geography[id] for id in primary_subset_id)
         union_geo = list(subset_geographies | set(current_geography) | set(converted_geography))
         level_to_remove = list(subset_geographies - set(current_geography) - set(converted_geography))
-        map_key = cfg.cfgfile.get('case', 'default_geography_map_key') if map_key is None else map_key
         table = geomap_data[map_key].groupby(level=union_geo).sum().to_frame()
         if normalize_as=='total':
             table = self._normalize(table, current_geography)
@@ -210,17 +235,50 @@ class GeoMapper:
             table = table.reset_index().set_index(table.index.names)
         if normalize_as=='intensity':
             table = self._normalize(table, converted_geography)
-        
-        if reset_index:
-            table = table.reset_index()
-
-        if not eliminate_zeros:
-            index = pd.MultiIndex.from_product(table.index.levels, names=table.index.names)
-            table = table.reorder_levels(index.names)
-            table = table.reindex(index, fill_value=0.0)
-            
         return table
-        
+
+    def map_matrix(self, current_geography, converted_geography, normalize_as='total', map_key=None, filter_geo=True):
+        """ sparse form of map_df between two single geographies
+        returns the current gaus, the converted gaus and a scipy.sparse csr matrix with a row per current gau and a
+        column per converted gau, so that data with current gaus as columns is remapped with a matrix product.
+        Returns None if the mapping table has other levels (e.g. a primary subset geography)
+        """
+        map_key = cfg.cfgfile.get('case', 'default_geography_map_key') if map_key is None else map_key
+        primary_subset_id = cfg.primary_subset_id if filter_geo else []
+        cache_key = ('map_matrix', current_geography, converted_geography, normalize_as, map_key, tuple(sorted(primary_subset_id or [])))
+        if cache_key not in self._map_cache:
+            table = self.map_df(current_geography, converted_geography, normalize_as=normalize_as, map_key=map_key, filter_geo=filter_geo)
+            if current_geography==converted_geography or table.index.nlevels!=2:
+                self._map_cache[cache_key] = None
+            else:
+                current_gaus = table.index.get_level_values(current_geography)
+                converted_gaus = table.index.get_level_values(converted_geography)
+                current_index, converted_index = pd.Index(sorted(set(current_gaus))), pd.Index(sorted(set(converted_gaus)))
+                matrix = sparse.csr_matrix((table.values[:,0], (current_index.get_indexer(current_gaus), converted_index.get_indexer(converted_gaus))),
+                                           shape=(len(current_index), len(converted_index)))
+                self._map_cache[cache_key] = (current_index, converted_index, matrix)
+        return self._map_cache[cache_key]
+
+    @staticmethod
+    def map_with_matrix(df, map_matrix, current_geography, converted_geography):
+        """ remaps the single column df from current_geography to converted_geography with a map_matrix, giving the
+        same rows as multiplying by map_df and summing over current_geography: each row of df is repeated for every
+        converted gau its gau maps to, rows with gaus that aren't in the map are dropped, and duplicates are summed
+        """
+        current_gaus, converted_gaus, matrix = map_matrix
+        rows = current_gaus.get_indexer(df.index.get_level_values(current_geography))
+        positions = np.nonzero(rows >= 0)[0]
+        counts = np.diff(matrix.indptr)[rows[positions]]
+        # the entries of the matrix row of every df row, one after the other
+        entries = np.repeat(matrix.indptr[rows[positions]] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        positions = np.repeat(positions, counts)
+        names = [name if name != current_geography else converted_geography for name in df.index.names]
+        arrays = [df.index.get_level_values(name).values[positions] if name != converted_geography
+                  else converted_gaus.values[matrix.indices[entries]] for name in names]
+        values = df.values[positions, 0] * matrix.data[entries]
+        mapped = pd.DataFrame(values, index=pd.MultiIndex.from_arrays(arrays, names=names), columns=df.columns)
+        return mapped.groupby(level=names).sum()
+
     def filter_extra_geos_from_df(self, df):
         # we have a subset geography and should remove the data that is completely outside of the breakout
         if cfg.primary_subset_id:
@@ -381,6 +439,7 @@ class GeoMapper:
     def add_new_geography(self, new_geography_name, base_gaus):
         self.values[new_geography_name] = base_gaus
         self.values = self.values.set_index(new_geography_name, append=True)
+        self._map_cache = {}
         # add to self.geographies
         self.geographies_unfiltered[new_geography_name] = sorted(list(set(self.values.index.get_level_values(new_geography_name))))
         self._update_geographies_after_subset()
@@ -13,36 +13,56 @@ from pyomo.opt import SolverFactory
 #import numpy as np
 import dispatch_classes
 
+# long-lived pool shared by every parallel stage of a model run (see start_pool)
+_pool = None
+# set in worker processes of the persistent pool, whose config is initialized once by the pool initializer
+_worker_initialized = False
+
+def _initialize_worker(workingdir, cfgfile_name, log_name):
+    global _worker_initialized
+    cfg.initialize_config(workingdir, cfgfile_name, log_name)
+    _worker_initialized = True
+
+def initialize_worker_config(obj):
+    """initializes config from the object's run settings unless the worker already did so at pool start"""
+    if not _worker_initialized:
+        cfg.initialize_config(obj.workingdir, obj.cfgfile_name, obj.log_name)
+
+def release_worker_config():
+    """persistent workers keep their database connection open for the next task"""
+    if not _worker_initialized:
+        cfg.cur.close()
+
 def process_shapes(shape):
-    cfg.initialize_config(shape.workingdir, shape.cfgfile_name, shape.log_name)
+    initialize_worker_config(shape)
     shape.process_shape()
-    cfg.cur.close()
+    release_worker_config()
     return shape
 
 def node_calculate(node):
-    cfg.initialize_config(node.workingdir, node.cfgfile_name, node.log_name)
+    initialize_worker_config(node)
     node.calculate()
-    cfg.cur.close()
+    release_worker_config()
     return node
 
 def subsector_calculate(subsector):
     if not subsector.calculated:
-        cfg.initialize_config(subsector.workingdir, subsector.cfgfile_name, subsector.log_name)
+        initialize_worker_config(subsector)
         subsector.calculate()
-        cfg.cur.close()
+        release_worker_config()
     return subsector
 
 def subsector_populate(subsector):
-    cfg.initialize_config(subsector.workingdir, subsector.cfgfile_name, subsector.log_name)
+    initialize_worker_config(subsector)
     subsector.add_energy_system_data()
-    cfg.cur.close()
+    release_worker_config()
     return subsector
 
 def shapes_populate(shape):
-    cfg.initialize_config(shape.workingdir, shape.cfgfile_name, shape.log_name)
+    initialize_worker_config(shape)
     logging.info('    shape: ' + shape.name)
     shape.read_timeseries_data()
-    cfg.cur.close()
+    release_worker_config()
     return shape
 
 def individual_calculate(evolve, individual):
@@ -52,17 +72,17 @@ def individual_calculate(evolve, individual):
 def aggregate_subsector_shapes(params):
     subsector = params[0]
     year = params[1]    
-    cfg.initialize_config(subsector.workingdir, subsector.cfgfile_name, subsector.log_name)
+    initialize_worker_config(subsector)
     aggregate_electricity_shape = subsector.aggregate_electricity_shapes(year)
-    cfg.cur.close()    
+    release_worker_config()
     return aggregate_electricity_shape
 
 def aggregate_sector_shapes(params):
     sector = params[0]
     year = params[1]    
-    cfg.initialize_config(sector.workingdir, sector.cfgfile_name, sector.log_name)
+    initialize_worker_config(sector)
     aggregate_electricity_shape = sector.aggregate_inflexible_electricity_shape(year)
-    cfg.cur.close()
+    release_worker_config()
     return aggregate_electricity_shape
     
 def run_optimization(params, return_model_instance=False):
@@ -73,9 +93,38 @@ def run_optimization(params, return_model_instance=False):
     instance.solutions.load_from(solution)
     return instance if return_model_instance else dispatch_classes.all_results_to_list(instance)
 
+def run_dispatch_period(params):
+    path, period = params
+    dispatch = dispatch_classes.Dispatch.load_shared_inputs(path)
+    return dispatch.solve_optimization_period(period)
+
+def start_pool():
+    """starts a pool of workers that initialize config once and are reused by safe_pool until close_pool is called"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    # the main process's database connection is closed while forking, for the same reason as in safe_pool
+    cfg.cur.close()
+    _pool = Pool(processes=cfg.available_cpus, initializer=_initialize_worker,
+                 initargs=(cfg.workingdir, cfg.cfgfile_name, cfg.log_name))
+    cfg.init_db()
+    return _pool
+
+def close_pool():
+    global _pool
+    if _pool is None:
+        return
+    _pool.close()
+    _pool.join()
+    _pool = None
+
 # Applies method to data using parallel processes and returns the result, but closes the main process's database
 # connection first, since otherwise the connection winds up in an unusable state on macOS.
+# If a persistent pool has been started, its already initialized workers are used instead.
 def safe_pool(method, data):
+    if _pool is not None:
+        return _pool.map(method, data)
+
     cfg.cur.close()
 
     pool = Pool(processes=cfg.available_cpus)
@@ -14,9 +14,16 @@ import logging
 import time
 import inspect
 import csv
+import glob
+import gzip
+import shutil
+import itertools
 from collections import defaultdict, OrderedDict
 import cPickle as pickle
 
+# numbers the output chunks written by this process (see Output.write_partition)
+_chunk_numbers = itertools.count()
+
 class Output(object):
     def __init__(self):
         pass
@@ -78,7 +85,27 @@ class Output(object):
             pickle.dump(obj, outfile, pickle.HIGHEST_PROTOCOL)
 
     @staticmethod
-    def write(df, file_name, path, compression=None):
+    def add_run_levels(df, scenario_name):
+        """ adds the TIMESTAMP and SCENARIO levels to the front of a result's index. This does what concatenating the
+        frame with keys does, but only builds a new index instead of copying the data
+        """
+        index = df.index
+        if isinstance(index, pd.MultiIndex):
+            levels, labels, names = list(index.levels), list(index.labels), list(index.names)
+        else:
+            codes, uniques = pd.factorize(index)
+            levels, labels, names = [uniques], [codes], [index.name]
+        constant = np.zeros(len(index), dtype=int)
+        result_df = df.copy(deep=False)
+        result_df.index = pd.MultiIndex(levels=[[cfg.timestamp], [scenario_name.upper()]] + levels,
+                                        labels=[constant, constant] + labels,
+                                        names=['TIMESTAMP', 'SCENARIO'] + names, verify_integrity=False)
+        return result_df
+
+    @staticmethod
+    def write(df, file_name, path, compression=None, partition=None):
+        if cfg.output_writer == 'partitioned':
+            return Output.write_partition(df, file_name, path, partition)
         # roughly follows the solutions here: http://stackoverflow.com/questions/11114492/check-if-a-file-is-not-open-not-used-by-other-process-in-python
         # note that there is still a small, but real chance of a race condition causing an error error, thus this is "safer" but not safe
         if not os.path.exists(path):
@@ -107,6 +134,67 @@ class Output(object):
         else:
             df.to_csv(os.path.join(path, file_name), header=True, mode='w')
 
+    @staticmethod
+    def write_partition(df, file_name, path, partition=None):
+        """ lock free version of write. Every call writes its own gzipped csv chunk to path/file_name.parts, named by
+        partition (the scenario id, which is a file name already), process and call, so concurrent runs never share a file. Chunks are written to a .tmp
+        file and renamed when complete, so merge_partitions never sees a partial chunk
+        """
+        part_path = os.path.join(path, file_name + '.parts')
+        part_name = '{}.{}.{:06d}.csv.gz'.format(partition or 'output', os.getpid(), next(_chunk_numbers))
+        for tries in range(3):
+            if not os.path.isdir(part_path):
+                try:
+                    os.makedirs(part_path)
+                except OSError:
+                    # another process made it first
+                    if not os.path.isdir(part_path):
+                        raise
+            try:
+                df.to_csv(os.path.join(part_path, part_name + '.tmp'), header=True, mode='w', compression='gzip')
+                break
+            except IOError:
+                # a merge removed the folder after it emptied it
+                if tries == 2:
+                    raise
+        os.rename(os.path.join(part_path, part_name + '.tmp'), os.path.join(part_path, part_name))
+
+    @staticmethod
+    def chunk_partition(part):
+        """ the partition a chunk written by write_partition belongs to """
+        return os.path.basename(part)[:-len('.csv.gz')].rsplit('.', 2)[0]
+
+    @staticmethod
+    def merge_partitions(path, partitions=None):
+        """ combines the completed chunks written by write_partition in every output folder under path into one csv per
+        output, for the given partitions or for all of them if partitions is None. Chunks are copied through as text
+        with a single header, so nothing is parsed or reindexed, and each one is deleted once it is merged. Chunks of
+        other partitions and chunks still being written are left for a later merge
+        """
+        for part_path in sorted(glob.glob(os.path.join(path, '*', '*.parts'))):
+            parts = [part for part in sorted(glob.glob(os.path.join(part_path, '*.csv.gz')))
+                     if partitions is None or Output.chunk_partition(part) in partitions]
+            file_name = part_path[:-len('.parts')]
+            exists = os.path.isfile(file_name)
+            if parts:
+                with open(file_name, 'ab' if exists else 'wb') as outfile:
+                    for part in parts:
+                        infile = gzip.open(part, 'rb')
+                        try:
+                            header = infile.readline()
+                            if not exists:
+                                outfile.write(header)
+                                exists = True
+                            shutil.copyfileobj(infile, outfile)
+                        finally:
+                            infile.close()
+                        os.remove(part)
+            try:
+                os.rmdir(part_path)
+            except OSError:
+                # other runs still have chunks here
+                pass
+
     @staticmethod
     def writeobj(obj, write_directory=None, name=None, clean=False):
         if name is None:
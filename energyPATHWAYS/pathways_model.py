@@ -14,6 +14,10 @@ import pdb
 from scenario_loader import Scenario
 import copy
 import numpy as np
+from scipy import sparse
+import helper_multiprocess
+import dispatch_classes
+import dispatch_generators
 
 class PathwaysModel(object):
     """
@@ -28,19 +32,25 @@ class PathwaysModel(object):
         self.supply = None
         self.demand_solved, self.supply_solved = False, False
 
-    def run(self, scenario_id, solve_demand, solve_supply, load_demand, load_supply, export_results, save_models, append_results):
+    def run(self, scenario_id, solve_demand, solve_supply, load_demand, load_supply, export_results, save_models, append_results, resume_supply=False):
         try:
-            if solve_demand and not (load_demand or load_supply):
+            if cfg.cfgfile.get('case','parallel_process').lower() == 'true':
+                # workers are started and initialized once here and then reused by every parallel stage of the run
+                helper_multiprocess.start_pool()
+
+            if solve_demand and not (load_demand or load_supply or resume_supply):
                 self.calculate_demand(save_models)
             
             if not append_results:
                 self.remove_old_results()
 
             # it is nice if when loading a demand side object to rerun supply, it doesn't re-output these results every time
-            if self.demand_solved and export_results and not self.api_run and not (load_demand and solve_supply):
+            if self.demand_solved and export_results and not self.api_run and not (load_demand and solve_supply) and not resume_supply:
                 self.export_result_to_csv('demand_outputs')
 
-            if solve_supply and not load_supply:
+            if solve_supply and resume_supply:
+                self.resume_supply(save_models)
+            elif solve_supply and not load_supply:
                 if load_demand:
                     # if we are loading the demand, we are changing the supply measures and want to reload our scenarios
                     self.scenario = Scenario(self.scenario_id)
@@ -67,6 +77,12 @@ class PathwaysModel(object):
             if save_models:
                 Output.pickle(self, file_name=str(scenario_id) + cfg.model_error_append_name, path=cfg.workingdir)
             raise
+        finally:
+            helper_multiprocess.close_pool()
+            util.clear_grouped_table_memo()
+            util.clear_alignment_plan_cache()
+            dispatch_classes.clear_dispatch_models()
+            dispatch_generators.clear_clustering_cache()
 
     def calculate_demand(self, save_models):
         self.demand.setup_and_solve()
@@ -86,14 +102,49 @@ class PathwaysModel(object):
         self.supply.add_measures()
         self.supply.initial_calculate()
         self.supply.calculated_years = []
-        self.supply.calculate_loop(self.supply.years, self.supply.calculated_years)
+        self.supply.calculate_loop(self.supply.years, self.supply.calculated_years,
+                                   checkpoint=self.checkpoint_supply if save_models else None)
+        self.finish_supply(save_models)
+
+    def resume_supply(self, save_models):
+        """ continues the supply side of a model loaded from a supply checkpoint after its last completed year """
+        if self.supply is None or not self.supply.calculated_years:
+            raise ValueError('the supply checkpoint for scenario {} has no completed years'.format(self.scenario_id))
+        logging.info('Resuming energy system supply after {}'.format(max(self.supply.calculated_years)))
+        self.supply.calculate_loop(self.supply.years, self.supply.calculated_years,
+                                   checkpoint=self.checkpoint_supply if save_models else None, resume=True)
+        self.finish_supply(save_models)
+
+    def checkpoint_supply(self, year):
+        """ saves the model at the end of each supply year, so that a run that crashes in a later year can be
+        resumed from here (see run.py --resume_supply)
+        """
+        logging.info('Saving supply checkpoint for {}'.format(year))
+        file_name = str(self.scenario_id) + cfg.supply_checkpoint_append_name
+        # write to a temporary file first so that a crash while saving leaves the previous checkpoint intact
+        Output.pickle(self, file_name=file_name + '.tmp', path=cfg.workingdir)
+        checkpoint_file = os.path.join(cfg.workingdir, file_name)
+        try:
+            # replaces the old checkpoint in one step on POSIX
+            os.rename(checkpoint_file + '.tmp', checkpoint_file)
+        except OSError:
+            # Windows won't rename over an existing file, so the old checkpoint is kept as .old until the new one is
+            # in place (run.load_model falls back to it)
+            if os.path.isfile(checkpoint_file + '.old'):
+                os.remove(checkpoint_file + '.old')
+            os.rename(checkpoint_file, checkpoint_file + '.old')
+            os.rename(checkpoint_file + '.tmp', checkpoint_file)
+            os.remove(checkpoint_file + '.old')
+
+    def finish_supply(self, save_models):
         self.supply.final_calculate()
         self.supply_solved = True
         if save_models:
             Output.pickle(self, file_name=str(self.scenario_id) + cfg.full_model_append_name, path=cfg.workingdir)
-            # we don't need the demand side object any more, so we can remove it to save drive space
-            if os.path.isfile(os.path.join(cfg.workingdir, str(self.scenario_id) + cfg.demand_model_append_name)):
-                os.remove(os.path.join(cfg.workingdir, str(self.scenario_id) + cfg.demand_model_append_name))
+            # we don't need the demand side object or the supply checkpoint any more, so we can remove them to save drive space
+            for append_name in (cfg.demand_model_append_name, cfg.supply_checkpoint_append_name, cfg.supply_checkpoint_append_name + '.old'):
+                if os.path.isfile(os.path.join(cfg.workingdir, str(self.scenario_id) + append_name)):
+                    os.remove(os.path.join(cfg.workingdir, str(self.scenario_id) + append_name))
 
     def pass_supply_results_back_to_demand(self):
         logging.info("Calculating link to supply")
@@ -145,51 +196,57 @@ class PathwaysModel(object):
                 continue
 
             result_df = getattr(res_obj, 'return_cleaned_output')(attribute)
-            keys = [self.scenario.name.upper(), cfg.timestamp]
-            names = ['SCENARIO','TIMESTAMP']
-            for key, name in zip(keys, names):
-                result_df = pd.concat([result_df], keys=[key], names=[name])
+            result_df = Output.add_run_levels(result_df, self.scenario.name)
 
             if attribute in ('hourly_dispatch_results', 'electricity_reconciliation', 'hourly_marginal_cost', 'hourly_production_cost'):
                 # Special case for hourly dispatch results where we want to write them outside of supply_outputs
-                Output.write(result_df, attribute + '.csv', os.path.join(cfg.workingdir, 'dispatch_outputs'))
+                Output.write(result_df, attribute + '.csv', os.path.join(cfg.workingdir, 'dispatch_outputs'), partition=self.scenario.id)
             else:
-                Output.write(result_df, attribute+'.csv', os.path.join(cfg.workingdir, result_name))
+                Output.write(result_df, attribute+'.csv', os.path.join(cfg.workingdir, result_name), partition=self.scenario.id)
 
     def export_results_to_db(self):
+        # every output is written in one transaction, so a failed export leaves no partial results behind
+        try:
+            self._write_results_to_db()
+        except:
+            cfg.con.rollback()
+            raise
+        cfg.con.commit()
+
+    def _write_results_to_db(self):
         scenario_run_id = util.active_scenario_run_id(self.scenario_id)
         # Levelized costs
         costs = self.outputs.c_costs.groupby(level=['SUPPLY/DEMAND', 'YEAR']).sum()
-        util.write_output_to_db(scenario_run_id, 1, costs)
+        util.write_output_to_db(scenario_run_id, 1, costs, commit=False)
 
         #Energy
         energy = self.outputs.c_energy.xs('FINAL', level='ENERGY ACCOUNTING')\
             .groupby(level=['SECTOR', 'FINAL_ENERGY', 'YEAR']).sum()
         # Energy demand by sector
-        util.write_output_to_db(scenario_run_id, 2, energy.groupby(level=['SECTOR', 'YEAR']).sum())
+        util.write_output_to_db(scenario_run_id, 2, energy.groupby(level=['SECTOR', 'YEAR']).sum(), commit=False)
         # Residential Energy by Fuel Type
-        util.write_output_to_db(scenario_run_id, 6, energy.xs('RESIDENTIAL', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 6, energy.xs('RESIDENTIAL', level='SECTOR'), commit=False)
         # Commercial Energy by Fuel Type
-        util.write_output_to_db(scenario_run_id, 8, energy.xs('COMMERCIAL', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 8, energy.xs('COMMERCIAL', level='SECTOR'), commit=False)
         # Transportation Energy by Fuel Type
-        util.write_output_to_db(scenario_run_id, 10, energy.xs('TRANSPORTATION', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 10, energy.xs('TRANSPORTATION', level='SECTOR'), commit=False)
         # Productive Energy by Fuel Type
-        util.write_output_to_db(scenario_run_id, 12, energy.xs('PRODUCTIVE', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 12, energy.xs('PRODUCTIVE', level='SECTOR'), commit=False)
 
         #Emissions
         emissions = self.outputs.c_emissions.xs('DOMESTIC', level='EXPORT/DOMESTIC')\
             .groupby(level=['SECTOR', 'FINAL_ENERGY', 'YEAR']).sum()
         emissions = util.DfOper.mult((emissions, 1-(emissions.abs()<1E-10).groupby(level='FINAL_ENERGY').all())) # get rid of noise
         # Annual emissions by sector
-        util.write_output_to_db(scenario_run_id, 3, emissions.groupby(level=['SECTOR', 'YEAR']).sum())
+        util.write_output_to_db(scenario_run_id, 3, emissions.groupby(level=['SECTOR', 'YEAR']).sum(), commit=False)
         # Residential Emissions by Fuel Type
-        util.write_output_to_db(scenario_run_id, 7, emissions.xs('RESIDENTIAL', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 7, emissions.xs('RESIDENTIAL', level='SECTOR'), commit=False)
         # Commercial Emissions by Fuel Type
-        util.write_output_to_db(scenario_run_id, 9, emissions.xs('COMMERCIAL', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 9, emissions.xs('COMMERCIAL', level='SECTOR'), commit=False)
         # Transportation Emissions by Fuel Type
-        util.write_output_to_db(scenario_run_id, 11, emissions.xs('TRANSPORTATION', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 11, emissions.xs('TRANSPORTATION', level='SECTOR'), commit=False)
         # Productive Emissions by Fuel Type
-        util.write_output_to_db(scenario_run_id, 13, emissions.xs('PRODUCTIVE', level='SECTOR'))
+        util.write_output_to_db(scenario_run_id, 13, emissions.xs('PRODUCTIVE', level='SECTOR'), commit=False)
 
         # Domestic emissions per capita
         annual_emissions = self.outputs.c_emissions.xs('DOMESTIC', level='EXPORT/DOMESTIC').groupby(level=['YEAR']).sum()
@@ -198,14 +255,14 @@ class PathwaysModel(object):
         factor = 1E6
         df = util.DfOper.divi((annual_emissions, population_driver)) * factor
         df.columns = ['TONNE PER CAPITA']
-        util.write_output_to_db(scenario_run_id, 4, df)
+        util.write_output_to_db(scenario_run_id, 4, df, commit=False)
 
         # Electricity supply
         electricity_node_names = [self.supply.nodes[nodeid].name.upper() for nodeid in util.flatten_list(self.supply.injection_nodes.values())]
         df = self.outputs.c_energy.xs('ELECTRICITY', level='FINAL_ENERGY')\
             .xs('EMBODIED', level='ENERGY ACCOUNTING')\
             .groupby(level=['SUPPLY_NODE', 'YEAR']).sum()
-        util.write_output_to_db(scenario_run_id, 5, df.loc[electricity_node_names])
+        util.write_output_to_db(scenario_run_id, 5, df.loc[electricity_node_names], commit=False)
 
     def calculate_combined_cost_results(self):
         #calculate and format export costs
@@ -471,43 +528,48 @@ class PathwaysModel(object):
          self.outputs.c_energy.columns = [energy_unit.upper()]
 
     def export_io(self):
+        """ writes the IO tables of the io_table_write_step years one year at a time. The tables of the demand sectors
+        sit on the diagonal of a block matrix with zeros across sectors. With io_table_format = stacked in
+        [output_detail], only the nonzero coefficients are written in long form (s_stacked_io.csv)
+        """
         io_table_write_step = int(cfg.cfgfile.get('output_detail','io_table_write_step'))
         io_table_years = sorted([min(cfg.supply_years)] + range(max(cfg.supply_years), min(cfg.supply_years), -io_table_write_step))
-        df_list = []
+        stacked = cfg.get_optional('output_detail', 'io_table_format', 'wide').lower() == 'stacked'
+        sectors = self.supply.demand_sectors
         for year in io_table_years:
-            sector_df_list = []
-            keys = self.supply.demand_sectors
-            name = ['sector']
-            for sector in self.supply.demand_sectors:
-                sector_df_list.append(self.supply.io_dict[year][sector])
-            year_df = pd.concat(sector_df_list, keys=keys,names=name)
-            year_df = pd.concat([year_df]*len(keys),keys=keys,names=name,axis=1)
-            df_list.append(year_df)
-        keys = io_table_years
-        name = ['year']
-        df = pd.concat(df_list,keys=keys,names=name)
-        for row_sector in self.supply.demand_sectors:
-            for col_sector in self.supply.demand_sectors:
-                if row_sector != col_sector:
-                    df.loc[util.level_specific_indexer(df,'sector',row_sector),util.level_specific_indexer(df,'sector',col_sector,axis=1)] = 0
-        self.supply.outputs.io = df
-        result_df = self.supply.outputs.return_cleaned_output('io')
-        keys = [self.scenario.name.upper(), cfg.timestamp]
-        names = ['SCENARIO','TIMESTAMP']
-        for key, name in zip(keys,names):
-            result_df = pd.concat([result_df], keys=[key],names=[name])
-        Output.write(result_df, 's_io.csv', os.path.join(cfg.workingdir, 'supply_outputs'))
-#        self.export_stacked_io()
+            tables = [self.supply.io_sparse(self.supply.io_dict[year][sector]) for sector in sectors]
+            if stacked:
+                self.export_stacked_io(year, tables)
+                continue
+            index, columns = tables[0][1], tables[0][2]
+            matrix = sparse.block_diag([table[0] for table in tables], format='csr')
+            df = pd.DataFrame(matrix.toarray(),
+                              index=util.index_product('year', [year], util.index_product('sector', sectors, index)),
+                              columns=util.index_product('sector', sectors, columns))
+            self._write_io_output(df, 'io', 's_io.csv')
+
+    def export_stacked_io(self, year, tables):
+        """ writes the nonzero coefficients of a year's IO tables, one row per input and output pair """
+        index, columns = tables[0][1], tables[0][2]
+        names = ['year', 'sector_input'] + [x + '_input' for x in index.names] + ['sector'] + list(columns.names)
+        arrays, values = [[] for name in names], []
+        for sector, (matrix, index, columns) in zip(self.supply.demand_sectors, tables):
+            coo = matrix.tocoo()
+            sector_arrays = [np.repeat(year, coo.nnz), np.repeat(sector, coo.nnz)]
+            sector_arrays += [np.asarray(index.get_level_values(i))[coo.row] for i in range(index.nlevels)]
+            sector_arrays += [np.repeat(sector, coo.nnz)]
+            sector_arrays += [np.asarray(columns.get_level_values(i))[coo.col] for i in range(columns.nlevels)]
+            for array_list, array in zip(arrays, sector_arrays):
+                array_list.append(array)
+            values.append(coo.data)
+        df = pd.DataFrame({'value': np.concatenate(values)},
+                          index=pd.MultiIndex.from_arrays([np.concatenate(a) for a in arrays], names=names))
+        self._write_io_output(df, 'stacked_io', 's_stacked_io.csv')
 
-    def export_stacked_io(self):
-        df = copy.deepcopy(self.supply.outputs.io)
-        df.index.names = [x + '_input'if x!= 'year' else x for x in df.index.names ]
-        df = df.stack(level=df.columns.names).to_frame()
-        df.columns = ['value']
-        self.supply.outputs.stacked_io = df
-        result_df = self.supply.outputs.return_cleaned_output('stacked_io')
-        keys = [self.scenario.name.upper(), cfg.timestamp]
-        names = ['SCENARIO','TIMESTAMP']
-        for key, name in zip(keys,names):
-            result_df = pd.concat([result_df], keys=[key],names=[name])
-        Output.write(result_df, 's_stacked_io.csv', os.path.join(cfg.workingdir, 'supply_outputs'))
+    def _write_io_output(self, df, output_name, file_name):
+        setattr(self.supply.outputs, output_name, df)
+        result_df = self.supply.outputs.return_cleaned_output(output_name)
+        # the tables are written as we go, so they are not kept with the other supply outputs
+        delattr(self.supply.outputs, output_name)
+        result_df = Output.add_run_levels(result_df, self.scenario.name)
+        Output.write(result_df, file_name, os.path.join(cfg.workingdir, 'supply_outputs'), partition=self.scenario.id)
@@ -605,6 +605,188 @@ class Rollover(object):
                 np.reshape(self._aggregate_tech_year_shape(self.replacement_sales)[slice2].T, shape2))
 
 
+def _round(x, decimals):
+    """ elementwise round half away from zero, as python's builtin round """
+    scale = 10. ** decimals
+    return np.sign(x) * np.floor(np.abs(x) * scale + .5) / scale
+
+
+def is_batchable(rollover):
+    """ a fresh rollover can run in a BatchRollover if it has no specified stock, sales or retirements, which are the
+    inputs that need the per group retirement adjustments in Rollover.update_prinxy
+    """
+    return (rollover.i == 0 and np.all(np.isnan(rollover.specified_stock)) and np.all(np.isnan(rollover.specified_sales))
+            and not np.any(rollover.specified_retirements > 0))
+
+
+def run_rollovers(rollovers):
+    """ runs a collection of fresh Rollover objects through all years, giving the same results as calling run() on
+    each of them. Rollovers that share markov matrices and dimensions are advanced together in a BatchRollover and the
+    rest are run one at a time
+    """
+    batches = {}
+    for rollover in rollovers:
+        if is_batchable(rollover):
+            key = (id(rollover.vintaged_markov_matrix), id(rollover.initial_markov_matrix), rollover.num_years,
+                   rollover.num_vintages, rollover.num_techs, rollover.spy, rollover.index_current_year)
+            batches.setdefault(key, []).append(rollover)
+        else:
+            rollover.run()
+    for batch in batches.values():
+        if len(batch) == 1:
+            batch[0].run()
+        else:
+            BatchRollover(batch).run()
+
+
+class BatchRollover(object):
+    """ Advances many rollover groups together. Every array of Rollover gets a leading group dimension and each step
+    is computed for all groups at once. Only groups without specified stock, sales or retirements are supported (see
+    is_batchable). A group that needs early retirements because its stock shrinks faster than natural rolloff, or
+    that would raise an error, is rerun on its own Rollover so that the same result or error is produced
+    """
+    def __init__(self, rollovers):
+        self.rollovers = rollovers
+        first = rollovers[0]
+        self.spy = first.spy
+        self.num_years, self.num_vintages, self.num_techs = first.num_years, first.num_vintages, first.num_techs
+        self.index_current_year = first.index_current_year
+        self.num_steps = self.num_years * self.spy
+        # the markov matrices are shared and every group has prinxy of zero
+        self.initial_remaining = first.initial_markov_matrix[:, :, 0]
+        self.vintaged_remaining = first.vintaged_markov_matrix[:, :, 0]
+        self.initial_stock = np.array([r.initial_stock for r in rollovers], dtype=float)
+        self.sales_share = np.array([r.sales_share for r in rollovers], dtype=float)
+        self.stock_changes = np.array([r.stock_changes for r in rollovers], dtype=float)
+        self.lifetimes = np.array([r.lifetimes for r in rollovers], dtype=float)
+
+        num_groups = len(rollovers)
+        self.stock = np.zeros((num_groups,) + first.stock.shape)
+        self.rolloff_record = np.zeros((num_groups, self.num_steps, self.num_techs))
+        self.natural_rolloff = np.zeros((num_groups, self.num_steps, self.num_techs))
+        self.sales_record = np.zeros((num_groups, self.num_steps, self.num_techs))
+        self.stock_replacement_allocations = []
+        self.stock_growth_allocations = []
+        # groups that are handed back to their own Rollover
+        self.fallback = np.zeros(num_groups, dtype=bool)
+
+    def calc_rolloff(self, i):
+        prior_initial = self.initial_stock if i == 0 else self.stock[:, :, 0, i - 1]
+        rolloff = prior_initial * (1 - self.initial_remaining[:, i])
+        if i > 0:
+            rolloff += np.sum(self.stock[:, :, 1:i + 1, i - 1] * (1 - self.vintaged_remaining[:, i - 1::-1]), axis=2)
+        return rolloff
+
+    def get_stock_from_last_nonzero_year(self, i):
+        prior_year_stock = self.initial_stock.copy()
+        if i == 0:
+            return prior_year_stock
+        stock_by_year = np.sum(self.stock[:, :, :i + 1, :i], axis=2)
+        nonzero = np.sum(stock_by_year, axis=1) > 0
+        found = np.any(nonzero, axis=1)
+        last_nonzero = i - 1 - np.argmax(nonzero[:, ::-1], axis=1)
+        prior_year_stock[found] = stock_by_year[found, :, last_nonzero[found]]
+        return prior_year_stock
+
+    def pick_allocation_option(self, eligible, i, step, rolloff, growth):
+        """ Rollover.pick_allocation_option for all groups, where eligible is a groups by techs mask """
+        rolloff = rolloff if i == step else self.natural_rolloff[:, i]
+        allocation = np.zeros(eligible.shape)
+        unresolved = np.ones(len(eligible), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # allocate by the stock that is rolling off
+            use = np.sum(rolloff * eligible, axis=1) != 0
+            temp = rolloff * self.lifetimes if growth else rolloff
+            allocation[use] = (temp * eligible / np.sum(temp * eligible, axis=1)[:, None])[use]
+            unresolved &= ~use
+            # placeholder because there are no new sales and no existing stock or only one technology
+            use = unresolved & ((self.stock_changes[:, i] == 0) | (np.sum(eligible, axis=1) == 1))
+            allocation[use] = (eligible / np.sum(eligible, axis=1, dtype=float)[:, None])[use]
+            unresolved &= ~use
+            if np.any(unresolved):
+                # information in the sales share
+                sales_share = self.sales_share[:, i]
+                sales_share_allocation = np.sum(sales_share, axis=2)
+                informative = ((np.trace(sales_share, axis1=1, axis2=2) != self.num_techs) | (np.sum(sales_share, axis=(1, 2)) != self.num_techs))
+                use = unresolved & informative & (np.sum(sales_share_allocation * eligible, axis=1) != 0)
+                allocation[use] = (sales_share_allocation * eligible / np.sum(sales_share_allocation * eligible, axis=1)[:, None])[use]
+                unresolved &= ~use
+            if np.any(unresolved):
+                # last year's stock ratio
+                prior_year_stock = self.get_stock_from_last_nonzero_year(i)
+                use = unresolved & (np.sum(prior_year_stock * eligible, axis=1) != 0)
+                temp = prior_year_stock * self.lifetimes if growth else prior_year_stock
+                allocation[use] = (temp * eligible / np.sum(temp * eligible, axis=1)[:, None])[use]
+                unresolved &= ~use
+                # no sales to allocate, otherwise there is no method for allocation and the group is rerun to raise the error
+                self.fallback |= unresolved & (np.sum(rolloff, axis=1) != 0)
+        return allocation
+
+    def set_final_stock_changes(self, i, prior_year_stock, rolloff, rolloff_summed):
+        eligible = prior_year_stock != 0
+        eligible[~np.any(eligible, axis=1)] = True
+
+        stock_replacement_allocation = self.pick_allocation_option(eligible, i, i, rolloff, growth=False)
+        stock_growth_allocation = self.pick_allocation_option(eligible, i, i, rolloff, growth=True)
+        # groups with a service demand modifier allocate growth based on the current year
+        modified = ~np.all(np.round(np.sum(self.sales_share[:, i], axis=1), 5) == 1, axis=1)
+        if np.any(modified):
+            current_year_allocation = self.pick_allocation_option(eligible, min(self.index_current_year, i), i, rolloff, growth=True)
+            stock_growth_allocation[modified] = current_year_allocation[modified]
+        self.stock_replacement_allocations.append(stock_replacement_allocation)
+        self.stock_growth_allocations.append(stock_growth_allocation)
+
+        sales_to_allocate = np.clip(self.stock_changes[:, i] + rolloff_summed, 0, None)
+        natural_replacements = np.minimum(rolloff_summed, sales_to_allocate)
+        stock_growth = sales_to_allocate - natural_replacements
+        growth_allocation = np.where((natural_replacements < 0)[:, None], stock_replacement_allocation, stock_growth_allocation)
+        replacements_by_tech = np.einsum('gtu,gu->gt', self.sales_share[:, i], natural_replacements[:, None] * stock_replacement_allocation)
+        growth_by_tech = np.einsum('gtu,gu->gt', self.sales_share[:, i], stock_growth[:, None] * growth_allocation)
+        solveable_by_tech = replacements_by_tech + growth_by_tech
+        # Rollover raises an error for negative stock changes
+        self.fallback |= np.min(solveable_by_tech, axis=1) < (-0.0001 * rolloff_summed)
+        return np.clip(solveable_by_tech, 0, None)
+
+    def run(self):
+        for i in range(self.num_steps):
+            prior_year_stock = self.initial_stock if i == 0 else np.sum(self.stock[:, :, :i + 1, i - 1], axis=2)
+            rolloff = self.calc_rolloff(i)
+            rolloff_summed = np.sum(rolloff, axis=1)
+            self.natural_rolloff[:, i] = rolloff
+            # shrinking stock needs early retirements, which are solved per group
+            self.fallback |= _round(self.stock_changes[:, i], 6) < _round(-rolloff_summed, 6)
+
+            stock_change_by_tech = self.set_final_stock_changes(i, prior_year_stock, rolloff, rolloff_summed)
+
+            prior_initial = self.initial_stock if i == 0 else self.stock[:, :, 0, i - 1]
+            self.stock[:, :, 0, i] = prior_initial * self.initial_remaining[:, i]
+            if i > 0:
+                self.stock[:, :, 1:i + 1, i] = self.stock[:, :, 1:i + 1, i - 1] * self.vintaged_remaining[:, i - 1::-1]
+            self.stock[:, :, i + 1, i] = stock_change_by_tech
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sales_by_tech = stock_change_by_tech / self.vintaged_remaining[:, 0]
+            sales_by_tech[np.isinf(sales_by_tech)] = 0
+            self.sales_record[:, i] = sales_by_tech
+            self.rolloff_record[:, i] = rolloff
+
+        list_steps = range(self.num_steps)
+        for g, rollover in enumerate(self.rollovers):
+            if self.fallback[g]:
+                rollover.run()
+                continue
+            rollover.stock = self.stock[g]
+            rollover.natural_rolloff = self.natural_rolloff[g]
+            rollover.rolloff_record = self.rolloff_record[g]
+            rollover.sales_record = self.sales_record[g]
+            rollover.stock_replacement_allocations = [allocation[g] for allocation in self.stock_replacement_allocations]
+            rollover.stock_growth_allocations = [allocation[g] for allocation in self.stock_growth_allocations]
+            if list_steps:
+                rollover.check_outputs()
+                rollover.calculate_outputs(list_steps)
+                rollover.i = min(self.num_years, self.num_steps)
+
+
 # setup
 # def create_markov_matrix(markov, num_techs, num_years):
 # markov_matrix = np.zeros((num_techs, num_years+1, num_years))
@@ -12,12 +12,15 @@ import os
 import glob
 import cPickle as pickle
 import psycopg2
+from collections import OrderedDict
+from multiprocessing import Process
 import energyPATHWAYS.config as cfg
 import energyPATHWAYS.util as util
 from energyPATHWAYS.pathways_model import PathwaysModel
 import energyPATHWAYS.shape as shape
 from energyPATHWAYS.outputs import Output
 from energyPATHWAYS.dispatch_classes import Dispatch
+from energyPATHWAYS.scenario_loader import Scenario
 import time
 import datetime
 import logging
@@ -80,6 +83,7 @@ signal.signal(signal.SIGTERM, signal_handler)
 @click.option('-ls', '--load_supply/--no_load_supply', default=False, help='Load a cached model with the demand and supply side complete.')
 @click.option('--solve_supply/--no_solve_supply', default=True, help='Solve the supply side of the model.')
 @click.option('--load_error/--no_load_error', default=False, help='Load the error pickle of a previous model run that crashed.')
+@click.option('-rs', '--resume_supply/--no_resume_supply', default=False, help='Resume the supply side from the last year completed by a previous model run that crashed.')
 @click.option('--export_results/--no_export_results', default=True, help='Write results from the demand and supply sides of the model.')
 @click.option('--pickle_shapes/--no_pickle_shapes', default=True, help='Cache shapes after processing.')
 @click.option('--save_models/--no_save_models', default=True, help='Cache models after running.')
@@ -87,16 +91,24 @@ signal.signal(signal.SIGTERM, signal_handler)
 @click.option('-a', '--api_run/--no_api_run', default=False)
 @click.option('-d', '--debug/--no_debug', default=False, help='On error the model will exit into an ipython debugger.')
 @click.option('--clear_results/--no_clear_results', default=False, help='Should results be cleared or appended when starting a new model run')
-def click_run(path, config, scenario, load_demand, solve_demand, load_supply, solve_supply, load_error, export_results, pickle_shapes, save_models, log_name, api_run, debug, clear_results):
+@click.option('--merge_outputs/--no_merge_outputs', default=True, help='With the partitioned output_writer, merge the output chunks of the scenarios in this run into single files at the end of the run.')
+@click.option('--merge_only/--no_merge_only', default=False, help='Only merge the partitioned output chunks in the working directory, for the given scenarios or for all of them if none are specified, without running the model.')
+@click.option('--share_demand/--no_share_demand', default=False, help='Solve the demand side once for each group of scenarios with the same demand measures and sensitivities and run the supply side of every scenario in the group from it.')
+@click.option('--batch_processes', default=1, type=int, help='With share_demand, the number of scenario supply runs to run in parallel processes. Parallel runs always use the partitioned output_writer.')
+def click_run(path, config, scenario, load_demand, solve_demand, load_supply, solve_supply, load_error, resume_supply, export_results, pickle_shapes, save_models, log_name, api_run, debug, clear_results, merge_outputs, merge_only, share_demand, batch_processes):
+    if merge_only:
+        merge(path, config, scenario, log_name)
+        return
     if debug:
         import ipdb
         with ipdb.launch_ipdb_on_exception():
-            run(path, config, scenario, load_demand, solve_demand, load_supply, solve_supply, load_error, export_results, pickle_shapes, save_models, log_name, api_run, clear_results)
+            run(path, config, scenario, load_demand, solve_demand, load_supply, solve_supply, load_error, export_results, pickle_shapes, save_models, log_name, api_run, clear_results, resume_supply, merge_outputs, share_demand, batch_processes)
     else:
-        run(path, config, scenario, load_demand, solve_demand, load_supply, solve_supply, load_error, export_results, pickle_shapes, save_models, log_name, api_run, clear_results)
+        run(path, config, scenario, load_demand, solve_demand, load_supply, solve_supply, load_error, export_results, pickle_shapes, save_models, log_name, api_run, clear_results, resume_supply, merge_outputs, share_demand, batch_processes)
 
 def run(path, config, scenario_ids, load_demand=False, solve_demand=True, load_supply=False, solve_supply=True, load_error=False,
-        export_results=True, pickle_shapes=True, save_models=True, log_name=None, api_run=False, clear_results=False):
+        export_results=True, pickle_shapes=True, save_models=True, log_name=None, api_run=False, clear_results=False, resume_supply=False,
+        merge_outputs=True, share_demand=False, batch_processes=1):
     global model
     cfg.initialize_config(path, config, log_name)
     cfg.geo.log_geo()
@@ -112,49 +124,159 @@ def run(path, config, scenario_ids, load_demand=False, solve_demand=True, load_s
     scenario_ids = [os.path.splitext(s)[0] for s in scenario_ids]
 
     logging.info('Scenario run list: {}'.format(', '.join(scenario_ids)))
-    for scenario_id in scenario_ids:
-        scenario_start_time = time.time()
-        logging.info('Starting scenario {}'.format(scenario_id))
-        logging.info('Start time {}'.format(str(datetime.datetime.now()).split('.')[0]))
-        if api_run:
-            # FIXME: This will be broken since we changed the scenario list from a list of database ids to a list of
-            # filenames. The API-related code will need to be updated before we can update the server with newer
-            # model code.
-            util.update_status(scenario_id, 3)
-            scenario_name = util.scenario_name(scenario_id)
-            subject = 'Now running: EnergyPathways scenario "%s"' % (scenario_name,)
-            body = 'EnergyPathways is now running your scenario titled "%s". A scenario run generally ' \
-                   'finishes within a few hours, and you will receive another email when your run is complete. ' \
-                   'If more than 24 hours pass without you receiving a confirmation email, please log in to ' \
-                   'https://energypathways.com to check the status of the run. ' \
-                   'If the run is not complete, please reply to this email and we will investigate.' % (scenario_name,)
-            send_gmail(scenario_id, subject, body)
-
-        model = load_model(load_demand, load_supply, load_error, scenario_id, api_run)
-        if not load_error:
-            model.run(scenario_id,
-                      solve_demand=solve_demand,
-                      solve_supply=solve_supply,
-                      load_demand=load_demand,
-                      load_supply=load_supply,
-                      export_results=export_results,
-                      save_models=save_models,
-                      append_results=False if (scenario_id == scenario_ids[0] and clear_results) else True)
-
-        if api_run:
-            util.update_status(scenario_id, 4)
-            subject = 'Completed: EnergyPathways scenario "%s"' % (scenario_name,)
-            body = 'EnergyPathways has completed running your scenario titled "%s". ' \
-                   'Please return to https://energypathways.com to view your results.' % (scenario_name,)
-            send_gmail(scenario_id, subject, body)
-
-        logging.info('EnergyPATHWAYS run for scenario_id {} successful!'.format(scenario_id))
-        logging.info('Scenario calculation time {}'.format(str(datetime.timedelta(seconds=time.time() - scenario_start_time)).split('.')[0]))
+    if share_demand and api_run:
+        raise ValueError('share_demand does not update the run status of api runs')
+    if share_demand and solve_demand and solve_supply and not (load_demand or load_supply or load_error or resume_supply):
+        run_batch(scenario_ids, export_results, save_models, api_run, clear_results, batch_processes)
+    else:
+        for scenario_id in scenario_ids:
+            scenario_start_time = time.time()
+            logging.info('Starting scenario {}'.format(scenario_id))
+            logging.info('Start time {}'.format(str(datetime.datetime.now()).split('.')[0]))
+            if api_run:
+                # FIXME: This will be broken since we changed the scenario list from a list of database ids to a list of
+                # filenames. The API-related code will need to be updated before we can update the server with newer
+                # model code.
+                util.update_status(scenario_id, 3)
+                scenario_name = util.scenario_name(scenario_id)
+                subject = 'Now running: EnergyPathways scenario "%s"' % (scenario_name,)
+                body = 'EnergyPathways is now running your scenario titled "%s". A scenario run generally ' \
+                       'finishes within a few hours, and you will receive another email when your run is complete. ' \
+                       'If more than 24 hours pass without you receiving a confirmation email, please log in to ' \
+                       'https://energypathways.com to check the status of the run. ' \
+                       'If the run is not complete, please reply to this email and we will investigate.' % (scenario_name,)
+                send_gmail(scenario_id, subject, body)
+
+            model = load_model(load_demand, load_supply, load_error, scenario_id, api_run, resume_supply)
+            if not load_error:
+                model.run(scenario_id,
+                          solve_demand=solve_demand,
+                          solve_supply=solve_supply,
+                          load_demand=load_demand,
+                          load_supply=load_supply,
+                          export_results=export_results,
+                          save_models=save_models,
+                          append_results=False if (scenario_id == scenario_ids[0] and clear_results) else True,
+                          resume_supply=resume_supply)
+
+            if api_run:
+                util.update_status(scenario_id, 4)
+                subject = 'Completed: EnergyPathways scenario "%s"' % (scenario_name,)
+                body = 'EnergyPathways has completed running your scenario titled "%s". ' \
+                       'Please return to https://energypathways.com to view your results.' % (scenario_name,)
+                send_gmail(scenario_id, subject, body)
+
+            logging.info('EnergyPATHWAYS run for scenario_id {} successful!'.format(scenario_id))
+            logging.info('Scenario calculation time {}'.format(str(datetime.timedelta(seconds=time.time() - scenario_start_time)).split('.')[0]))
+    if cfg.output_writer == 'partitioned' and merge_outputs:
+        logging.info('Merging partitioned outputs')
+        Output.merge_partitions(cfg.workingdir, scenario_ids)
     logging.info('Total calculation time {}'.format(str(datetime.timedelta(seconds=time.time() - run_start_time)).split('.')[0]))
     logging.shutdown()
     logging.getLogger(None).handlers = [] # necessary to totally flush the logger
 
-def load_model(load_demand, load_supply, load_error, scenario_id, api_run):
+def merge(path, config, scenario_ids, log_name=None):
+    """ merges the partitioned output chunks of scenario_ids, or of every scenario if none are given """
+    cfg.initialize_config(path, config, log_name)
+    partitions = [os.path.splitext(s)[0] for s in scenario_ids] if scenario_ids else None
+    logging.info('Merging partitioned outputs')
+    Output.merge_partitions(cfg.workingdir, partitions)
+    logging.shutdown()
+    logging.getLogger(None).handlers = []
+
+def run_batch(scenario_ids, export_results, save_models, api_run, clear_results, processes=1):
+    """
+    Runs scenarios that differ only on the supply side from a shared demand. Scenarios are grouped by the fingerprint
+    of their demand-side inputs, the demand is solved once per group, and the supply side of each scenario is then run
+    from its group's demand, in up to processes parallel processes.
+    """
+    groups = OrderedDict()
+    for scenario_id in scenario_ids:
+        groups.setdefault(Scenario(scenario_id).demand_fingerprint(), []).append(scenario_id)
+    logging.info('{} scenarios share {} demand solves'.format(len(scenario_ids), len(groups)))
+
+    demand_files = {}
+    try:
+        for fingerprint, group in groups.items():
+            demand_start_time = time.time()
+            logging.info('Solving demand for scenarios {}'.format(', '.join(group)))
+            demand_model = PathwaysModel(group[0], api_run)
+            demand_model.run(group[0], solve_demand=True, solve_supply=False, load_demand=False, load_supply=False,
+                             export_results=False, save_models=False,
+                             append_results=False if (not demand_files and clear_results) else True)
+            demand_files[fingerprint] = 'demand_' + fingerprint[:12] + cfg.demand_model_append_name
+            Output.pickle(demand_model, file_name=demand_files[fingerprint], path=cfg.workingdir)
+            logging.info('Demand calculation time {}'.format(str(datetime.timedelta(seconds=time.time() - demand_start_time)).split('.')[0]))
+        del demand_model
+
+        runs = [(demand_files[fingerprint], scenario_id) for fingerprint, group in groups.items() for scenario_id in group]
+        if processes > 1:
+            # parallel scenarios can't append to the same csv files, so each one writes its own partitions
+            cfg.output_writer = 'partitioned'
+            failed = run_shared_demand_processes(runs, export_results, save_models, api_run, processes)
+            if failed:
+                raise ValueError('Scenarios {} failed, see the log for details'.format(', '.join(failed)))
+        else:
+            for demand_file, scenario_id in runs:
+                run_shared_demand(demand_file, scenario_id, export_results, save_models, api_run)
+    finally:
+        for demand_file in demand_files.values():
+            if os.path.isfile(os.path.join(cfg.workingdir, demand_file)):
+                os.remove(os.path.join(cfg.workingdir, demand_file))
+
+def run_shared_demand(demand_file, scenario_id, export_results, save_models, api_run):
+    global model
+    scenario_start_time = time.time()
+    logging.info('Starting scenario {} from shared demand {}'.format(scenario_id, demand_file))
+    with open(os.path.join(cfg.workingdir, demand_file), 'rb') as infile:
+        model = pickle.load(infile)
+    model.scenario_id, model.api_run = scenario_id, api_run
+    model.run(scenario_id, solve_demand=False, solve_supply=True, load_demand=True, load_supply=False,
+              export_results=export_results, save_models=save_models, append_results=True)
+    logging.info('EnergyPATHWAYS run for scenario_id {} successful!'.format(scenario_id))
+    logging.info('Scenario calculation time {}'.format(str(datetime.timedelta(seconds=time.time() - scenario_start_time)).split('.')[0]))
+
+def run_shared_demand_process(workingdir, cfgfile_name, log_name, timestamp, output_writer, demand_file, scenario_id,
+                              export_results, save_models, api_run):
+    # the child sets up config and shapes itself like the pool workers (see helper_multiprocess._initialize_worker), as
+    # nothing is inherited when processes are spawned rather than forked
+    cfg.initialize_config(workingdir, cfgfile_name, log_name)
+    # outputs of the batch share the parent's timestamp and writer
+    cfg.timestamp, cfg.output_writer = timestamp, output_writer
+    shape.init_shapes(pickle_shapes=False)
+    # the parent's handlers exit with 0, which would hide an interrupted scenario from run_shared_demand_processes
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    run_shared_demand(demand_file, scenario_id, export_results, save_models, api_run)
+
+def run_shared_demand_processes(runs, export_results, save_models, api_run, processes):
+    """
+    Runs each (demand_file, scenario_id) in its own process, with at most processes running at once, and returns the
+    scenario ids whose process failed. Plain processes are used rather than a pool because each scenario starts its own
+    worker pool when parallel_process is on, which pool workers are not allowed to do.
+    """
+    cfg.cur.close()
+    running, failed = [], []
+    try:
+        for demand_file, scenario_id in runs:
+            while len(running) >= processes:
+                time.sleep(1)
+                failed += [p.name for p in running if not p.is_alive() and p.exitcode]
+                running = [p for p in running if p.is_alive()]
+            process = Process(target=run_shared_demand_process, name=scenario_id,
+                              args=(cfg.workingdir, cfg.cfgfile_name, cfg.log_name, cfg.timestamp, cfg.output_writer,
+                                    demand_file, scenario_id, export_results, save_models, api_run))
+            process.start()
+            running.append(process)
+        for process in running:
+            process.join()
+            if process.exitcode:
+                failed.append(process.name)
+    finally:
+        cfg.init_db()
+    return failed
+
+def load_model(load_demand, load_supply, load_error, scenario_id, api_run, resume_supply=False):
     # Note that the api_run parameter is effectively ignored if you are loading a previously pickled model
     # (with load_supply or load_demand); the model's api_run property will be set to whatever it was when the model
     # was pickled.
@@ -163,6 +285,16 @@ def load_model(load_demand, load_supply, load_error, scenario_id, api_run):
 #        with open(os.path.join(cfg.workingdir, 'dispatch_class.p'), 'rb') as infile:
             model = pickle.load(infile)
         logging.info('Loaded crashed EnergyPATHWAYS model from pickle')
+    elif resume_supply:
+        checkpoint_file = os.path.join(cfg.workingdir, str(scenario_id) + cfg.supply_checkpoint_append_name)
+        if not os.path.isfile(checkpoint_file) and os.path.isfile(checkpoint_file + '.old'):
+            # the run crashed while replacing the checkpoint on Windows
+            checkpoint_file += '.old'
+        if not os.path.isfile(checkpoint_file):
+            raise ValueError('No supply checkpoint exists for scenario {}'.format(scenario_id))
+        with open(checkpoint_file, 'rb') as infile:
+            model = pickle.load(infile)
+        logging.info('Loaded EnergyPATHWAYS model from the supply checkpoint after {}'.format(max(model.supply.calculated_years)))
     elif load_supply:
         with open(os.path.join(cfg.workingdir, str(scenario_id) + cfg.full_model_append_name), 'rb') as infile:
             model = pickle.load(infile)
@@ -2,8 +2,10 @@ import json
 import os
 import logging
 import itertools
+import hashlib
 from collections import defaultdict
 import config as cfg
+import util
 import pdb
 
 
@@ -27,6 +29,10 @@ class Scenario():
     PARENT_COLUMN_NAMES = ('parent_id', 'subsector_id', 'supply_node_id', 'primary_node_id', 'import_node_id',
                            'demand_tech_id', 'demand_technology_id', 'supply_tech_id', 'supply_technology_id')
 
+    # Sensitivities for tables starting with these only change the supply side; any other table is assumed to be
+    # read by the demand side when scenarios are compared by demand_fingerprint
+    SUPPLY_TABLE_PREFIXES = ('Supply', 'Import', 'Primary', 'BlendNode', 'Dispatch', 'Transmission', 'CO2')
+
     def __init__(self, scenario_id):
         self._id = scenario_id
         self._bucket_lookup = self._load_bucket_lookup()
@@ -81,12 +87,7 @@ class Scenario():
         if data_table in ('SupplySalesData', 'SupplySalesShareData'):
             return 'supply_technology_id'
 
-        cfg.cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = %s
-        """, (data_table,))
-
-        cols = [row[0] for row in cfg.cur]
+        cols = util.sql_read_headers(data_table)
         if not cols:
             raise ValueError("Could not find any columns for table {}. Did you misspell the table "
                              "name?".format(data_table))
@@ -202,6 +203,21 @@ class Scenario():
             logging.debug("Sensitivity '{}' loaded for {} with parent id {}.".format(sensitivity, table, parent_id))
         return sensitivity
 
+    def demand_fingerprint(self):
+        """
+        Returns a hash of the scenario's demand measures and of the sensitivities that can change the demand side.
+        Scenarios with the same fingerprint solve to the same demand, so they can share one demand solve.
+        """
+        demand_measures = sorted((category, sorted(measure_ids)) for category, measure_ids in self.all_measure_ids_by_category().iteritems()
+                                 if category.startswith('Demand') and measure_ids)
+        sensitivities = sorted((table, sorted(sensitivities.items())) for table, sensitivities in self._sensitivities.iteritems()
+                               if not table.startswith(self.SUPPLY_TABLE_PREFIXES) and sensitivities)
+        return hashlib.sha1(repr((demand_measures, sensitivities))).hexdigest()
+
+    @property
+    def id(self):
+        return self._id
+
     @property
     def name(self):
         return self._name
@@ -51,6 +51,7 @@ class Shapes(object):
         self._geography_check = None
         self._timespan_check = None
         self._version = version
+        self._fingerprints = {}
 
     def create_empty_shapes(self):
         """ This should be called first as it creates a record of all of the shapes that are in the database."""
@@ -58,28 +59,35 @@ class Shapes(object):
             self.data[id] = Shape(id)
             self.active_shape_ids.append(id)
 
-    def initiate_active_shapes(self):
+    def initiate_active_shapes(self, ids=None):
+        """ reads the data for the shapes in ids (all active shapes by default) and sets the active dates """
         logging.info(' reading data for:')
+        ids = self.active_shape_ids if ids is None else ids
 
         if cfg.cfgfile.get('case', 'parallel_process').lower() == 'true':
-            shapes = helper_multiprocess.safe_pool(helper_multiprocess.shapes_populate, self.data.values())
-            self.data = dict(zip(self.data.keys(), shapes))
+            shapes = helper_multiprocess.safe_pool(helper_multiprocess.shapes_populate, [self.data[id] for id in ids])
+            self.data.update(dict(zip(ids, shapes)))
         else:
-            for id in self.active_shape_ids:
+            for id in ids:
                 shape = self.data[id]
                 logging.info('    shape: ' + shape.name)
                 if hasattr(shape, 'raw_values'):
                     return
                 shape.read_timeseries_data()
 
-        for id in self.active_shape_ids:
+        for id in ids:
             shape = self.data[id]
             if shape.shape_type=='weather date':
                 shape.convert_index_to_datetime('raw_values', 'weather_datetime')
                 date_position = util.position_in_index(shape.raw_values, 'weather_datetime')
                 
                 shape.start_date, shape.end_date = min(shape.raw_values.index.levels[date_position]), max(shape.raw_values.index.levels[date_position])
-                
+
+        # shapes that were not read keep the dates they were processed with
+        self.start_date, self.end_date = None, None
+        for id in self.active_shape_ids:
+            shape = self.data[id]
+            if shape.shape_type=='weather date':
                 self.start_date = shape.start_date if self.start_date is None else max(shape.start_date, self.start_date)
                 self.end_date = shape.end_date if self.end_date is None else min(shape.end_date, self.end_date)
         self.set_active_dates()
@@ -126,15 +134,16 @@ class Shapes(object):
             self.data[id].active_dates_index = self.active_dates_index
             self.data[id].time_slice_elements = self.time_slice_elements
 
-    def process_active_shapes(self):
+    def process_active_shapes(self, ids=None):
         #run the weather date shapes first because they inform the daterange for dispatch
         logging.info(' mapping data for:')
+        ids = self.active_shape_ids if ids is None else ids
         
         if cfg.cfgfile.get('case','parallel_process').lower() == 'true':
-            shapes = helper_multiprocess.safe_pool(helper_multiprocess.process_shapes, self.data.values())
-            self.data = dict(zip(self.data.keys(), shapes))
+            shapes = helper_multiprocess.safe_pool(helper_multiprocess.process_shapes, [self.data[id] for id in ids])
+            self.data.update(dict(zip(ids, shapes)))
         else:
-            for id in self.active_shape_ids:
+            for id in ids:
                 self.data[id].process_shape()
         
         dispatch_outputs_timezone_id = int(cfg.cfgfile.get('case', 'dispatch_outputs_timezone_id'))
@@ -144,6 +153,28 @@ class Shapes(object):
         self._geography_check = (cfg.primary_geography_id, tuple(sorted(cfg.primary_subset_id)), tuple(cfg.breakout_geography_id))
         self._timespan_check = (cfg.shape_start_date, cfg.shape_years)
     
+    def refresh_shapes(self, fingerprints):
+        """ reads and processes again only the shapes whose fingerprint has changed since they were stored.
+        Returns the ids of the refreshed shapes, or None if every shape must be rerun because a shape was removed or the
+        active dates have moved
+        """
+        if any([id not in fingerprints for id in self.active_shape_ids]):
+            return None
+        changed_ids = [id for id in sorted(fingerprints) if self._fingerprints.get(id) != fingerprints[id]]
+        if changed_ids:
+            logging.info('Processing changed shapes')
+            active_dates = (self.start_date, self.end_date)
+            for id in changed_ids:
+                self.data[id] = Shape(id)
+                if id not in self.active_shape_ids:
+                    self.active_shape_ids.append(id)
+            self.initiate_active_shapes(changed_ids)
+            if (self.start_date, self.end_date) != active_dates:
+                return None
+            self.process_active_shapes(changed_ids)
+        self._fingerprints = fingerprints
+        return changed_ids
+
     @staticmethod
     def create_time_slice_elements(active_dates_index):
         business_days = pd.bdate_range(active_dates_index[0].date(), active_dates_index[-1].date())
@@ -162,10 +193,79 @@ class Shapes(object):
         assert 'weather_datetime' in index.names
         flat_shape = util.empty_df(fill_value=1., index=index, columns=[column])
         group_to_normalize = [n for n in flat_shape.index.names if n!='weather_datetime']
-        flat_shape = flat_shape.groupby(level=group_to_normalize).transform(lambda x: x / x.sum())*self.num_active_years
+        flat_shape = flat_shape / flat_shape.groupby(level=group_to_normalize).transform('sum') * self.num_active_years
         return flat_shape
 
+class ShapeStore(object):
+    """ Columnar on disk store of processed shapes. The values of each shape are saved as .npy arrays that are memory
+    mapped and only read when the shape's values are first used, and a small manifest pickles everything else
+    """
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.p')
+
+    def _file(self, id, name):
+        return os.path.join(self.path, '{}_{}'.format(id, name))
+
+    def _replace(self, file_name, save_function):
+        # write to a new file and swap it in, as the old file may still be memory mapped
+        temp_name = file_name + '.tmp'
+        with open(temp_name, 'wb') as outfile:
+            save_function(outfile)
+        try:
+            os.rename(temp_name, file_name)
+        except OSError:
+            os.remove(file_name)
+            os.rename(temp_name, file_name)
+
+    def load(self):
+        if not os.path.isfile(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'rb') as infile:
+            return pickle.load(infile)
+
+    def save(self, shapes, ids=None):
+        """ saves the values of the shapes in ids (all active shapes by default) and the manifest """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for id in (shapes.active_shape_ids if ids is None else ids):
+            self.save_values(id, shapes.data[id].values)
+        # values are left out of the manifest and read back from the store when they are needed
+        values = dict([(id, shape.__dict__.pop('values')) for id, shape in shapes.data.items() if 'values' in shape.__dict__])
+        try:
+            for shape in shapes.data.values():
+                shape._store_path = self.path
+            self._replace(self.manifest_path, lambda outfile: pickle.dump(shapes, outfile, pickle.HIGHEST_PROTOCOL))
+        finally:
+            for id, value in values.items():
+                shapes.data[id].values = value
+
+    def save_values(self, id, df):
+        self._replace(self._file(id, 'values.npy'), lambda outfile: np.save(outfile, np.ascontiguousarray(df.values)))
+        if isinstance(df.index, pd.MultiIndex):
+            self._replace(self._file(id, 'labels.npy'), lambda outfile: np.save(outfile, np.array([np.asarray(l) for l in df.index.labels])))
+            index_info = (list(df.index.levels), list(df.index.names), df.columns)
+        else:
+            index_info = (df.index, None, df.columns)
+        self._replace(self._file(id, 'index.p'), lambda outfile: pickle.dump(index_info, outfile, pickle.HIGHEST_PROTOCOL))
+
+    def load_values(self, id):
+        with open(self._file(id, 'index.p'), 'rb') as infile:
+            levels, names, columns = pickle.load(infile)
+        # copy on write maps let processes share the pages of a shape until one of them changes it
+        values = np.load(self._file(id, 'values.npy'), mmap_mode='c')
+        if names is None:
+            index = levels
+        else:
+            labels = np.load(self._file(id, 'labels.npy'), mmap_mode='c')
+            index = pd.MultiIndex(levels=levels, labels=list(labels), names=names, verify_integrity=False)
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
 class Shape(dmf.DataMapFunctions):    
+    # ShapesData holds hourly weather data, so each shape reads only its own rows
+    prefetch_data = False
+
     def __init__(self, id):
         self.id = id
         self.sql_id_table = 'Shapes'
@@ -178,6 +278,13 @@ class Shape(dmf.DataMapFunctions):
         self.cfgfile_name = cfg.cfgfile_name
         self.log_name = cfg.log_name
 
+    def __getattr__(self, name):
+        # shapes loaded from a ShapeStore read their values from it the first time they are used
+        if name == 'values' and '_store_path' in self.__dict__:
+            self.values = ShapeStore(self._store_path).load_values(self.id)
+            return self.values
+        raise AttributeError(name)
+
     def create_empty_shape_data(self):
         self._active_time_keys = [ind for ind in self.raw_values.index.names if ind in cfg.time_slice_col]
         self._active_time_dict = dict([(ind, loc) for loc, ind in enumerate(self.raw_values.index.names) if ind in cfg.time_slice_col])
@@ -213,29 +320,29 @@ class Shape(dmf.DataMapFunctions):
         
         if self.shape_type=='weather date':
             self.values = util.reindex_df_level_with_new_elements(self.raw_values, 'weather_datetime', self.active_dates_index)
-            self.values  = self.values.replace(np.nan,0)# this step is slow, consider replacing
+            self.values = self.values.fillna(0)
             if self.values.isnull().values.any():
                 raise ValueError('Weather data for shape {} did not give full coverage of the active dates'.format(self.name))
 
         elif self.shape_type=='time slice':
             self.values = self.create_empty_shape_data()
+            keys = self._non_time_keys + self._active_time_keys
             
-            non_time_elements_in_levels = [list(util.get_elements_from_level(self.values, e)) for e in self._non_time_keys]
-            time_elements_in_levels = [list(util.get_elements_from_level(self.values, e)) for e in self._active_time_keys]
+            # each hour picks up the value of its time slice with a single merge on the non time and time slice keys
+            slices = self.raw_values.iloc[:, :1].reset_index()
+            slices.columns = list(slices.columns[:-1]) + ['value']
+            # when an input row is repeated, the last one wins
+            slices = slices[~slices.duplicated(subset=keys, keep='last')]
+            hours = self.values.reset_index()[keys + ['weather_datetime']]
+            hours = pd.merge(hours, slices, how='left', on=keys)
             
-            for ind, value in self.raw_values.iterrows():
-                non_time_portion = [ind[self._non_time_dict[e]] for e in self._non_time_keys]
-                time_portion = [ind[self._active_time_dict[e]] for e in self._active_time_keys]
-                if not np.all([s in l for s, l in zip(non_time_portion+time_portion, non_time_elements_in_levels+time_elements_in_levels)]):
-                    continue
-                
-                indexer = tuple(non_time_portion + time_portion + [slice(None)])
-                                
-                if self.shape_unit_type=='energy':
-                    len_slice = len(self.values.loc[indexer])
-                    self.values.loc[indexer] = value[0]/float(len_slice)*self.num_active_years
-                elif self.shape_unit_type=='power':
-                    self.values.loc[indexer] = value[0]
+            if self.shape_unit_type=='energy':
+                # energy in a slice is spread evenly over the hours in that slice
+                hours_in_slice = hours.groupby(keys)['weather_datetime'].transform('count')
+                hours['value'] = hours['value'] / hours_in_slice.astype(float) * self.num_active_years
+            elif self.shape_unit_type!='power':
+                hours['value'] = np.NaN
+            self.values = hours.set_index(keys + ['weather_datetime']).sort()
             
             if self.values.isnull().values.any():
                 raise ValueError('Shape time slice data did not give full coverage of the active dates')
@@ -268,14 +375,14 @@ class Shape(dmf.DataMapFunctions):
             normalization_factors = combined_map_df.groupby(level=cfg.primary_geography).sum()
             self.values = util.DfOper.divi((self.values, normalization_factors))
             
-            temp = self.values.groupby(level=group_to_normalize).transform(lambda x: x / x.sum())*self.num_active_years
+            temp = self.values / self.values.groupby(level=group_to_normalize).transform('sum') * self.num_active_years
             # TODO: 2, and 3 should not be hard coded here, they represent p_min and p_max
             indexer = util.level_specific_indexer(temp, 'dispatch_constraint', [[2,3]])
             temp.loc[indexer, :] = self.values.loc[indexer, :]
             
             self.values = temp
         else:
-            self.values = self.values.groupby(level=group_to_normalize).transform(lambda x: x / x.sum())*self.num_active_years        
+            self.values = self.values / self.values.groupby(level=group_to_normalize).transform('sum') * self.num_active_years
 
     def geomap_to_time_zone(self, attr='values', inplace=True):
         """ maps a dataframe to another geography using relational GeographyMapdatabase table
@@ -456,23 +563,41 @@ force_rerun_shapes = False
 version = 4 #change this when you need to force users to rerun shapes
 shapes = Shapes()
 
+def shape_fingerprints():
+    """ a fingerprint of the inputs of every shape, made from its row in Shapes and the count and sum of the hashes of
+    its rows in ShapesData, so that a change to one shape only invalidates that shape in the ShapeStore. Each row is
+    hashed with its id, so moving values between rows changes the sum too
+    """
+    cfg.cur.execute('SELECT parent_id, COUNT(*), SUM(hashtext(data::text)::bigint) FROM "ShapesData" AS data GROUP BY parent_id;')
+    data_summaries = dict([(row[0], tuple(row[1:])) for row in cfg.cur.fetchall()])
+    cfg.cur.execute('SELECT * FROM "Shapes";')
+    id_position = [column[0] for column in cfg.cur.description].index('id')
+    return dict([(row[id_position], (tuple(row), data_summaries.get(row[id_position]))) for row in cfg.cur.fetchall()])
+
 def init_shapes(pickle_shapes=True):
     global shapes
-    if os.path.isfile(os.path.join(cfg.workingdir, '{}_shapes.p'.format(cfg.primary_geography))):
+    store = ShapeStore(os.path.join(cfg.workingdir, '{}_shapes'.format(cfg.primary_geography)))
+    stored_shapes = store.load()
+    if stored_shapes is not None:
         logging.info('Loading shapes')
-        with open(os.path.join(cfg.workingdir, '{}_shapes.p'.format(cfg.primary_geography)), 'rb') as infile:
-            shapes = pickle.load(infile)
+        shapes = stored_shapes
     
     geography_check = (cfg.primary_geography_id, tuple(sorted(cfg.primary_subset_id)), tuple(cfg.breakout_geography_id))
     timespan_check = (cfg.shape_start_date, cfg.shape_years)
+    fingerprints = shape_fingerprints()
+    stored_fingerprints = shapes._fingerprints
     if (shapes._version != version) or (shapes._geography_check != geography_check) or (shapes._timespan_check != timespan_check) or force_rerun_shapes:
+        refreshed_ids = None
+    else:
+        refreshed_ids = shapes.refresh_shapes(fingerprints)
+    if refreshed_ids is None:
         logging.info('Processing shapes')
         shapes.__init__()
         shapes.create_empty_shapes()
         shapes.initiate_active_shapes()
         shapes.process_active_shapes()
+        shapes._fingerprints = fingerprints
         
-        if pickle_shapes:
-            logging.info('Pickling shapes')
-            with open(os.path.join(cfg.workingdir, '{}_shapes.p'.format(cfg.primary_geography)), 'wb') as outfile:
-                pickle.dump(shapes, outfile, pickle.HIGHEST_PROTOCOL)
+    if pickle_shapes and (refreshed_ids is None or fingerprints != stored_fingerprints):
+        logging.info('Saving shapes')
+        store.save(shapes, refreshed_ids)
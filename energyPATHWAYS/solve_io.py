@@ -6,19 +6,122 @@ Created on Thu Jul 30 09:35:30 2015
 """
 
 import numpy as np
-                                        
+import scipy.linalg
+from scipy import sparse
+from scipy.sparse import linalg as sparse_linalg
+import hashlib
+from collections import OrderedDict
+
+# maximum number of (I - A) factorizations kept in memory. Each dense factorization is the size of the IO table, so
+# the supply side raises this to hold every sector's energy and cost tables of a year (see Supply.create_IO)
+max_cached_factorizations = 4
+_factorization_cache = OrderedDict()
+
+
+class IOFactorization(object):
+    """ LU factorization of (I - A) for an IO table A that can be reused for any number of right hand sides
+        -> dense tables use LAPACK LU, scipy.sparse tables use SuperLU
+    """
+    def __init__(self, IO_matrix):
+        self.size = IO_matrix.shape[0]
+        self.is_sparse = sparse.issparse(IO_matrix)
+        if self.is_sparse:
+            self.lu = sparse_linalg.splu(sparse.identity(self.size, format='csc') - IO_matrix.tocsc())
+        else:
+            self.lu = scipy.linalg.lu_factor(np.eye(self.size, self.size) - IO_matrix, check_finite=False)
+            if np.any(np.diag(self.lu[0]) == 0):
+                raise np.linalg.LinAlgError('Singular matrix')
+
+    def solve(self, d=None):
+        """ solves (I - A) x = d. If no demand (d) is passed, the inverse is returned """
+        if d is None:
+            d = np.eye(self.size, self.size)
+        elif sparse.issparse(d):
+            d = d.toarray()
+        if self.is_sparse:
+            return self.lu.solve(np.asarray(d, dtype=float))
+        else:
+            return scipy.linalg.lu_solve(self.lu, d, check_finite=False)
+
+    def inverse(self, chunk_size=500):
+        """ returns (I - A)^-1. For sparse tables the inverse is built a block of columns at a time and returned as a
+            scipy.sparse csc matrix, so that only chunk_size dense columns are ever held in memory
+        """
+        if not self.is_sparse:
+            return self.solve()
+        blocks = []
+        for start in range(0, self.size, chunk_size):
+            stop = min(start + chunk_size, self.size)
+            rhs = np.zeros((self.size, stop - start))
+            rhs[np.arange(start, stop), np.arange(stop - start)] = 1
+            blocks.append(sparse.csc_matrix(self.lu.solve(rhs)))
+        return sparse.hstack(blocks, format='csc') if len(blocks) else sparse.csc_matrix((self.size, self.size))
+
+
+def io_hash(IO_matrix):
+    """ content hash of an IO table, used as the key for cached factorizations """
+    sha = hashlib.sha1()
+    sha.update(str(IO_matrix.shape))
+    if sparse.issparse(IO_matrix):
+        IO_matrix = IO_matrix.tocsc()
+        IO_matrix.sum_duplicates()
+        for array in (IO_matrix.data, IO_matrix.indices, IO_matrix.indptr):
+            sha.update(np.ascontiguousarray(array).tostring())
+    else:
+        sha.update(np.ascontiguousarray(IO_matrix, dtype=float).tostring())
+    return sha.hexdigest()
+
+
+def factorize_IO(IO_matrix):
+    """ returns the factorization of (I - IO_matrix), reusing a cached one if the same table has been seen before """
+    key = io_hash(IO_matrix)
+    if key in _factorization_cache:
+        # move to the end so that the least recently used factorization is the first to be dropped
+        factorization = _factorization_cache.pop(key)
+    else:
+        factorization = IOFactorization(IO_matrix)
+    _factorization_cache[key] = factorization
+    while len(_factorization_cache) > max(max_cached_factorizations, 1):
+        _factorization_cache.popitem(last=False)
+    return factorization
+
+
+def clear_factorization_cache():
+    _factorization_cache.clear()
+
+
+def update_inverse(inverse, columns, column_deltas):
+    """ Sherman-Morrison-Woodbury update of B = (I - A)^-1 after the columns of A at positions columns change by
+        column_deltas (n x k). With A' = A + U E^T, where E holds the identity columns of the changed positions,
+        (I - A')^-1 = B + B U (I - E^T B U)^-1 E^T B, which costs O(n^2 k) instead of a new O(n^3) solve
+        -> inverse may be a numpy array or a scipy.sparse matrix
+    """
+    columns = np.asarray(columns, dtype=int)
+    if not len(columns):
+        return inverse
+    column_deltas = np.asarray(column_deltas, dtype=float).reshape(inverse.shape[0], len(columns))
+    BU = np.asarray(inverse.dot(column_deltas))
+    if sparse.issparse(inverse):
+        EB = inverse.tocsr()[columns].toarray()
+    else:
+        EB = inverse[columns]
+    correction = np.linalg.solve(np.eye(len(columns)) - BU[columns], EB)
+    if sparse.issparse(inverse):
+        updated = (inverse + sparse.csc_matrix(BU).dot(sparse.csc_matrix(correction))).tocsc()
+        updated.eliminate_zeros()
+        return updated
+    return inverse + BU.dot(correction)
+
+
 def solve_IO(IO_matrix, d=None):
     """ Given, the IO_matrix and intermediate demand, solve for final demand
         -> Inputs and Outputs are numpy arrays
         if no demand (d) is passed, the inverse is returned
     """
-    identity_matrix = np.eye(len(IO_matrix), len(IO_matrix))
-    energy_supply = np.linalg.solve(identity_matrix - IO_matrix, identity_matrix if d is None else d)
-    return energy_supply
+    return factorize_IO(IO_matrix).solve(d)
 
 def inv_IO(IO_matrix):
-    identity_matrix = np.eye(len(IO_matrix), len(IO_matrix))
-    return np.linalg.inv(identity_matrix - IO_matrix)
+    return solve_IO(IO_matrix)
 
 ## In IO, rows are inputs, columns are outputs
 #IO_matrix = pd.DataFrame.from_csv('IO.csv')
@@ -26,5 +129,3 @@ def inv_IO(IO_matrix):
 #
 #energy_supply = solve_IO(IO_matrix.values, energy_demand.values)
 #
-
-
@@ -4,6 +4,7 @@ import config as cfg
 import util
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from datamapfunctions import DataMapFunctions, Abstract
 import copy
 import logging
@@ -15,7 +16,8 @@ from supply_technologies import SupplyTechnology, StorageTechnology
 from supply_classes import SupplySpecifiedStock
 from shared_classes import SalesShare, SpecifiedStock, Stock, StockItem
 from rollover import Rollover
-from solve_io import solve_IO
+from solve_io import factorize_IO
+import solve_io
 from dispatch_classes import Dispatch, DispatchFeederAllocation
 import dispatch_classes
 import inspect
@@ -67,6 +69,12 @@ class Supply(object):
         self.active_thermal_dispatch_df_list = []
         self.map_dict = dict(util.sql_read_table('SupplyNodes', ['final_energy_link', 'id']))
         self.api_run = api_run
+        # when true, IO tables, inverses and embodied results are held as scipy.sparse matrices (see io_frame)
+        self.sparse_io = cfg.get_optional('opt', 'sparse_io', 'false').lower() == 'true'
+        # inverses are updated with a low rank correction when at most this fraction of IO columns changed since the
+        # last solve (0 always re-solves). A full solve is forced after io_max_incremental_updates updates in a row
+        self.io_incremental_max_rank = float(cfg.get_optional('opt', 'io_incremental_max_rank', 0.1))
+        self.io_max_incremental_updates = 10
         if self.map_dict.has_key(None):
             del self.map_dict[None]
         self.CO2PriceMeasures = scenario.get_measures('CO2PriceMeasures', self.thermal_dispatch_node_id)
@@ -174,6 +182,8 @@ class Supply(object):
         self.calculate_initial_demand()
 
     def final_calculate(self):
+        # the raw inverses are only needed while the IO loop is running
+        self.io_solve_state = {}
         self.concatenate_annual_costs()
         self.concatenate_levelized_costs()
         self.calculate_capacity_utilization()
@@ -201,11 +211,21 @@ class Supply(object):
         self.io_dict = util.recursivedict()
         index =  pd.MultiIndex.from_product([cfg.geographies, self.all_nodes], names=[cfg.primary_geography,
                                                          'supply_node'])
+        # sorted row and column labels of the IO tables, used to label sparse tables
+        self.io_index = pd.MultiIndex.from_product([sorted(cfg.geographies), sorted(self.all_nodes)], names=[cfg.primary_geography, 'supply_node'])
+        self.io_emissions_index = pd.MultiIndex.from_product([sorted(cfg.geographies), sorted(self.all_nodes), sorted(self.ghgs)], names=[cfg.primary_geography, 'supply_node', 'ghg'])
         for year in self.years:
             for sector in util.ensure_iterable_and_not_string(self.demand_sectors):
-                self.io_dict[year][sector] = util.empty_df(index = index, columns = index, fill_value=0.0)
+                if self.sparse_io:
+                    self.io_dict[year][sector] = sparse.csc_matrix((len(self.io_index), len(self.io_index)))
+                else:
+                    self.io_dict[year][sector] = util.empty_df(index = index, columns = index, fill_value=0.0)
 
         self.io_dict = util.freeze_recursivedict(self.io_dict)
+        # by sector, the raw inverses of the last solved IO table and the original values of columns written since
+        self.io_solve_state = {}
+        # keep the energy and cost factorizations of every sector in a year so unchanged tables are never refactorized
+        solve_io.max_cached_factorizations = max(solve_io.max_cached_factorizations, 2 * len(self.demand_sectors))
 
     def add_nodes(self):
         """Adds node instances for all active supply nodes"""
@@ -330,7 +350,16 @@ class Supply(object):
     def copy_io(self,year,loop):
         if year != min(self.years) and loop ==1:
             for sector in self.demand_sectors:
-                self.io_dict[year][sector] = copy.deepcopy(self.io_dict[year-1][sector])
+                if self.sparse_io:
+                    self.io_dict[year][sector] = self.io_dict[year-1][sector].copy()
+                else:
+                    self.io_dict[year][sector] = copy.deepcopy(self.io_dict[year-1][sector])
+                # the copied table is the last one solved, so its inverses remain a valid base for incremental updates
+                state = self.io_solve_state.get(sector)
+                if state is not None and state['year'] == year-1:
+                    state['year'] = year
+                else:
+                    self.io_solve_state.pop(sector, None)
 
     def set_dispatch_years(self):
         dispatch_year_step = int(cfg.cfgfile.get('case','dispatch_step'))
@@ -345,11 +374,15 @@ class Supply(object):
     def restart_loop(self):
         self.calculate_loop(self.years,self.calculated_years)
 
-    def calculate_loop(self, years, calculated_years):
-        """Performs all IO loop calculations"""
+    def calculate_loop(self, years, calculated_years, checkpoint=None, resume=False):
+        """Performs all IO loop calculations
+        checkpoint is called with each year once it is complete, and resume continues a loop from a checkpoint
+        without rerunning the initial loop
+        """
         self.set_dispatch_years()
         first_year = min(self.years)
-        self._calculate_initial_loop()
+        if not resume:
+            self._calculate_initial_loop()
         self.calculated_years = calculated_years
         for year in [x for x in years if x not in self.calculated_years]:
             logging.info("Starting supply side calculations for {}".format(year))
@@ -392,6 +425,8 @@ class Supply(object):
             self.calculate_embodied_emissions(year)
             self.calculate_annual_costs(year)
             self.calculated_years.append(year)
+            if checkpoint is not None:
+                checkpoint(year)
 
     def discover_bulk_id(self):
         for node in self.nodes.values():
@@ -1219,12 +1254,8 @@ class Supply(object):
                 self.outputs.hourly_dispatch_results = pd.concat([self.outputs.hourly_dispatch_results, self.bulk_dispatch])
             else:
                 # we are going to save them as we go along
-                result_df = self.outputs.clean_df(self.bulk_dispatch)
-                keys = [self.scenario.name.upper(), cfg.timestamp]
-                names = ['SCENARIO','TIMESTAMP']
-                for key, name in zip(keys, names):
-                    result_df = pd.concat([result_df], keys=[key], names=[name])
-                Output.write(result_df, 'hourly_dispatch_results.csv', os.path.join(cfg.workingdir, 'dispatch_outputs'))
+                result_df = Output.add_run_levels(self.outputs.clean_df(self.bulk_dispatch), self.scenario.name)
+                Output.write(result_df, 'hourly_dispatch_results.csv', os.path.join(cfg.workingdir, 'dispatch_outputs'), partition=self.scenario.id)
         self.calculate_thermal_totals(year)
         self.calculate_curtailment(year)
                 
@@ -1254,7 +1285,10 @@ class Supply(object):
         names = ['demand_sector']    
         #apennds sector costs to list
         for sector in self.demand_sectors:
-            dataframes.append(self.cost_dict[year][sector].sum())
+            if self.sparse_io:
+                dataframes.append(pd.Series(np.asarray(self.cost_dict[year][sector].sum(axis=0)).flatten(), index=self.io_index))
+            else:
+                dataframes.append(self.cost_dict[year][sector].sum())
         #concatenates sector costs into single dataframe    
         embodied_cost_df  = pd.concat(dataframes,keys=keys,names=names)    
         embodied_cost_df = embodied_cost_df.reorder_levels([cfg.primary_geography,'demand_sector','supply_node']).to_frame()
@@ -1450,42 +1484,48 @@ class Supply(object):
             else:
                 # we are going to save them as we go along
                 for obj, obj_name in zip([bulk_marginal_cost, bulk_production_cost], ['hourly_marginal_cost', 'hourly_production_cost']):
-                    result_df = self.outputs.clean_df(obj)
-                    keys = [self.scenario.name.upper(), cfg.timestamp]
-                    names = ['SCENARIO','TIMESTAMP']
-                    for key, name in zip(keys, names):
-                        result_df = pd.concat([result_df], keys=[key], names=[name])
-                    Output.write(result_df, obj_name + '.csv', os.path.join(cfg.workingdir, 'dispatch_outputs'))
+                    result_df = Output.add_run_levels(self.outputs.clean_df(obj), self.scenario.name)
+                    Output.write(result_df, obj_name + '.csv', os.path.join(cfg.workingdir, 'dispatch_outputs'), partition=self.scenario.id)
+
 
+        self.update_thermal_stocks(year)
 
+    def thermal_dispatch_results(self, year, node_id):
+        """
+        Thermal dispatch results for a node as arrays by dispatch geography (rows) and generator (columns),
+        along with the stock index of the generators and a mask of the geography/generator pairs that were dispatched
+        """
+        node_results = util.df_slice(self.active_thermal_dispatch_df[year].unstack('IO'), node_id, 'supply_node')
+        labels = sorted(set(node_results.index.get_level_values('thermal_generators')))
+        grid = pd.MultiIndex.from_product([cfg.dispatch_geographies, labels], names=node_results.index.names)
+        shape = (len(cfg.dispatch_geographies), len(labels))
+        dispatched = pd.Series(1, index=node_results.index).reindex(grid).notnull().values.reshape(shape)
+        node_results = node_results.reindex(grid)
+        results = dict((io, node_results[io].values.reshape(shape)) for io in ('capacity', 'stock_changes', 'gen_cf'))
+        results['dispatched'] = dispatched
+        results['index'] = pd.MultiIndex.from_tuples([util.tuple_from_label(label) for label in labels], names=self.nodes[node_id].stock.values.index.names)
+        return results
+
+    def update_thermal_stocks(self, year):
+        """adds the thermal dispatch capacity additions to each node's dispatch capacity and sets its capacity factors"""
         for node_id in self.thermal_dispatch_nodes:
             node = self.nodes[node_id]
-            for dispatch_geography in cfg.dispatch_geographies:
-                dispatch_df = util.df_slice(self.active_thermal_dispatch_df.loc[:,:],[dispatch_geography,node_id], [cfg.dispatch_geography,'supply_node'],drop_level=False)
-                resources = list(set([eval(x) for x in dispatch_df.index.get_level_values('thermal_generators')]))
-                for resource in resources:
-                    capacity_indexer = util.level_specific_indexer(dispatch_df, ['thermal_generators','IO'], [str(resource),'capacity'])
-                    dispatch_capacity_indexer = util.level_specific_indexer(dispatch_df,['thermal_generators','IO'], [str(resource),'stock_changes'])
-                    node.stock.dispatch_cap.loc[resource,year] += dispatch_df.loc[dispatch_capacity_indexer,year].values
-            node.stock.capacity_factor.loc[:,year] = 0
-            for dispatch_geography in cfg.dispatch_geographies:
-                dispatch_df = util.df_slice(self.active_thermal_dispatch_df.loc[:,:],[dispatch_geography,node_id], [cfg.dispatch_geography,'supply_node'],drop_level=False)
-                resources = list(set([eval(x) for x in dispatch_df.index.get_level_values('thermal_generators')]))
-                for resource in resources:
-                    capacity_indexer = util.level_specific_indexer(dispatch_df, ['thermal_generators','IO'], [str(resource),'capacity'])
-                    stock_changes_indexer = util.level_specific_indexer(dispatch_df, ['thermal_generators','IO'], [str(resource),'stock_changes'])
-                    if node.stock.values.loc[resource,year] ==0 and node.stock.dispatch_cap.loc[resource,year] == 0:
-                        ratio = 0
-                    elif node.stock.values.loc[resource,year] ==0 and node.stock.dispatch_cap.loc[resource,year] != 0:
-                        ratio = dispatch_df.loc[stock_changes_indexer,year]/node.stock.dispatch_cap.loc[resource,year]
-                    else:
-                        ratio = dispatch_df.loc[capacity_indexer,year]/node.stock.values.loc[resource,year]
-                    ratio = np.nan_to_num(ratio)    
-                    capacity_factor_indexer = util.level_specific_indexer(dispatch_df,['thermal_generators','IO'], [str(resource),'gen_cf'])
-                    capacity_factor = np.nan_to_num(dispatch_df.loc[capacity_factor_indexer,year]*ratio)
-                    node.stock.capacity_factor.loc[resource,year] += capacity_factor
-                    dispatch_capacity_indexer = util.level_specific_indexer(dispatch_df,['thermal_generators','IO'], [str(resource),'stock_changes'])
-                    node.stock.dispatch_cap.loc[resource,year] += dispatch_df.loc[dispatch_capacity_indexer,year].values
+            if not node_id in self.active_thermal_dispatch_df.index.get_level_values('supply_node'):
+                node.stock.capacity_factor.loc[:,year] = 0
+                continue
+            results = self.thermal_dispatch_results(year, node_id)
+            index, dispatched = results['index'], results['dispatched']
+            stock_changes = np.where(dispatched, results['stock_changes'], 0)
+            stock = node.stock.values[year].reindex(index).values
+            # stock changes are added to the dispatch capacity once before the capacity factors are weighted,
+            # and again as each dispatch geography is weighted in turn
+            dispatch_cap = node.stock.dispatch_cap[year].reindex(index).values + stock_changes.sum(axis=0)
+            weighting_cap = dispatch_cap + np.cumsum(stock_changes, axis=0) - stock_changes
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(stock == 0, np.where(weighting_cap == 0, 0, stock_changes / weighting_cap), results['capacity'] / stock)
+                capacity_factor = np.where(dispatched, np.nan_to_num(results['gen_cf'] * np.nan_to_num(ratio)), 0).sum(axis=0)
+            node.stock.dispatch_cap[year] = node.stock.dispatch_cap[year].add(pd.Series(2 * stock_changes.sum(axis=0), index=index), fill_value=0)
+            node.stock.capacity_factor[year] = pd.Series(capacity_factor, index=index).reindex(node.stock.capacity_factor.index).fillna(0)
 
     def calculate_curtailment(self,year):
         if year == int(cfg.cfgfile.get('case','current_year')):
@@ -1924,7 +1964,10 @@ class Supply(object):
             inverse = self.inverse_dict['cost'][year][sector]
             indexer = util.level_specific_indexer(self.io_embodied_cost_df, 'demand_sector', sector)
             cost = np.column_stack(self.io_embodied_cost_df.loc[indexer,year].values).T
-            self.cost_dict[year][sector] = pd.DataFrame(cost * inverse.values, index=index, columns=index)
+            if self.sparse_io:
+                self.cost_dict[year][sector] = sparse.diags(cost.flatten(), 0).dot(inverse).tocsc()
+            else:
+                self.cost_dict[year][sector] = pd.DataFrame(cost * inverse.values, index=index, columns=index)
 
     def calculate_embodied_emissions(self, year):
         """Calculates the embodied emissions for all supply nodes by multiplying each node's
@@ -1946,6 +1989,13 @@ class Supply(object):
                 except:
                     pdb.set_trace()
         for sector in self.demand_sectors:    
+            if self.sparse_io:
+                indexer = util.level_specific_indexer(self.io_embodied_emissions_df, 'demand_sector', sector)
+                emissions = np.column_stack(self.io_embodied_emissions_df.loc[indexer,year].values).T
+                # each row of the inverse is repeated once per ghg, matching the [geography, supply_node, ghg] rows
+                inverse = self.inverse_dict['energy'][year][sector].tocsr()[np.repeat(np.arange(len(self.io_index)), len(self.ghgs))]
+                self.emissions_dict[year][sector] = sparse.diags(emissions.flatten(), 0).dot(inverse).tocsc()
+                continue
             inverse = copy.deepcopy(self.inverse_dict['energy'][year][sector])
             keys = self.ghgs
             name = ['ghg']
@@ -1978,7 +2028,7 @@ class Supply(object):
             name = ['sector']
             idx = pd.IndexSlice
             for sector in self.demand_sectors:
-                link_dict[year][sector].loc[:,:] = embodied_dict[year][sector].loc[:,idx[:, self.map_dict.values()]].values
+                link_dict[year][sector].loc[:,:] = self.io_frame(embodied_dict[year][sector], self.map_dict.values()).values
                 link_dict[year][sector]= link_dict[year][sector].stack([cfg.primary_geography,'final_energy']).to_frame()
                 link_dict[year][sector] = link_dict[year][sector][link_dict[year][sector][0]!=0]
                 levels_to_keep = [x for x in link_dict[year][sector].index.names if x in cfg.output_combined_levels]
@@ -2012,7 +2062,7 @@ class Supply(object):
             keys = self.demand_sectors
             name = ['sector']
             for sector in self.demand_sectors:
-                df = adict[year][sector]
+                df = self.io_frame(adict[year][sector])
                 levels_to_keep = [x for x in df.index.names if x in cfg.output_combined_levels]
                 df = df.groupby(level=levels_to_keep).sum()
                 df = df.stack([cfg.primary_geography,'supply_node']).to_frame()
@@ -2093,7 +2143,7 @@ class Supply(object):
             keys = self.demand_sectors
             name = ['sector']
             for sector in self.demand_sectors:   
-               df = copy.deepcopy(embodied_dict[year][sector]).loc[:,idx[:,supply_nodes]]
+               df = copy.deepcopy(self.io_frame(embodied_dict[year][sector], supply_nodes))
                util.replace_column_name(df,'supply_node_export',  'supply_node')
                util.replace_index_name(df, cfg.primary_geography + "_supply", cfg.primary_geography)
                stack_levels =[cfg.primary_geography, "supply_node_export"]
@@ -2146,6 +2196,10 @@ class Supply(object):
         Returns:
             io_adjusted (DataFrame) = adjusted DataFrame
         """
+        if sparse.issparse(io):
+            import_nodes = [node.id for node in self.nodes.values() if isinstance(node, ImportNode)]
+            keep = ~np.in1d(self.io_index.get_level_values('supply_node'), import_nodes)
+            return io.dot(sparse.diags(keep.astype(float), 0)).tocsc()
         io_adjusted = copy.deepcopy(io)
         for node in self.nodes.values():
             if isinstance(node, ImportNode):
@@ -2458,6 +2512,11 @@ class Supply(object):
                             normalized = normalized.replace([np.nan,np.inf],1E-7)
                             col_node.active_coefficients_total.loc[:,col_indexer] = normalized
                             
+        if self.sparse_io:
+            # lil supports cheap block assignment; tables go back to csc for solving once all nodes are written
+            for sector in self.demand_sectors:
+                self.io_dict[year][sector] = self.io_dict[year][sector].tolil()
+        io_supply_nodes = self.io_index.get_level_values('supply_node')
         for col_node in self.nodes.values():
             if loop == 1 and col_node.id not in self.blend_nodes:
                 continue
@@ -2465,20 +2524,33 @@ class Supply(object):
                continue
             else:
                for sector in self.demand_sectors:
-                    levels = ['supply_node' ]
-                    col_indexer = util.level_specific_indexer(self.io_dict[year][sector], levels=levels, elements=[col_node.id])
                     row_nodes = list(map(int,col_node.active_coefficients_total.index.levels[util.position_in_index(col_node.active_coefficients_total,'supply_node')]))
                     row_nodes = [x for x in row_nodes if x in self.all_nodes]
-                    row_indexer = util.level_specific_indexer(self.io_dict[year][sector], levels=levels, elements=[row_nodes])
                     levels = ['demand_sector','supply_node']   
                     active_row_indexer =  util.level_specific_indexer(col_node.active_coefficients_total, levels=levels, elements=[sector,row_nodes]) 
                     active_col_indexer = util.level_specific_indexer(col_node.active_coefficients_total, levels=['demand_sector'], elements=[sector], axis=1)
+                    cols = np.nonzero(io_supply_nodes == col_node.id)[0]
+                    self._track_io_change(year, sector, cols)
+                    if self.sparse_io:
+                        rows = np.nonzero(np.in1d(io_supply_nodes, row_nodes))[0]
+                        if col_node.overflow_node:
+                            self.io_dict[year][sector][rows[:, None], cols] = 0
+                        else:
+                            self.io_dict[year][sector][rows[:, None], cols] = col_node.active_coefficients_total.loc[active_row_indexer,active_col_indexer].values
+                        continue
+                    levels = ['supply_node' ]
+                    col_indexer = util.level_specific_indexer(self.io_dict[year][sector], levels=levels, elements=[col_node.id])
+                    row_indexer = util.level_specific_indexer(self.io_dict[year][sector], levels=levels, elements=[row_nodes])
                     try:
                         self.io_dict[year][sector].loc[row_indexer, col_indexer] = col_node.active_coefficients_total.loc[active_row_indexer,active_col_indexer].values
                     except:
                         pdb.set_trace()
                     if col_node.overflow_node:
                         self.io_dict[year][sector].loc[row_indexer, col_indexer]=0                    
+        if self.sparse_io:
+            for sector in self.demand_sectors:
+                self.io_dict[year][sector] = self.io_dict[year][sector].tocsc()
+                self.io_dict[year][sector].eliminate_zeros()
                     
  
                 
@@ -2593,23 +2665,121 @@ class Supply(object):
             self.active_io = self.io_dict[year][sector]
             active_cost_io = self.adjust_for_not_incremental(self.active_io)
             self.active_demand = self.io_total_active_demand_df.loc[indexer,:]
-            temp = solve_IO(self.active_io.values, self.active_demand.values)
-            temp[np.nonzero(self.active_io.values.sum(axis=1) + self.active_demand.values.flatten()==0)[0]] = 0
+            energy_io = self.active_io if self.sparse_io else self.active_io.values
+            cost_io = active_cost_io if self.sparse_io else active_cost_io.values
+            demand = self.active_demand.values.flatten()
+            energy_no_flow = self._no_flow_rows(energy_io, demand)
+            cost_no_flow = self._no_flow_rows(cost_io, demand)
+            inverses = self._incremental_io_inverses(year, sector)
+            if inverses is None:
+                # supply and the energy inverse share one factorization of the energy IO table
+                energy_factorization = factorize_IO(energy_io)
+                temp = energy_factorization.solve(self.active_demand.values)
+                energy_inverse, cost_inverse = energy_factorization.inverse(), factorize_IO(cost_io).inverse()
+            else:
+                energy_inverse, cost_inverse = inverses
+                temp = np.asarray(energy_inverse.dot(self.active_demand.values))
+            self._store_io_solve_state(year, sector, energy_inverse, cost_inverse, incremental=inverses is not None)
+            temp[energy_no_flow] = 0
             self.io_supply_df.loc[indexer,year] = temp
-            temp = solve_IO(self.active_io.values)
-            temp[np.nonzero(self.active_io.values.sum(axis=1) + self.active_demand.values.flatten()==0)[0]] = 0
-            self.inverse_dict['energy'][year][sector] = pd.DataFrame(temp, index=index, columns=index)
-            temp = solve_IO(active_cost_io.values)
-            temp[np.nonzero(active_cost_io.values.sum(axis=1) + self.active_demand.values.flatten()==0)[0]] = 0
-            self.inverse_dict['cost'][year][sector] = pd.DataFrame(temp, index=index, columns=index)
-            idx = pd.IndexSlice
-            self.inverse_dict['energy'][year][sector].loc[idx[:,self.non_storage_nodes],:] = self.inverse_dict['energy'][year][sector].loc[idx[:,self.non_storage_nodes],:]
-            self.inverse_dict['cost'][year][sector].loc[idx[:,self.non_storage_nodes],:] = self.inverse_dict['cost'][year][sector].loc[idx[:,self.non_storage_nodes],:] 
+            self.inverse_dict['energy'][year][sector] = self._format_inverse(energy_inverse, energy_no_flow, index)
+            self.inverse_dict['cost'][year][sector] = self._format_inverse(cost_inverse, cost_no_flow, index)
         for node in self.nodes.values():
             indexer = util.level_specific_indexer(self.io_supply_df,levels=['supply_node'], elements = [node.id])
             node.active_supply = self.io_supply_df.loc[indexer,year].groupby(level=[cfg.primary_geography, 'demand_sector']).sum().to_frame()
                     
     
+    @staticmethod
+    def _no_flow_rows(io, demand):
+        """positions of IO rows with neither inputs nor demand, whose solved supply and inverse rows are zeroed"""
+        return np.nonzero(np.asarray(io.sum(axis=1)).flatten() + demand == 0)[0]
+
+    def _format_inverse(self, inverse, no_flow_rows, index):
+        if sparse.issparse(inverse):
+            keep = np.ones(inverse.shape[0])
+            keep[no_flow_rows] = 0
+            inverse = sparse.diags(keep, 0).dot(inverse).tocsc()
+            inverse.eliminate_zeros()
+            return inverse
+        if self.io_incremental_max_rank:
+            # the raw inverse is kept as the base for incremental updates
+            inverse = inverse.copy()
+        inverse[no_flow_rows] = 0
+        return pd.DataFrame(inverse, index=index, columns=index)
+
+    @staticmethod
+    def _io_column(table, position):
+        if sparse.issparse(table):
+            return table[:, position].toarray().flatten()
+        return table.iloc[:, position].values.copy()
+
+    def _track_io_change(self, year, sector, positions):
+        """records the values a column of the IO table had at the last solve, before it is first overwritten"""
+        state = self.io_solve_state.get(sector)
+        if state is None or state['year'] != year:
+            return
+        for position in positions:
+            if position not in state['changes']:
+                state['changes'][position] = self._io_column(self.io_dict[year][sector], position)
+
+    def _store_io_solve_state(self, year, sector, energy_inverse, cost_inverse, incremental):
+        if not self.io_incremental_max_rank:
+            return
+        updates = self.io_solve_state[sector]['updates'] + 1 if incremental else 0
+        self.io_solve_state[sector] = {'year': year, 'energy': energy_inverse, 'cost': cost_inverse, 'changes': {}, 'updates': updates}
+
+    def _incremental_io_inverses(self, year, sector):
+        """Returns the raw energy and cost inverses of the current IO table, obtained from the inverses of the last solve
+        with a low rank (Sherman-Morrison-Woodbury) update over the columns that changed since. Returns None if a full
+        solve is needed instead.
+        """
+        state = self.io_solve_state.get(sector)
+        if state is None or state['year'] != year or state['updates'] >= self.io_max_incremental_updates:
+            return None
+        table = self.io_dict[year][sector]
+        columns, deltas = [], []
+        for position, old_column in sorted(state['changes'].items()):
+            delta = self._io_column(table, position) - old_column
+            # update_io_df rewrites every column, but most of the writes leave the values as they were
+            if np.any(delta):
+                columns.append(position)
+                deltas.append(delta)
+        if len(columns) > self.io_incremental_max_rank * table.shape[0]:
+            return None
+        if not len(columns):
+            return state['energy'], state['cost']
+        deltas = np.column_stack(deltas)
+        # import node columns are zeroed in the cost table (adjust_for_not_incremental), so their changes do not apply
+        import_nodes = [node.id for node in self.nodes.values() if isinstance(node, ImportNode)]
+        column_nodes = self.io_index.get_level_values('supply_node')[columns]
+        cost_changes = [i for i, node_id in enumerate(column_nodes) if node_id not in import_nodes]
+        try:
+            energy_inverse = solve_io.update_inverse(state['energy'], columns, deltas)
+            cost_inverse = solve_io.update_inverse(state['cost'], [columns[i] for i in cost_changes], deltas[:, cost_changes])
+        except np.linalg.LinAlgError:
+            return None
+        return energy_inverse, cost_inverse
+
+    def io_frame(self, matrix, supply_nodes=None):
+        """Returns an IO table, inverse or embodied result as a DataFrame, optionally limited to the columns of
+        supply_nodes. Sparse tables (sparse_io) are only densified here, and only for the requested columns.
+        """
+        if not sparse.issparse(matrix):
+            return matrix if supply_nodes is None else matrix.loc[:, pd.IndexSlice[:, supply_nodes]]
+        index = self.io_index if matrix.shape[0] == len(self.io_index) else self.io_emissions_index
+        columns = self.io_index
+        if supply_nodes is not None:
+            positions = np.nonzero(np.in1d(columns.get_level_values('supply_node'), supply_nodes))[0]
+            matrix, columns = matrix.tocsc()[:, positions], columns[positions]
+        return pd.DataFrame(matrix.toarray(), index=index.copy(), columns=columns.copy())
+
+    def io_sparse(self, matrix):
+        """Returns an IO table, inverse or embodied result as a (scipy.sparse csr matrix, index, columns) tuple"""
+        if sparse.issparse(matrix):
+            index = self.io_index if matrix.shape[0] == len(self.io_index) else self.io_emissions_index
+            return matrix.tocsr(), index, self.io_index
+        return sparse.csr_matrix(matrix.values), matrix.index, matrix.columns
+
     def add_initial_demand_dfs(self, year):
         for node in self.nodes.values():
             node.internal_demand = copy.deepcopy(self.empty_output_df)
@@ -2648,7 +2818,10 @@ class Supply(object):
     def create_inverse_dict(self):
         index = pd.MultiIndex.from_product([cfg.geo.geographies[cfg.primary_geography], self.all_nodes
                                                                 ], names=[cfg.primary_geography,'supply_node'])
-        df = util.empty_df(index = index, columns = index)
+        if self.sparse_io:
+            df = sparse.csc_matrix((len(index), len(index)))
+        else:
+            df = util.empty_df(index = index, columns = index)
         self.inverse_dict = util.recursivedict()   
         for key in ['energy', 'cost']:
             for year in self.years:
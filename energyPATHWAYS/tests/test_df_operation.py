@@ -22,6 +22,7 @@ class TestDfOperation(unittest.TestCase):
     TECHNOLOGIES = range(1, 7)
 
     def setUp(self):
+        util.clear_alignment_plan_cache()
         # dataframes to play with (these are totals), note that the column name is always value,
         # as it is in the rest of the code
         index = pd.MultiIndex.from_product((self.GEOGRAPHIES, self.ENERGY_TYPES, self.YEARS),
@@ -111,3 +112,47 @@ class TestDfOperation(unittest.TestCase):
         # None is just ignored
         df = util.DfOper.divi((None, self.c_total, None))
         self.assertIs(df, self.c_total)
+
+    def test_alignment_plan_is_reused(self):
+        # the second operation on the same index structures reuses the merge from the first
+        c_inten = self.c_total.groupby(level=['census_division', 'energy_type']).transform(lambda x: x / x.sum())
+        df_first = util.DfOper.mult((c_inten, self.b_total), expandable=(True, False), collapsible=(False, True))
+        self.assertEqual(len(util._alignment_plan_cache), 1)
+        df_second = util.DfOper.mult((c_inten * 2, self.b_total.copy()), expandable=(True, False), collapsible=(False, True))
+        self.assertEqual(len(util._alignment_plan_cache), 1)
+        self.assertTrue(df_first.index.equals(df_second.index))
+        npt.assert_almost_equal(df_second.values, df_first.values * 2)
+
+    def test_outer_join_fills_missing_rows(self):
+        a = self.a_total.iloc[:-5]
+        b = self.a_total.iloc[5:]
+        df = util.DfOper.add((a, b), expandable=(False, False), collapsible=(True, True))
+        self.assertEqual(len(df), len(self.a_total))
+        npt.assert_almost_equal(df.sum().sum(), a.sum().sum() + b.sum().sum())
+
+    def test_renaming_result_does_not_change_plan(self):
+        c_inten = self.c_total.groupby(level=['census_division', 'energy_type']).transform(lambda x: x / x.sum())
+        df_first = util.DfOper.mult((c_inten, self.b_total), expandable=(True, False), collapsible=(False, True))
+        names = list(df_first.index.names)
+        util.replace_index_name(df_first, 'tech', 'technology')
+        df_second = util.DfOper.mult((c_inten, self.b_total), expandable=(True, False), collapsible=(False, True))
+        self.assertEqual(len(util._alignment_plan_cache), 1)
+        self.assertEqual(list(df_second.index.names), names)
+        self.assertEqual(list(self.b_total.index.names), ['census_division', 'energy_type', 'technology', 'vintage'])
+
+    def test_unchanged_rows_are_copied(self):
+        df = util.DfOper.add((self.a_total, self.a_total), expandable=(False, False), collapsible=(True, True))
+        util.replace_index_name(df, 'geography', 'census_division')
+        df['value'] = 0
+        self.assertEqual(self.a_total.index.names[0], 'census_division')
+        npt.assert_almost_equal(self.a_total['value'].values, np.arange(len(self.a_total)) + .5)
+
+    def test_large_plans_are_not_cached(self):
+        c_inten = self.c_total.groupby(level=['census_division', 'energy_type']).transform(lambda x: x / x.sum())
+        max_rows = util.max_cached_alignment_plan_rows
+        util.max_cached_alignment_plan_rows = len(self.b_total)
+        try:
+            util.DfOper.mult((c_inten, self.b_total), expandable=(True, False), collapsible=(False, True))
+        finally:
+            util.max_cached_alignment_plan_rows = max_rows
+        self.assertEqual(len(util._alignment_plan_cache), 0)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+from scipy import optimize
+from energyPATHWAYS import dispatch_budget
+
+
+def bisect_dispatch(load, energy_budgets, dispatch_periods, pmins, pmaxs):
+    """dispatch to energy budget by solving each group's cutoff with bisection"""
+    shapes = []
+    for load_group, energy_budget, pmin, pmax in zip(np.array_split(load, np.where(np.diff(dispatch_periods) != 0)[0] + 1), energy_budgets, pmins, pmaxs):
+        if abs(energy_budget) < pmin * len(load_group):
+            shapes.append(np.ones_like(load_group) * energy_budget / len(load_group))
+        elif abs(energy_budget) > pmax * len(load_group):
+            shapes.append(np.ones_like(load_group) * pmax)
+        else:
+            load_cutoff = optimize.bisect(dispatch_budget.residual_energy, min(load_group) - pmax - 1, max(load_group) + pmax + 1,
+                                          args=(load_group, energy_budget, pmin, pmax))
+            shapes.append(dispatch_budget.dispatch_shape(load_group, load_cutoff, (1 if energy_budget > 0 else -1), pmin, pmax))
+    return np.concatenate(shapes)
+
+
+class TestDispatchToEnergyBudget(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(3)
+        self.dispatch_periods = np.repeat(np.arange(12), 30)
+        self.load = np.random.randn(len(self.dispatch_periods)) * 1000 + 5000
+        self.pmaxs = np.random.uniform(200, 3000, 12)
+        self.pmins = np.array([0, 50] * 6, dtype=float)
+
+    def test_matches_bisection(self):
+        for sign in (1, -1):
+            energy_budgets = sign * np.random.uniform(0, 1.1, 12) * self.pmaxs * 30
+            expected = bisect_dispatch(self.load, energy_budgets, self.dispatch_periods, self.pmins, self.pmaxs)
+            result = dispatch_budget.dispatch_to_energy_budget(self.load, energy_budgets, self.dispatch_periods, list(self.pmins), list(self.pmaxs))
+            np.testing.assert_allclose(result, expected, atol=1e-6)
+
+    def test_cutoff_meets_budget(self):
+        load_cutoff = dispatch_budget.solve_for_load_cutoff(self.load, -100000., 0, 5000.)
+        self.assertAlmostEqual(dispatch_budget.residual_energy(load_cutoff, self.load, -100000., 0, 5000.), 0, places=6)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+from pyomo.environ import Param
+from energyPATHWAYS import dispatch_formulation
+from energyPATHWAYS.dispatch_classes import all_results_to_list
+
+
+class Constraints(object):
+    def __init__(self, values):
+        self.values = values
+
+    def get_values_as_dict(self, year):
+        return self.values
+
+
+class Transmission(object):
+    # lines between every pair of geographies, named like the model's (see net_transmit_power_by_geo_rule)
+    list_transmission_lines = [str((1, 2)), str((2, 1))]
+    constraints = Constraints(dict((line, 5.) for line in list_transmission_lines))
+    hurdles = Constraints(dict((line, 1.) for line in list_transmission_lines))
+    losses = Constraints(dict((line, .02) for line in list_transmission_lines))
+
+
+class TwoPeriodDispatch(object):
+    """ the inputs create_dispatch_model reads, for two six hour periods with different loads and capacities """
+    def __init__(self):
+        np.random.seed(2)
+        self.year = 2030
+        self.period_timepoints = {0: range(0, 6), 1: range(6, 12)}
+        self.period_previous_timepoints = dict((period, dict(zip(hours, [hours[-1]] + hours[:-1])))
+                                               for period, hours in self.period_timepoints.items())
+        self.dispatch_geographies = [1, 2]
+        self.feeders = [0, 1]
+        # technologies are named like the string tuples of the model (see storage_result_to_list)
+        self.storage_technologies = ['(1, 1)']
+        self.generation_technologies = ['(2, 1)', '(3, 1)']
+        self.ld_technologies = []
+        self.large_storage = {'(1, 1)': 0}
+        self.start_soc_large_storage = self.end_soc_large_storage = self.ld_energy_budgets = {}
+        self.charging_efficiency = self.discharging_efficiency = {'(1, 1)': .9}
+        self.variable_costs = {'(2, 1)': 40., '(3, 1)': 25.}
+        technologies = self.storage_technologies + self.generation_technologies
+        self.geography = dict((period, {'(1, 1)': 1, '(2, 1)': 1, '(3, 1)': 2}) for period in self.period_timepoints)
+        self.feeder = dict((period, dict((t, 0) for t in technologies)) for period in self.period_timepoints)
+        self.min_capacity = dict((period, dict((t, 0.) for t in technologies)) for period in self.period_timepoints)
+        self.capacity = dict((period, dict((t, 10. * (period + 1)) for t in technologies)) for period in self.period_timepoints)
+        self.duration = dict((period, {'(1, 1)': 4.}) for period in self.period_timepoints)
+        for name, feeders in (('distribution_load', True), ('bulk_load', False), ('dispatched_bulk_load', False),
+                              ('distribution_gen', True), ('bulk_gen', False), ('min_cumulative_flex_load', True),
+                              ('max_cumulative_flex_load', True), ('cumulative_distribution_load', True)):
+            setattr(self, name, dict((period, self.hourly_values(hours, feeders)) for period, hours in self.period_timepoints.items()))
+        self.max_flex_load = dict((period, dict(((g, f), 1.) for g in self.dispatch_geographies for f in self.feeders)) for period in self.period_timepoints)
+        self.min_flex_load = dict((period, dict(((g, f), 0.) for g in self.dispatch_geographies for f in self.feeders)) for period in self.period_timepoints)
+        self.transmission = Transmission()
+        self.dist_net_load_thresholds = dict(((g, f), 5.) for g in self.dispatch_geographies for f in self.feeders)
+        self.bulk_net_load_thresholds = dict((g, 5.) for g in self.dispatch_geographies)
+        self.t_and_d_losses = dict(((g, f), 1.05) for g in self.dispatch_geographies for f in self.feeders)
+        self.curtailment_cost = self.unserved_capacity_cost = 1000.
+        self.dist_net_load_penalty = self.bulk_net_load_penalty = self.flex_load_penalty = 10.
+        self.has_flexible_load = True
+
+    def hourly_values(self, hours, feeders):
+        return dict(((g, h, f) if feeders else (g, h), np.random.rand()) for g in self.dispatch_geographies
+                    for h in hours for f in (self.feeders if feeders else [None]))
+
+
+def param_values(instance):
+    return dict((param.name, dict((index, param[index].value if hasattr(param[index], 'value') else param[index])
+                                  for index in param)) for param in instance.component_objects(Param))
+
+
+class TestPersistentDispatchModel(unittest.TestCase):
+    def test_update_matches_fresh_build(self):
+        dispatch = TwoPeriodDispatch()
+        instance = dispatch_formulation.create_dispatch_model(dispatch, 0, model_type='concrete', mutable=True, offset=0)
+        dispatch_formulation.update_dispatch_model(instance, dispatch, 1, offset=6)
+        fresh = dispatch_formulation.create_dispatch_model(dispatch, 1, model_type='concrete', mutable=True, offset=6)
+        self.assertEqual(param_values(instance), param_values(fresh))
+
+    def test_results_are_shifted_to_period_hours(self):
+        dispatch = TwoPeriodDispatch()
+        instance = dispatch_formulation.create_dispatch_model(dispatch, 1, model_type='concrete', mutable=True, offset=6)
+        for var in (instance.Charge, instance.Generation_Provide_Power, instance.Flexible_Load):
+            for index in var:
+                var[index].value = 1.
+        results = all_results_to_list(instance, hour_offset=6)
+        # storage_result_to_list rows are the technology's ids, the hour and the value
+        self.assertEqual(sorted(set(row[-2] for row in results['Generator_Provide_Power'])), range(6, 12))
+        self.assertEqual(sorted(set(row[1] for row in results['Flexible_Load'])), range(6, 12))
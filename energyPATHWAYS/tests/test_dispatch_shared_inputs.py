@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+import numpy as np
+from energyPATHWAYS.dispatch_classes import PeriodHourlyValues
+
+
+class TestPeriodHourlyValues(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.geographies = [10, 20]
+        self.feeders = [0, 1, 2]
+        self.period_timepoints = {0: range(0, 5), 1: range(5, 9)}
+        np.random.seed(1)
+        self.dictionary = dict((period, dict(((g, h, f), np.random.rand()) for g in self.geographies
+                                                                             for h in hours for f in self.feeders))
+                               for period, hours in self.period_timepoints.items())
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        shared = PeriodHourlyValues.save(os.path.join(self.path, 'load.npy'), self.dictionary, self.geographies,
+                                         self.period_timepoints, self.feeders)
+        shared = pickle.loads(pickle.dumps(shared, pickle.HIGHEST_PROTOCOL))
+        for period in self.period_timepoints:
+            self.assertEqual(shared[period], self.dictionary[period])
+
+    def test_missing_keys_are_left_out(self):
+        bulk = dict((period, dict(((g, h), float(h)) for g in self.geographies for h in hours))
+                    for period, hours in self.period_timepoints.items())
+        del bulk[1][(20, 7)]
+        shared = PeriodHourlyValues.save(os.path.join(self.path, 'bulk.npy'), bulk, self.geographies, self.period_timepoints)
+        self.assertEqual(shared[1], bulk[1])
+
+    def test_file_is_released_after_read(self):
+        path = os.path.join(self.path, 'load.npy')
+        shared = PeriodHourlyValues.save(path, self.dictionary, self.geographies, self.period_timepoints, self.feeders)
+        shared[0]
+        os.remove(path)
+        self.assertFalse(os.path.exists(path))
@@ -11,6 +11,7 @@ import time
 from energyPATHWAYS import dispatch_generators
 import math
 import copy
+import mock
 
 class TestClusterGenerators(unittest.TestCase):
     def setUp(self):
@@ -95,6 +96,34 @@ class TestClusterGenerators(unittest.TestCase):
         pylab.plot(supply_curve)
 
 
+class TestClusteringCache(unittest.TestCase):
+    def setUp(self):
+        dispatch_generators.clear_clustering_cache()
+        self.pmax = np.array([.001, .01, .1, 1, 10, 60, 50, 20, 20, 5, 2, 2.4, 2.6])
+        self.marginal_cost = np.array([80, 70, 60, 50, 40, 45, 60, 30, 61, 80, 100, 42, 55])
+        self.must_run = np.array([0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1, 0, 1])
+
+    def _cluster(self, pmax, marginal_cost, must_run, incremental):
+        return dispatch_generators.cluster_generators(4, pmax, marginal_cost, np.zeros(len(pmax)), np.zeros(len(pmax)),
+                                                      must_run, zero_mc_4_must_run=True, fleet=1, incremental=incremental)
+
+    def test_same_generators_are_not_refit(self):
+        with mock.patch.object(dispatch_generators, 'KMeans', wraps=dispatch_generators.KMeans) as kmeans:
+            first = self._cluster(self.pmax, self.marginal_cost, self.must_run, incremental=False)
+            second = self._cluster(self.pmax, self.marginal_cost, self.must_run, incremental=False)
+        self.assertEqual(kmeans.call_count, 1)
+        for name in first:
+            np.testing.assert_array_equal(first[name], second[name])
+
+    def test_incremental_assigns_close_generators(self):
+        first = self._cluster(self.pmax, self.marginal_cost, self.must_run, incremental=True)
+        with mock.patch.object(dispatch_generators, 'KMeans', wraps=dispatch_generators.KMeans) as kmeans:
+            added = self._cluster(np.append(self.pmax, 3), np.append(self.marginal_cost, 52), np.append(self.must_run, 0), incremental=True)
+            self.assertEqual(kmeans.call_count, 0)
+            self.assertAlmostEqual(sum(added['pmax']), sum(first['pmax']) + 3)
+            self._cluster(np.append(self.pmax, 3), np.append(self.marginal_cost, 500), np.append(self.must_run, 0), incremental=True)
+            self.assertEqual(kmeans.call_count, 1)
+
 pmax = np.array([.001, .01, .1, 1, 10, 60, 50, 20, 20, 5, 2, 2.4, 2.6])
 marginal_cost = np.array([80, 70, 60, 50, 40, 45, 60, 30, 61, 80, 100, 42, 55])
 FORs = np.array([0, 0, 0, 0, 0, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05])
@@ -58,6 +58,41 @@ class TestGeneratorDispatch(unittest.TestCase):
     def test_simple_generator_dispatch_problem(self):
         self._set_simple_dispatch_inputs()
 
+    @staticmethod
+    def _hourly_stack_dispatch(load, sorted_pmax, sorted_marginal_cost):
+        # reference hour by hour stack dispatch
+        cum_pmax = np.cumsum(sorted_pmax)
+        dispatch = np.zeros((len(sorted_pmax), len(load)))
+        market_prices = []
+        for h, look in enumerate(load):
+            height = np.where(cum_pmax < look)[0]
+            dispatch[height, h] = sorted_pmax[height]
+            if len(height) and len(height) != len(sorted_pmax):
+                dispatch[height[-1] + 1, h] = look - cum_pmax[height[-1]]
+                market_prices.append(sorted_marginal_cost[height[-1] + 1])
+            else:
+                dispatch[0, h] = look
+                market_prices.append(sorted_marginal_cost[0])
+        return dispatch, market_prices
+
+    def test_simple_gen_dispatch_matches_hourly_stack(self):
+        self._set_simple_dispatch_inputs()
+        derated_pmax = self.pmaxs * (1 - dispatch_generators._get_combined_outage_rate(self.FORs, self.MORs))
+        cum_pmax = np.cumsum(derated_pmax[dispatch_generators._get_marginal_cost_order(self.marginal_costs, self.must_runs)])
+        # hours below the must run, exactly on and between stack steps, and above the total capacity
+        load = np.concatenate(([-5, 0, 1e-15], cum_pmax, cum_pmax + .5, [cum_pmax[-1] * 2]))
+        market_prices, production_cost, dispatch_by_generator, gen_dispatch_shape, dispatch_by_category = \
+            dispatch_generators.solve_gen_dispatch(load, self.pmaxs, self.marginal_costs, self.FORs, self.MORs, self.must_runs, self.categories)
+
+        order = dispatch_generators._get_marginal_cost_order(self.marginal_costs, self.must_runs)
+        must_run_sum = derated_pmax[np.nonzero(self.must_runs)].sum()
+        dispatch, expected_prices = self._hourly_stack_dispatch(np.clip(load, must_run_sum, None), derated_pmax[order], self.marginal_costs[order])
+        dispatch = dispatch[np.argsort(order)]
+        np.testing.assert_allclose(market_prices, expected_prices)
+        np.testing.assert_allclose(dispatch_by_generator, dispatch.sum(axis=1))
+        np.testing.assert_allclose(gen_dispatch_shape, dispatch.sum(axis=0))
+        np.testing.assert_allclose(production_cost, (self.marginal_costs * dispatch.T).sum(axis=1))
+
     def _helper_return_generator_maintenance(self):
         MOR = dispatch_maintenance.schedule_generator_maintenance(self.load, self.pmaxs, self.MORs,
                                                                  dispatch_periods=self.dispatch_periods)
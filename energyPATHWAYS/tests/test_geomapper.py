@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+import pandas as pd
+import numpy.testing as npt
+from scipy import sparse
+from energyPATHWAYS import util
+from energyPATHWAYS.geomapper import GeoMapper
+
+
+class TestMapWithMatrix(unittest.TestCase):
+    def setUp(self):
+        util.clear_alignment_plan_cache()
+        # census divisions 1 and 2 map to dispatch region 10, 3 is split between 10 and 20, and 4 isn't in the map
+        index = pd.MultiIndex.from_tuples([(1, 10), (2, 10), (3, 10), (3, 20)], names=['census division', 'dispatch region'])
+        self.map_df = pd.DataFrame([1., 1., .25, .75], index=index, columns=['value'])
+        current_gaus, converted_gaus = pd.Index([1, 2, 3]), pd.Index([10, 20])
+        matrix = sparse.csr_matrix((self.map_df.values[:, 0], (current_gaus.get_indexer(index.get_level_values(0)),
+                                                               converted_gaus.get_indexer(index.get_level_values(1)))),
+                                   shape=(len(current_gaus), len(converted_gaus)))
+        self.map_matrix = (current_gaus, converted_gaus, matrix)
+        # only division 1 has feeder 2, so the mapped data must not have a feeder 2 row for region 20
+        rows = [(1, 1, h) for h in range(4)] + [(1, 2, h) for h in range(4)] + [(3, 1, h) for h in range(4)] + [(4, 1, h) for h in range(4)]
+        index = pd.MultiIndex.from_tuples(rows, names=['census division', 'dispatch_feeder', 'weather_datetime'])
+        np.random.seed(4)
+        self.df = pd.DataFrame(np.random.rand(len(index)), index=index, columns=['value'])
+
+    def compare_to_dfoper(self, df):
+        levels = ['dispatch region', 'dispatch_feeder', 'weather_datetime']
+        expected = util.DfOper.mult([df, self.map_df]).groupby(level=levels).sum()
+        mapped = GeoMapper.map_with_matrix(df, self.map_matrix, 'census division', 'dispatch region').groupby(level=levels).sum()
+        self.assertTrue(mapped.index.equals(expected.index))
+        npt.assert_almost_equal(mapped.values, expected.values)
+
+    def test_matches_dfoper(self):
+        self.compare_to_dfoper(self.df)
+
+    def test_duplicate_rows_are_summed(self):
+        self.compare_to_dfoper(pd.concat([self.df, self.df.iloc[:3]]))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from energyPATHWAYS import config as cfg
+from energyPATHWAYS.outputs import Output
+
+
+class TestPartitionedOutputs(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        cfg.timestamp = '2017-01-01 00:00:00'
+        index = pd.MultiIndex.from_product((['A', 'B'], range(2020, 2025)), names=['SECTOR', 'YEAR'])
+        self.df = pd.DataFrame(np.arange(len(index), dtype=float), index=index, columns=['VALUE'])
+
+    def tearDown(self):
+        cfg.output_writer = None
+        shutil.rmtree(self.path)
+
+    def test_add_run_levels_matches_concat(self):
+        expected = self.df
+        for key, name in zip(['REFERENCE', cfg.timestamp], ['SCENARIO', 'TIMESTAMP']):
+            expected = pd.concat([expected], keys=[key], names=[name])
+        result = Output.add_run_levels(self.df, 'reference')
+        self.assertTrue(result.index.equals(expected.index))
+        self.assertEqual(list(result.index.names), list(expected.index.names))
+        np.testing.assert_array_equal(result.values, expected.values)
+
+    def test_merge_partitions(self):
+        cfg.output_writer = 'partitioned'
+        folder = os.path.join(self.path, 'supply_outputs')
+        for scenario in ('low', 'high'):
+            Output.write(Output.add_run_levels(self.df, scenario), 'test.csv', folder, partition=scenario)
+        Output.write(Output.add_run_levels(self.df, 'low'), 'test.csv', folder, partition='low')
+        Output.merge_partitions(self.path)
+        self.assertFalse(os.path.exists(os.path.join(folder, 'test.csv.parts')))
+        merged = pd.read_csv(os.path.join(folder, 'test.csv'))
+        self.assertEqual(list(merged.columns), ['TIMESTAMP', 'SCENARIO', 'SECTOR', 'YEAR', 'VALUE'])
+        self.assertEqual(len(merged), 3 * len(self.df))
+        self.assertEqual(sorted(merged['SCENARIO'].unique()), ['HIGH', 'LOW'])
+
+    def test_merge_leaves_other_partitions(self):
+        cfg.output_writer = 'partitioned'
+        folder = os.path.join(self.path, 'supply_outputs')
+        for scenario in ('low', 'high'):
+            Output.write(Output.add_run_levels(self.df, scenario), 'test.csv', folder, partition=scenario)
+        part_path = os.path.join(folder, 'test.csv.parts')
+        # a chunk another run is still writing
+        open(os.path.join(part_path, 'low.1.000000.csv.gz.tmp'), 'w').close()
+        Output.merge_partitions(self.path, partitions=['low'])
+        remaining = os.listdir(part_path)
+        self.assertEqual(len(remaining), 2)
+        self.assertIn('low.1.000000.csv.gz.tmp', remaining)
+        self.assertTrue(all(Output.chunk_partition(part) == 'high' for part in remaining if part.endswith('.csv.gz')))
+        self.assertEqual(len(pd.read_csv(os.path.join(folder, 'test.csv'))), len(self.df))
+        os.remove(os.path.join(part_path, 'low.1.000000.csv.gz.tmp'))
+        Output.merge_partitions(self.path)
+        self.assertFalse(os.path.exists(part_path))
+        merged = pd.read_csv(os.path.join(folder, 'test.csv'))
+        self.assertEqual(sorted(merged['SCENARIO'].unique()), ['HIGH', 'LOW'])
@@ -163,3 +163,31 @@ class TestRollover(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             rollover.run()
 
+
+    def _two_tech_rollovers(self):
+        # two technologies with the same survival functions and a different sales share and stock path per group
+        vintaged_markov_matrix = np.concatenate((self.vintaged_markov_matrix, self.vintaged_markov_matrix))
+        initial_markov_matrix = np.concatenate((self.initial_markov_matrix, self.initial_markov_matrix))
+        np.random.seed(0)
+        rollovers = []
+        for initial_stock, change_per_year in [(10000, 500), (0, 200), (5000, 0), (8000, -50), (10000, -3000)]:
+            sales_share = np.random.rand(self.num_years, 2, 2)
+            sales_share /= sales_share.sum(axis=1)[:, None, :]
+            rollovers.append(energyPATHWAYS.rollover.Rollover(vintaged_markov_matrix, initial_markov_matrix, self.num_years, self.num_vintages, 2,
+                                                              initial_stock=[initial_stock * .7, initial_stock * .3], sales_share=sales_share,
+                                                              stock_changes=np.array([change_per_year] * self.num_years, dtype=float)))
+        # specified stock is not batched
+        rollovers.append(energyPATHWAYS.rollover.Rollover(vintaged_markov_matrix, initial_markov_matrix, self.num_years, self.num_vintages, 2,
+                                                          specified_stock=np.array([[600, 400]] * self.num_years, dtype=float)))
+        return rollovers
+
+    def test_batched_rollovers_match_individual_runs(self):
+        individual = self._two_tech_rollovers()
+        for rollover in individual:
+            rollover.run()
+        batched = self._two_tech_rollovers()
+        energyPATHWAYS.rollover.run_rollovers(batched)
+        for expected, result in zip(individual, batched):
+            self.assertEqual(expected.i, result.i)
+            for expected_output, output in zip(expected.return_formatted_outputs(), result.return_formatted_outputs()):
+                np.testing.assert_allclose(output, expected_output, rtol=1e-9, atol=1e-9)
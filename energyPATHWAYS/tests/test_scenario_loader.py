@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from collections import defaultdict
+from energyPATHWAYS.scenario_loader import Scenario
+
+
+def make_scenario(measures, sensitivities):
+    # skips __init__, which reads the scenario file and the database
+    scenario = Scenario.__new__(Scenario)
+    scenario._measures = {category: defaultdict(list) for category in Scenario.MEASURE_CATEGORIES}
+    for category, bucket_id, measure_id in measures:
+        scenario._measures[category][bucket_id].append(measure_id)
+    scenario._sensitivities = defaultdict(dict)
+    for table, parent_id, sensitivity in sensitivities:
+        scenario._sensitivities[table][parent_id] = sensitivity
+    return scenario
+
+
+class TestDemandFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.measures = [('DemandEnergyEfficiencyMeasures', 1, 10), ('DemandEnergyEfficiencyMeasures', 2, 11)]
+        self.sensitivities = [('DemandDriversData', 3, 'high growth')]
+
+    def test_supply_side_changes_share_fingerprint(self):
+        base = make_scenario(self.measures, self.sensitivities)
+        supply = make_scenario(list(reversed(self.measures)) + [('SupplyStockMeasures', 4, 20)],
+                               self.sensitivities + [('SupplyEfficiencyData', 5, 'low cost')])
+        self.assertEqual(base.demand_fingerprint(), supply.demand_fingerprint())
+
+    def test_demand_side_changes_fingerprint(self):
+        base = make_scenario(self.measures, self.sensitivities)
+        measure = make_scenario(self.measures[:1], self.sensitivities)
+        sensitivity = make_scenario(self.measures, [('DemandDriversData', 3, 'low growth')])
+        self.assertNotEqual(base.demand_fingerprint(), measure.demand_fingerprint())
+        self.assertNotEqual(base.demand_fingerprint(), sensitivity.demand_fingerprint())
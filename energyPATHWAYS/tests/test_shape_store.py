@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from energyPATHWAYS.shape import ShapeStore
+
+
+class TestShapeStore(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ShapeStore(self.path)
+        index = pd.MultiIndex.from_product((range(1, 4), [2], pd.date_range('2015-01-01', periods=48, freq='H')),
+                                           names=['census division', 'timeshift_type', 'weather_datetime'])
+        self.values = pd.DataFrame(np.random.rand(len(index), 1), index=index, columns=['value'])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        self.store.save_values(7, self.values)
+        loaded = self.store.load_values(7)
+        self.assertTrue(loaded.index.equals(self.values.index))
+        self.assertEqual(list(loaded.index.names), list(self.values.index.names))
+        np.testing.assert_array_equal(loaded.values, self.values.values)
+
+    def test_overwrite_while_mapped(self):
+        self.store.save_values(7, self.values)
+        loaded = self.store.load_values(7)
+        self.store.save_values(7, self.values * 2)
+        np.testing.assert_array_equal(loaded.values, self.values.values)
+        np.testing.assert_array_equal(self.store.load_values(7).values, self.values.values * 2)
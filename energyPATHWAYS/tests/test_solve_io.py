@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+from scipy import sparse
+from energyPATHWAYS import solve_io
+
+
+class TestSolveIO(unittest.TestCase):
+    def setUp(self):
+        solve_io.clear_factorization_cache()
+        np.random.seed(1)
+        self.size = 30
+        # column sums below one keep (I - A) invertible, as in a real IO table
+        self.io = np.random.rand(self.size, self.size) * (np.random.rand(self.size, self.size) > .8) / self.size
+        self.demand = np.random.rand(self.size, 1)
+
+    def test_solve_with_demand(self):
+        expected = np.linalg.solve(np.eye(self.size) - self.io, self.demand)
+        npt.assert_allclose(solve_io.solve_IO(self.io, self.demand), expected)
+
+    def test_inverse(self):
+        expected = np.linalg.inv(np.eye(self.size) - self.io)
+        npt.assert_allclose(solve_io.solve_IO(self.io), expected)
+        npt.assert_allclose(solve_io.inv_IO(self.io), expected)
+
+    def test_sparse_matches_dense(self):
+        npt.assert_allclose(solve_io.solve_IO(sparse.csc_matrix(self.io), self.demand),
+                            solve_io.solve_IO(self.io, self.demand))
+        npt.assert_allclose(solve_io.solve_IO(sparse.csr_matrix(self.io)), solve_io.solve_IO(self.io))
+
+    def test_factorization_is_reused(self):
+        first = solve_io.factorize_IO(self.io)
+        self.assertIs(solve_io.factorize_IO(self.io.copy()), first)
+        changed = self.io.copy()
+        changed[0, 1] += .01
+        self.assertIsNot(solve_io.factorize_IO(changed), first)
+
+    def test_cache_is_bounded(self):
+        for i in range(solve_io.max_cached_factorizations + 3):
+            solve_io.factorize_IO(self.io * (1 - i / 100.))
+        self.assertEqual(len(solve_io._factorization_cache), solve_io.max_cached_factorizations)
+
+    def test_singular_matrix_raises(self):
+        with self.assertRaises(np.linalg.LinAlgError):
+            solve_io.solve_IO(np.eye(self.size))
+
+    def test_sparse_inverse_in_chunks(self):
+        inverse = solve_io.factorize_IO(sparse.csc_matrix(self.io)).inverse(chunk_size=7)
+        self.assertTrue(sparse.issparse(inverse))
+        npt.assert_allclose(inverse.toarray(), np.linalg.inv(np.eye(self.size) - self.io))
+
+    def _help_test_update_inverse(self, inverse, to_array):
+        changed = self.io.copy()
+        columns = [3, 17]
+        changed[:, columns] += np.random.rand(self.size, len(columns)) / self.size
+        updated = solve_io.update_inverse(inverse, columns, changed[:, columns] - self.io[:, columns])
+        npt.assert_allclose(to_array(updated), np.linalg.inv(np.eye(self.size) - changed))
+
+    def test_update_inverse(self):
+        self._help_test_update_inverse(solve_io.inv_IO(self.io), lambda x: x)
+
+    def test_update_sparse_inverse(self):
+        inverse = solve_io.factorize_IO(sparse.csc_matrix(self.io)).inverse()
+        self._help_test_update_inverse(inverse, lambda x: x.toarray())
+
+    def test_update_inverse_without_changes(self):
+        inverse = solve_io.inv_IO(self.io)
+        self.assertIs(solve_io.update_inverse(inverse, [], np.zeros((self.size, 0))), inverse)
@@ -90,6 +90,25 @@ class TestTimeSeries(unittest.TestCase):
         y = np.array([0, 0])
         self.run_all_cleaning_methods(x, y, newindex)
 
+    def test_cleanxy_rows_matches_cleanxy(self):
+        np.random.seed(1)
+        x = np.arange(2000, 2031)
+        y = np.random.rand(12, len(x)) + .5
+        y[np.random.rand(*y.shape) > .3] = np.NaN
+        y[0, :] = np.NaN
+        y[1, :] = np.NaN
+        y[1, 10] = .7
+        y[2, [0, -1]] = [.6, .9]
+        # datamapfunctions always passes exp_growth_rate, which changes the methods used for single points
+        for kwargs in ({}, {'exp_growth_rate': None}, {'exp_growth_rate': .02}):
+            for interpolation_method in TimeSeries.vectorized_methods:
+                for extrapolation_method in TimeSeries.vectorized_methods:
+                    cleaned = TimeSeries.cleanxy_rows(x, y, interpolation_method, extrapolation_method, **kwargs)
+                    for row in range(1, len(y)):
+                        expected = TimeSeries.cleanxy(x, y[row], x, interpolation_method, extrapolation_method, **kwargs)
+                        np.testing.assert_allclose(cleaned[row], expected)
+                    self.assertTrue(np.all(np.isnan(cleaned[0])))
+
     def run_all_cleaning_methods(self, x, y, newindex):
         for method in self.methods:
             data = pd.DataFrame(y, index=x)
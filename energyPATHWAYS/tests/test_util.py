@@ -52,4 +52,71 @@ class TestIdToName(unittest.TestCase):
         mock_sql_read_table.reset_mock()
         id_to_name('ghg_id', 2)
         # the second time everything needed should be cached so there should be no more db calls
-        self.assertFalse(mock_sql_read_table.called, "Redundant database access by id_to_name()")
\ No newline at end of file
+        self.assertFalse(mock_sql_read_table.called, "Redundant database access by id_to_name()")
+
+def read_currency_table(table_name, column_names='*', return_unique=False, return_iterable=False, **filters):
+    if table_name == 'InflationConversion' and tuple(column_names) == ('currency_id', 'currency_year_id', 'value'):
+        return [(41, 2010, 1.), (41, 2015, 1.1), (41, 2015, 1.3), (41, 2020, 1.5), (5, 2010, 2.)]
+
+    raise ValueError("Mock doesn't know how to provide this table read: " +
+                     str(table_name) + ", " + str(column_names) + ", " + str(filters))
+
+mock_sql_read_currency_table = mock.create_autospec(sql_read_table, side_effect=read_currency_table)
+
+@mock.patch('energyPATHWAYS.util.sql_read_table', mock_sql_read_currency_table)
+class TestCurrencyConversionValues(unittest.TestCase):
+    def setUp(self):
+        energyPATHWAYS.util.currency_conversion_values.memo = {}
+
+    def test_inflation_rate(self):
+        # duplicate entries for a year are averaged
+        self.assertAlmostEqual(inflation_rate(41, 2010, 2015), 1.2)
+        self.assertAlmostEqual(inflation_rate(41, 2020, 2010), 1 / 1.5)
+
+    def test_inflation_rate_across_years(self):
+        rates = inflation_rate(41, [2010, 2015, 2020], 2020)
+        self.assertEqual(len(rates), 3)
+        self.assertAlmostEqual(rates[0], 1.5)
+        self.assertAlmostEqual(rates[1], 1.5 / 1.2)
+        self.assertAlmostEqual(rates[2], 1.)
+
+    def test_missing_year(self):
+        with self.assertRaises(KeyError):
+            inflation_rate(5, 2010, 2015)
+
+    def test_caching(self):
+        mock_sql_read_currency_table.reset_mock()
+        inflation_rate(41, 2010, 2015)
+        inflation_rate(41, 2015, 2020)
+        self.assertEqual(mock_sql_read_currency_table.call_count, 1, "Currency table read more than once")
+
+class TestCopyOutputData(unittest.TestCase):
+    def setUp(self):
+        self.copied = []
+        def copy_expert(query, buf):
+            self.copied.append((query, buf.read()))
+        self.cur = mock.Mock()
+        self.cur.copy_expert.side_effect = copy_expert
+
+    def test_copy_in_chunks(self):
+        df = pd.DataFrame({'SECTOR': ['RESIDENTIAL', 'COMMERCIAL, OFFICE', 'TRANSPORTATION'],
+                           'YEAR': [2020, 2020, 2021], 'EJ': [1.5, np.nan, 3.]}, columns=['SECTOR', 'YEAR', 'EJ'])
+        with mock.patch('energyPATHWAYS.config.cur', self.cur):
+            copy_output_data(7, df, chunk_size=2)
+        self.assertEqual(len(self.copied), 2)
+        self.assertEqual(self.copied[0][0], 'COPY public_runs.output_data (parent_id, series, year, value) FROM STDIN WITH CSV')
+        rows = ''.join(data for query, data in self.copied).splitlines()
+        self.assertEqual(rows, ['7,RESIDENTIAL,2020,1.5', '7,"COMMERCIAL, OFFICE",2020,NaN', '7,TRANSPORTATION,2021,3.0'])
+
+class TestIndexProduct(unittest.TestCase):
+    def test_matches_from_product(self):
+        index = pd.MultiIndex.from_product([['b', 'a'], [3, 1, 2]], names=['geo', 'supply_node'])
+        result = index_product('sector', [2, 1], index)
+        expected = pd.MultiIndex.from_tuples([(s,) + i for s in [2, 1] for i in index], names=['sector', 'geo', 'supply_node'])
+        self.assertTrue(result.equals(expected))
+        self.assertEqual(list(result.names), list(expected.names))
+
+class TestTupleFromLabel(unittest.TestCase):
+    def test_matches_eval(self):
+        for label in ['(1L, 5L, 2020L)', '(1, 5, 2020)', str((np.int64(3), 2050L)), '(7L,)']:
+            self.assertEqual(tuple_from_label(label), eval(label))
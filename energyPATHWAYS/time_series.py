@@ -320,18 +320,110 @@ class TimeSeries:
         data = util.reindex_df_level_with_new_elements(data, time_index_name, wholeindex)
         
 
-        group_levels = tuple([n for n in data.index.names if n != time_index_name])
-        data = data.groupby(level=group_levels).apply(TimeSeries._clean_multindex_helper,
-                                                      time_index_name=time_index_name,
-                                                      newindex=wholeindex,
-                                                      interpolation_method=interpolation_method,
-                                                      extrapolation_method=extrapolation_method,
-                                                      **kwargs)
+        if TimeSeries._is_vectorizable(interpolation_method, extrapolation_method):
+            for colname in data.columns:
+                # one row per group, one column per year
+                table = data[colname].unstack(time_index_name).reindex(columns=wholeindex)
+                cleaned = pd.DataFrame(TimeSeries.cleanxy_rows(wholeindex, table.values.astype(float), interpolation_method, extrapolation_method, **kwargs),
+                                       index=table.index, columns=table.columns)
+                data[colname] = cleaned.stack(dropna=False).reorder_levels(data.index.names).reindex(data.index).values
+        else:
+            group_levels = tuple([n for n in data.index.names if n != time_index_name])
+            data = data.groupby(level=group_levels).apply(TimeSeries._clean_multindex_helper,
+                                                          time_index_name=time_index_name,
+                                                          newindex=wholeindex,
+                                                          interpolation_method=interpolation_method,
+                                                          extrapolation_method=extrapolation_method,
+                                                          **kwargs)
         
         data = util.reindex_df_level_with_new_elements(data, time_index_name, newindex)
 
         return data
 
+    # cleaning methods that cleanxy_rows can apply to all groups at once
+    vectorized_methods = (None, 'none', 'linear_interpolation', 'nearest', 'exponential', 'average', 'mean')
+
+    @staticmethod
+    def _is_vectorizable(interpolation_method, extrapolation_method):
+        return interpolation_method in TimeSeries.vectorized_methods and extrapolation_method in TimeSeries.vectorized_methods
+
+    @staticmethod
+    def _run_cleaning_method_rows(x, y, method, first, last, prev_good, next_good, **kwargs):
+        """ _run_cleaning_method for each row of y, where x (the time index) is shared by all rows, and
+        first, last, prev_good and next_good give the positions of the finite values of each row
+        """
+        rows = np.arange(len(y))[:, None]
+        y_prev, y_next = y[rows, np.clip(prev_good, 0, None)], y[rows, np.clip(next_good, None, len(x) - 1)]
+        x_prev, x_next = x[np.clip(prev_good, 0, None)], x[np.clip(next_good, None, len(x) - 1)]
+        before, after = prev_good < 0, next_good >= len(x)
+        if method == 'linear_interpolation':
+            # linear spline through the good points, extrapolated along the first and last segments
+            second = next_good[rows[:, 0], np.clip(first + 1, None, len(x) - 1)]
+            second_last = prev_good[rows[:, 0], np.clip(last - 1, 0, None)]
+            lower = np.where(before, first[:, None], np.where(after, second_last[:, None], prev_good))
+            upper = np.where(before, second[:, None], np.where(after, last[:, None], next_good))
+            x_lower, x_upper = x[lower], x[upper]
+            y_lower, y_upper = y[rows, lower], y[rows, upper]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fill = y_lower + (y_upper - y_lower) * (x - x_lower) / (x_upper - x_lower)
+            return np.where(lower == upper, y_lower, fill)
+        elif method == 'nearest':
+            # ties go to the earlier point, as in scipy's interp1d
+            fill = np.where(x <= (x_prev + x_next) / 2., y_prev, y_next)
+            fill = np.where(before, y_next, fill)
+            return np.where(after, y_prev, fill)
+        elif method == 'exponential':
+            y_first, y_last = y[rows[:, 0], first][:, None], y[rows[:, 0], last][:, None]
+            growth_rate = kwargs.get('exp_growth_rate')
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                if growth_rate is None:
+                    growth_rate = (y_last / y_first) ** (1. / (x[last] - x[first]))[:, None]
+                else:
+                    growth_rate = growth_rate + 1
+                gap_rate = (y_next / y_prev) ** (1. / (x_next - x_prev))
+                fill = np.where(before, y_first * growth_rate ** (x - x[first][:, None]), y_next * gap_rate ** (x - x_next))
+                fill = np.where(after, y_last * growth_rate ** (x - x[last][:, None]), fill)
+            return np.where(np.isfinite(y), y, fill)
+        elif method == 'average' or method == 'mean':
+            return np.tile(np.nanmean(y, axis=1)[:, None], (1, len(x)))
+        else:
+            raise ValueError("{} is not a known vectorized cleaning method type".format(method))
+
+    @staticmethod
+    def cleanxy_rows(x, y, interpolation_method=None, extrapolation_method=None, replace_training_data=True, **kwargs):
+        """ cleanxy for every row of the 2-D array y at once, where each row is a time series over the time index x.
+        Only the methods in TimeSeries.vectorized_methods are supported. Rows without finite values are returned as is
+        """
+        x = np.asarray(x, dtype=float)
+        yhat = y.copy()
+        good = np.isfinite(y)
+        positions = np.tile(np.arange(len(x)), (len(y), 1))
+        prev_good = np.maximum.accumulate(np.where(good, positions, -1), axis=1)
+        next_good = np.minimum.accumulate(np.where(good, positions, len(x))[:, ::-1], axis=1)[:, ::-1]
+        first, last = next_good[:, 0], prev_good[:, -1]
+        num_good = good.sum(axis=1)
+        # rows with a single point use the method substitutions of _clean_method_checks
+        for rows in (np.nonzero(num_good == 1)[0], np.nonzero(num_good > 1)[0]):
+            if not len(rows):
+                continue
+            methods = [interpolation_method, extrapolation_method]
+            if num_good[rows[0]] == 1:
+                methods = [m if (m is None or m == 'none') else 'nearest' for m in methods]
+            interp, extrap = methods
+            row_args = (y[rows], first[rows], last[rows], prev_good[rows], next_good[rows])
+            row_yhat = y[rows].copy()
+            if interp is not None and interp != 'none':
+                row_yhat = TimeSeries._run_cleaning_method_rows(x, row_args[0], interp, *row_args[1:], **kwargs)
+            extrap_index = (x < x[first[rows]][:, None]) | (x > x[last[rows]][:, None])
+            if extrap is None or extrap == 'none':
+                row_yhat[extrap_index] = np.NaN
+            elif extrap != interp and np.any(extrap_index):
+                row_yhat[extrap_index] = TimeSeries._run_cleaning_method_rows(x, row_args[0], extrap, *row_args[1:], **kwargs)[extrap_index]
+            if not replace_training_data:
+                row_yhat[good[rows]] = y[rows][good[rows]]
+            yhat[rows] = row_yhat
+        return yhat
+
     @staticmethod
     def _clean_multindex_helper(data, time_index_name, newindex, interpolation_method=None, extrapolation_method=None, **kwargs):
         
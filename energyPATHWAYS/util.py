@@ -32,6 +32,7 @@ import psycopg2
 import logging
 import pdb
 from operator import mul
+from StringIO import StringIO
 
 from psycopg2.extensions import register_adapter, AsIs
 def addapt_numpy_float64(numpy_float64):
@@ -210,6 +211,8 @@ def sql_read_table(table_name, column_names='*', return_unique=False, return_ite
 def sql_get_datatype(table_name, column_names):
     if isinstance(column_names, basestring):
         column_names = [column_names]
+    if cfg.table_datatypes is not None:
+        return dict([(col, dtype) for col, dtype in cfg.table_datatypes.get(table_name, {}).items() if col in column_names])
     cfg.cur.execute("select column_name, data_type from INFORMATION_SCHEMA.COLUMNS where table_name = %s and table_schema = 'public';", (table_name,))
     table_info = cfg.cur.fetchall()
     return dict([tup for tup in table_info if tup[0] in column_names])
@@ -255,6 +258,8 @@ def sql_read_dataframe(table_name, index_column_name=None, data_column_names='*'
 
 
 def sql_read_headers(table_name):
+    if cfg.table_columns is not None:
+        return list(cfg.table_columns.get(table_name, []))
     cfg.cur.execute("select column_name from INFORMATION_SCHEMA.COLUMNS where table_name = %s and table_schema = 'public';", (table_name,))
     table_info = cfg.cur.fetchall()
     # return list of all column headers
@@ -274,6 +279,28 @@ def sql_read_dict(table_name, key_col, value_col):
         return sql_read_dict.memo[memo_key]
 sql_read_dict.memo = {}
 
+def sql_read_grouped_table(table_name, group_col):
+    """
+    Reads a whole table with one query and returns its headers and a dictionary of group_col value -> DataFrame of
+    the rows in that group. Columns are kept as object dtype so that the values are the same python objects that a
+    filtered sql_read_table call would return.
+    Memoizes the results so each table is only loaded from the database once (see clear_grouped_table_memo).
+    """
+    memo_key = (table_name, group_col)
+    try:
+        return sql_read_grouped_table.memo[memo_key]
+    except KeyError:
+        headers = sql_read_headers(table_name)
+        cfg.cur.execute('SELECT ' + ', '.join(['"%s"' % col for col in headers]) + ' FROM "%s"' % table_name)
+        table = pd.DataFrame(cfg.cur.fetchall(), columns=headers, dtype=object)
+        groups = dict(list(table.groupby(group_col, sort=False))) if len(table) else {}
+        sql_read_grouped_table.memo[memo_key] = (headers, groups)
+        return sql_read_grouped_table.memo[memo_key]
+sql_read_grouped_table.memo = {}
+
+def clear_grouped_table_memo():
+    sql_read_grouped_table.memo = {}
+
 def active_scenario_run_id(scenario_id):
     query = """
                 SELECT public_runs.scenario_runs.id
@@ -326,7 +353,26 @@ def update_status(scenario_id, status_id):
     cfg.con.commit()
 
 
-def write_output_to_db(scenario_run_id, output_type_id, output_df, keep_cut_off=0.001):
+# rows sent per COPY when writing outputs to the database
+output_copy_chunk_size = 100000
+
+def copy_output_data(output_id, df, chunk_size=None):
+    """ bulk loads the (series, year, value) or (year, value) rows of df into public_runs.output_data using COPY,
+    streaming chunk_size rows at a time through an in-memory buffer
+    """
+    columns = ['parent_id', 'series', 'year', 'value'] if len(df.columns) == 3 else ['parent_id', 'year', 'value']
+    query = 'COPY public_runs.output_data ({}) FROM STDIN WITH CSV'.format(', '.join(columns))
+    data = df.copy()
+    data.insert(0, 'parent_id', output_id)
+    chunk_size = chunk_size or output_copy_chunk_size
+    for start in range(0, len(data), chunk_size):
+        buf = StringIO()
+        # NaN is written as it is by psycopg2 when values are adapted one at a time
+        data.iloc[start:start + chunk_size].to_csv(buf, header=False, index=False, na_rep='NaN')
+        buf.seek(0)
+        cfg.cur.copy_expert(query, buf)
+
+def write_output_to_db(scenario_run_id, output_type_id, output_df, keep_cut_off=0.001, commit=True):
     # For output_type_ids, see api/models.py. I am reluctant to import that file here because I don't want its
     # dependencies (e.g. SQLAlchemy) to become dependencies of the main model yet.
     output_df = output_df.reset_index().set_index(output_df.index.names)
@@ -355,16 +401,11 @@ def write_output_to_db(scenario_run_id, output_type_id, output_df, keep_cut_off=
                        VALUES (%s, %s, %s) RETURNING id""", (scenario_run_id, output_type_id, unit))
     output_id = cfg.cur.fetchone()[0]
 
-    if len(df.columns)==3:
-        values_str = ','.join(cfg.cur.mogrify("(%s,%s,%s,%s)", (output_id, row[0], row[1], row[2]))
-                              for row in df.itertuples(index=False))
-        cfg.cur.execute("INSERT INTO public_runs.output_data (parent_id, series, year, value) VALUES " + values_str)
-    elif len(df.columns)==2:
-        values_str = ','.join(cfg.cur.mogrify("(%s,%s,%s)", (output_id, row[0], row[1]))
-                              for row in df.itertuples(index=False))
-        cfg.cur.execute("INSERT INTO public_runs.output_data (parent_id, year, value) VALUES " + values_str)
+    copy_output_data(output_id, df)
 
-    cfg.con.commit()
+    # commit is False when the caller commits a whole export at once (see PathwaysModel.export_results_to_db)
+    if commit:
+        cfg.con.commit()
 
 
 def unpack_dict(dictionary, _keys=None, return_items=True):
@@ -388,6 +429,16 @@ def unpack_dict(dictionary, _keys=None, return_items=True):
                 yield value
 
 
+def unit_quantity(unit):
+    """returns a pint Quantity for a unit string, parsing each unit only once"""
+    try:
+        return unit_quantity.memo[unit]
+    except KeyError:
+        unit_quantity.memo[unit] = cfg.ureg.Quantity(unit)
+        return unit_quantity.memo[unit]
+unit_quantity.memo = {}
+
+
 def unit_conversion_factor(unit_from, unit_to):
     """return data converted from unit_from to unit_to"""
     if unit_from is None or unit_to is None:
@@ -396,6 +447,12 @@ def unit_conversion_factor(unit_from, unit_to):
         if unit_from == unit_to:
             # if unit_from and unit_to are equal then no conversion is necessary
             return 1.
+        elif isinstance(unit_from, basestring) and isinstance(unit_to, basestring):
+            # conversion factors between named units are memoized by unit pair
+            memo_key = (unit_from, unit_to)
+            if memo_key not in unit_conversion_factor.memo:
+                unit_conversion_factor.memo[memo_key] = quantity_conversion_factor(unit_quantity(unit_from), unit_quantity(unit_to), unit_from, unit_to)
+            return unit_conversion_factor.memo[memo_key]
         else:
             try:
                 unit_from.magnitude()
@@ -407,25 +464,78 @@ def unit_conversion_factor(unit_from, unit_to):
                 quant_to = unit_to
             except:
                 quant_to = cfg.ureg.Quantity(unit_to)
-            if quant_from.dimensionality == quant_to.dimensionality:
-                # return conversion factor
-                return quant_from.to(quant_to).magnitude
-            else:
-                # if the dimensionality of unit_from and unit_too (i.e. length to energy) are
-                # not equal, then raise ValueError
-                error_text = "%s not convertible to %s" % (unit_from, unit_to)
-                raise ValueError(error_text)
+            return quantity_conversion_factor(quant_from, quant_to, unit_from, unit_to)
+unit_conversion_factor.memo = {}
+
+
+def quantity_conversion_factor(quant_from, quant_to, unit_from, unit_to):
+    if quant_from.dimensionality == quant_to.dimensionality:
+        # return conversion factor
+        return quant_from.to(quant_to).magnitude
+    else:
+        # if the dimensionality of unit_from and unit_too (i.e. length to energy) are
+        # not equal, then raise ValueError
+        error_text = "%s not convertible to %s" % (unit_from, unit_to)
+        raise ValueError(error_text)
+
+
+def clear_unit_conversion_memo():
+    """parsed quantities belong to one pint registry, so the memos are cleared whenever cfg.ureg is rebuilt"""
+    unit_quantity.memo = {}
+    unit_conversion_factor.memo = {}
+
+
+def sql_read_database_units():
+    """returns every distinct unit in the database, read from the unit columns of all tables"""
+    units = set()
+    for table_name, columns in cfg.table_columns.items():
+        for col in columns:
+            if col == 'unit' or col.endswith('_unit'):
+                cfg.cur.execute('SELECT DISTINCT "%s" FROM "%s"' % (col, table_name))
+                units |= set(row[0] for row in cfg.cur.fetchall() if isinstance(row[0], basestring))
+    return units
+
+
+def precompute_unit_conversion_factors(units):
+    """fills the unit_conversion_factor memo for every pair of convertible units"""
+    units_by_dimensionality = defaultdict(list)
+    for unit in set(units):
+        try:
+            units_by_dimensionality[str(unit_quantity(unit).dimensionality)].append(unit)
+        except Exception:
+            logging.debug('unit {} could not be parsed and is not precomputed'.format(unit))
+    for units in units_by_dimensionality.values():
+        for unit_from, unit_to in itertools.permutations(units, 2):
+            unit_conversion_factor(unit_from, unit_to)
+
+
+def currency_conversion_values(table_name, currency_id, currency_year_id):
+    """
+    returns the mean value in a currency conversion table (CurrenciesConversion or InflationConversion) for a
+    currency in one year, or an array of values if currency_year_id is array-like.
+    Memoizes the tables so each is only loaded from the database once.
+    """
+    try:
+        by_currency = currency_conversion_values.memo[table_name]
+    except KeyError:
+        data = pd.DataFrame(sql_read_table(table_name, ('currency_id', 'currency_year_id', 'value'), return_iterable=True),
+                            columns=['currency_id', 'currency_year_id', 'value'])
+        by_currency = dict((int(currency), group.groupby('currency_year_id')['value'].mean()) for currency, group in data.groupby('currency_id'))
+        currency_conversion_values.memo[table_name] = by_currency
+    years = np.asarray(currency_year_id, dtype=int)
+    values = by_currency[int(currency_id)].reindex(years.ravel()).values.astype(float)
+    if np.isnan(values).any():
+        raise KeyError('{} has no value for currency {} in year(s) {}'.format(table_name, currency_id, currency_year_id))
+    return values[0] if years.ndim == 0 else values
+currency_conversion_values.memo = {}
 
 
 def exchange_rate(currency_from, currency_from_year, currency_to=None):
     """calculate exchange rate between two specified currencies"""
     try:
-        currency_to_name = cfg.cfgfile.get('case', 'currency_name') if currency_to is None else sql_read_table('Currencies',column_names='name',id=currency_to)
-        currency_to = sql_read_table('Currencies',column_names='id',name=currency_to_name)
-        currency_from_values = sql_read_table('CurrenciesConversion', 'value', currency_id=currency_from,currency_year_id=currency_from_year)
-        currency_from_value = np.asarray(currency_from_values).mean()
-        currency_to_values = sql_read_table('CurrenciesConversion', 'value', currency_id=currency_to,currency_year_id=currency_from_year)
-        currency_to_value = np.asarray(currency_to_values).mean()
+        currency_to = sql_read_dict('Currencies', 'name', 'id')[cfg.cfgfile.get('case', 'currency_name')] if currency_to is None else currency_to
+        currency_from_value = currency_conversion_values('CurrenciesConversion', currency_from, currency_from_year)
+        currency_to_value = currency_conversion_values('CurrenciesConversion', currency_to, currency_from_year)
     except:
         pdb.set_trace()
     return currency_to_value / currency_from_value
@@ -434,32 +544,29 @@ def exchange_rate(currency_from, currency_from_year, currency_to=None):
 def inflation_rate(currency, currency_from_year, currency_to_year=None):
     """calculate inflation rate between two years in a specified currency"""
     currency_to_year = cfg.cfgfile.get('case', 'currency_year_id') if currency_to_year is None else currency_to_year
-    currency_from_values = sql_read_table('InflationConversion', 'value', currency_id=currency,
-                                          currency_year_id=currency_from_year)
-    currency_from_value = np.asarray(currency_from_values).mean()
-    currency_to_values = sql_read_table('InflationConversion', 'value', currency_id=currency,
-                                        currency_year_id=currency_to_year)
-    currency_to_value = np.asarray(currency_to_values).mean()
+    currency_from_value = currency_conversion_values('InflationConversion', currency, currency_from_year)
+    currency_to_value = currency_conversion_values('InflationConversion', currency, currency_to_year)
     return currency_to_value / currency_from_value
 
 
 def currency_convert(data, currency_from, currency_from_year):
-    """converts cost data in original currency specifications (currency,year) to model currency and year"""
+    """converts cost data in original currency specifications (currency,year) to model currency and year
+    currency_from_year can be a single year or an array with a year for each row of data
+    """
     currency_to_name, currency_to_year = cfg.cfgfile.get('case', 'currency_name'), int(cfg.cfgfile.get('case', 'currency_year_id'))
-    currency_to = sql_read_table('Currencies',column_names='id',name=currency_to_name)
+    currency_to = sql_read_dict('Currencies', 'name', 'id')[currency_to_name]
     # inflate in original currency and then exchange in model currency year
     
     try:
         a = inflation_rate(currency_from, currency_from_year)
         b = exchange_rate(currency_from, currency_to_year)
-        data *= a * b
-        return data
+        return _scale_by_row(data, a * b, inplace=True)
     except:
         try:
             # convert to model currency in original currency year and then inflate to model currency year
             a = exchange_rate(currency_from, currency_from_year)
             b = inflation_rate(currency_to, currency_from_year)
-            return data * a * b
+            return _scale_by_row(data, a * b)
         except:
             try:
                 # use a known inflation data point of the USD. Exchange from original currency to USD
@@ -467,10 +574,20 @@ def currency_convert(data, currency_from, currency_from_year):
                 a = exchange_rate(currency_from, currency_from_year, currency_to=41)
                 b = inflation_rate(currency=41, currency_from_year=currency_from_year)
                 c = exchange_rate(currency_from=41, currency_from_year=currency_to_year, currency_to=currency_to)
-                return data * a * b * c
+                return _scale_by_row(data, a * b * c)
             except:
                 raise ValueError(
                     "currency conversion failed. Make sure that the data in InflationConvert and CurrencyConvert can support this conversion")
+
+
+def _scale_by_row(data, factor, inplace=False):
+    """multiplies data by a scalar factor, or each row of data by its own factor"""
+    if np.ndim(factor) == 0:
+        if inplace:
+            data *= factor
+            return data
+        return data * factor
+    return data.mul(factor, axis=0) if hasattr(data, 'mul') else data * np.asarray(factor).reshape((-1,) + (1,) * (np.ndim(data) - 1))
         
 
 def unit_conversion(unit_from_num=None, unit_from_den=None, unit_to_num=None, unit_to_den=None):
@@ -961,6 +1078,21 @@ def get_elements_from_level(df, level_name):
         df.index.levels[position_in_index(df, level_name)] if df.index.nlevels > 1 else df.index)
 
 
+# alignment plans of DfOper, keyed by the names and lengths of the two indexes being combined. The cache is bounded
+# by the total rows of the indexes it holds, and plans for indexes larger than max_cached_alignment_plan_rows are
+# never cached
+max_cached_alignment_plans = 256
+max_cached_alignment_rows = 5000000
+max_cached_alignment_plan_rows = 500000
+_alignment_plan_cache = OrderedDict()
+_alignment_plan_rows = {}
+
+
+def clear_alignment_plan_cache():
+    _alignment_plan_cache.clear()
+    _alignment_plan_rows.clear()
+
+
 class DfOper:
     @staticmethod
     def add(df_iter, expandable=True, collapsible=True, join=None, fill_value=0, non_expandable_levels=('year', 'vintage')):
@@ -1024,8 +1156,11 @@ class DfOper:
         names_a_not_in_b, names_b_not_in_a = difference_in_df_names(new_a, new_b)
         if not names_a_not_in_b and not names_b_not_in_a:
             join = join if join is not None else ('outer' if fill_value is not None else 'left')
-            new_a, new_b = new_a.align(reorder_b_to_match_a(new_b, new_a), join=join, fill_value=fill_value, axis=0,
-                                       copy=False)
+            new_b = reorder_b_to_match_a(new_b, new_a)
+            index, a_rows, b_rows = DfOper._alignment_plan(new_a.index, new_b.index, join,
+                                                           lambda: DfOper._join_plan(new_a.index, new_b.index, join))
+            new_a = DfOper._apply_plan(new_a, index, a_rows, fill_value)
+            new_b = DfOper._apply_plan(new_b, index, b_rows, fill_value)
             return DfOper._operate(new_a, new_b, action)
         else:
             # if quick_merge: # this is still a work in progress
@@ -1064,6 +1199,84 @@ class DfOper:
     #     new_b = reorder_b_to_match_a(new_b, new_a)
     #     return new_a, new_b
 
+    @staticmethod
+    def _alignment_plan(a_index, b_index, how, build_plan):
+        """ returns the (index, a_rows, b_rows) plan for combining a_index and b_index, where a_rows and b_rows give
+        the row of each side for every element of index (-1 where a side is missing the row, None if the rows are
+        unchanged). build_plan is only called the first time a pair of indexes is seen, after which the operation is
+        pure numpy indexing
+        """
+        key = (tuple(a_index.names), len(a_index), tuple(b_index.names), len(b_index), how)
+        entries = _alignment_plan_cache.pop(key, [])
+        plan = None
+        for cached_a, cached_b, cached_plan in entries:
+            # Index.equals ignores names, so they are checked separately
+            if cached_a.equals(a_index) and cached_b.equals(b_index) and \
+                    list(cached_a.names) == list(a_index.names) and list(cached_b.names) == list(b_index.names):
+                plan = cached_plan
+                break
+        if plan is None:
+            plan = build_plan()
+            rows = len(a_index) + len(b_index) + len(plan[0])
+            if rows > max_cached_alignment_plan_rows:
+                if entries:
+                    _alignment_plan_cache[key] = entries
+                return plan
+            # the cache keeps its own copies, since callers rename index levels in place (see replace_index_name)
+            plan = (plan[0].copy(), plan[1], plan[2])
+            entries = [(a_index.copy(), b_index.copy(), plan)] + entries[:3]
+            _alignment_plan_rows[key] = sum(len(a) + len(b) + len(p[0]) for a, b, p in entries)
+        # move to the end so that the least recently used plans are the first to be dropped
+        _alignment_plan_cache[key] = entries
+        while len(_alignment_plan_cache) > 1 and (len(_alignment_plan_cache) > max_cached_alignment_plans or
+                                                  sum(_alignment_plan_rows.values()) > max_cached_alignment_rows):
+            _alignment_plan_rows.pop(_alignment_plan_cache.popitem(last=False)[0], None)
+        return plan
+
+    @staticmethod
+    def _join_plan(a_index, b_index, how):
+        """ alignment plan for two indexes with the same levels, equivalent to DataFrame.align """
+        if a_index.equals(b_index):
+            return a_index, None, None
+        return a_index.join(b_index, how=how, return_indexers=True)
+
+    @staticmethod
+    def _merge_plan(a_index, b_index, how, common_names, a_names, b_names):
+        """ alignment plan for two indexes with different levels, equivalent to a merge on the common levels """
+        a_rows = pd.DataFrame({'_a_row': np.arange(len(a_index))}, index=a_index).reset_index()
+        b_rows = pd.DataFrame({'_b_row': np.arange(len(b_index))}, index=b_index).reset_index()
+        c = pd.merge(a_rows, b_rows, how=how, on=common_names)
+
+        new_index = [x for x in c.columns.tolist() if x not in ('_a_row', '_b_row')]
+        # This next bit of code helps return the levels in a familiar order
+        alen, blen = float(len(a_names) - 1), float(len(b_names) - 1)
+        alen, blen = max(alen, 1), max(blen, 1)  # avoid error from dividing by zero
+        average_location = [a_names.index(cand) / alen if cand in a_names else b_names.index(cand) / blen for cand in new_index]
+        new_index = [new_index[ni] for ni in np.argsort(average_location)]
+        c = c.set_index(new_index).sort()
+        return c.index, c['_a_row'].fillna(-1).values.astype(int), c['_b_row'].fillna(-1).values.astype(int)
+
+    @staticmethod
+    def _apply_plan(df, index, rows, fill_value=None):
+        """ takes the rows of df given by an alignment plan, filling rows of -1 with fill_value (NaN if None). The result
+        always gets its own index, so renaming its levels doesn't touch the cached plan or df
+        """
+        if rows is None:
+            df = df.copy(deep=False)
+            df.index = df.index.copy()
+            return df
+        values = df.values
+        missing = rows < 0
+        if len(values):
+            values = values[np.where(missing, 0, rows)]
+        else:
+            values = np.empty((len(rows), values.shape[1]))
+        if missing.any():
+            if values.dtype.kind in 'biu':
+                values = values.astype(float)
+            values[missing] = np.NaN if fill_value is None else fill_value
+        return pd.DataFrame(values, index=index.copy(), columns=df.columns)
+
     @staticmethod
     def _operate(a, b, action):
         col = b.columns if len(b.columns) > len(a.columns) else a.columns
@@ -1076,9 +1289,10 @@ class DfOper:
         elif action == '-':
             return pd.DataFrame(a.values - b.values, index=a.index, columns=col)
         elif action == None:
-            return pd.DataFrame(a.values, index=a.index, columns=col)
+            # a and b may share their values with the inputs (see _apply_plan)
+            return pd.DataFrame(a.values.copy(), index=a.index, columns=col)
         elif action == 'replace':
-            return pd.DataFrame(b.values, index=a.index, columns=col)
+            return pd.DataFrame(b.values.copy(), index=a.index, columns=col)
 
     @staticmethod
     def _raise_errors(a, b, action, a_can_collapse, a_can_expand, b_can_collapse, b_can_expand):
@@ -1168,9 +1382,6 @@ class DfOper:
         names_a_not_in_b, names_b_not_in_a = list(set(a_names) - set(b_names)), list(set(b_names) - set(a_names))
         if not len(common_names):
             raise ValueError('DataFrames have no common index level names for a merge')
-        a_cols, b_cols = a.columns.values, b.columns.values
-        merged_a_cols = [str(col) + "_a" if col in b_cols else col for col in a_cols]
-        merged_b_cols = [str(col) + "_b" if col in a_cols else col for col in b_cols]
 
         # Eliminate levels for one when the other is not expandable
         new_a = a.groupby(level=common_names).sum() if (len(names_a_not_in_b) > 0 and not b_can_expand) and a_can_collapse else a
@@ -1184,25 +1395,11 @@ class DfOper:
         if join is None:
             join = 'right' if len(b.columns) > len(a.columns) else 'left'
 
-        c = pd.merge(new_a.reset_index(), new_b.reset_index(), how=join, on=common_names, suffixes=["_a", "_b"])
-
-        new_index = [x for x in c.columns.tolist() if (x not in merged_a_cols) and (x not in merged_b_cols)]
-        # This next bit of code helps return the levels in a familiar order
-        alen, blen = float(len(a_names) - 1), float(len(b_names) - 1)
-        alen, blen = max(alen, 1), max(blen, 1)  # avoid error from dividing by zero
-        average_location = [a_names.index(cand) / alen if cand in a_names else b_names.index(cand) / blen for cand in new_index]
-        new_index = [new_index[ni] for ni in np.argsort(average_location)]
-        c = c.set_index(new_index).sort()
-        # new_a, new_b = c[new_index + merged_a_cols], c[new_index + merged_b_cols]
-        new_a, new_b = c[merged_a_cols], c[merged_b_cols]
-        # new_a = new_a.set_index(new_index).sort()
-        # new_b = new_b.set_index(new_index).sort()
-
-        # new_a.sort(inplace=True)
-        # new_b.sort(inplace=True)
-
-        new_a = new_a.rename(columns=dict(zip(merged_a_cols, a_cols)))
-        new_b = new_b.rename(columns=dict(zip(merged_b_cols, b_cols)))
+        # the merge of the two indexes is cached, so repeat operations on the same index structures skip pd.merge
+        index, a_rows, b_rows = DfOper._alignment_plan(new_a.index, new_b.index, (join, tuple(common_names), tuple(a_names), tuple(b_names)),
+                                                       lambda: DfOper._merge_plan(new_a.index, new_b.index, join, common_names, a_names, b_names))
+        new_a = DfOper._apply_plan(new_a, index, a_rows)
+        new_b = DfOper._apply_plan(new_b, index, b_rows)
 
         if fill_value is not None:
             new_a = new_a.fillna(fill_value)
@@ -1273,6 +1470,10 @@ def flatten_list(list_to_flatten):
     """Returns a list with sublists removed"""
     return [item for sublist in list_to_flatten for item in sublist]
 
+def tuple_from_label(label):
+    """Parses a label made with str() from a tuple of integers, e.g. '(1L, 5L, 2020L)', without using eval"""
+    return tuple(int(element.strip().rstrip('L')) for element in label.strip('()').split(',') if element.strip())
+
 def reindex_df_level_with_new_elements(df, level_name, new_elements, fill_value=np.nan):
     if (df.index.nlevels > 1 and level_name not in df.index.names) or (df.index.nlevels == 1 and level_name != df.index.name):
         return df
@@ -1296,6 +1497,19 @@ def find_weibul_beta(mean_lifetime, lifetime_variance):
         return cfg.weibul_coeff_of_var['beta'][nearest_index(cfg.weibul_coeff_of_var['mean/std'], mean_to_std)]
 
 
+def index_product(name, elements, index):
+    """ MultiIndex with a new outer level called name, where every one of elements is crossed with all of index.
+    Built from level labels rather than tuples, so it stays cheap for large indexes
+    """
+    if isinstance(index, pd.MultiIndex):
+        levels, labels, names = list(index.levels), [np.asarray(l) for l in index.labels], list(index.names)
+    else:
+        codes, uniques = pd.factorize(index)
+        levels, labels, names = [uniques], [codes], [index.name]
+    outer = np.repeat(np.arange(len(elements)), len(index))
+    return pd.MultiIndex(levels=[list(elements)] + levels, labels=[outer] + [np.tile(l, len(elements)) for l in labels],
+                         names=[name] + names, verify_integrity=False)
+
 def add_and_set_index(df, name, elements, index_location=None):
     name, elements = ensure_iterable_and_not_string(name), ensure_iterable_and_not_string(elements)
     return_df = pd.concat([df]*len(elements), keys=elements, names=name).sort_index()